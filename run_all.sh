@@ -21,17 +21,18 @@ if [[ -n "${SAMPLE_URL}" ]]; then
   ./scripts/download_cern_sample.sh "${SAMPLE_URL}"
 fi
 
-# Find a sample in data/raw
-SAMPLE=$(ls data/raw/*.root 2>/dev/null | head -n1 || true)
-if [[ -z "${SAMPLE}" ]]; then
+# Find samples in data/raw (all of them; several files are processed in parallel)
+WORKERS=${WORKERS:-1}
+SAMPLES=( $(ls data/raw/*.root 2>/dev/null || true) )
+if [[ ${#SAMPLES[@]} -eq 0 ]]; then
   echo "No ROOT sample found in data/raw/. Place file or use download option."
   exit 1
 fi
-echo "[+] Using sample: ${SAMPLE}"
+echo "[+] Using ${#SAMPLES[@]} sample(s): ${SAMPLES[*]} (workers: ${WORKERS})"
 
 # 2) Preprocess per_particle (for analysis)
 echo "[2/6] Preprocessing (per_particle)..."
-conda run -n "${CONDA_ENV}" python src/data_preprocessing.py --input "${SAMPLE}" --mode per_particle --output results/preprocessed_particles.parquet --force
+conda run -n "${CONDA_ENV}" python src/data_preprocessing.py --input "${SAMPLES[@]}" --workers "${WORKERS}" --mode per_particle --output results/preprocessed_particles.parquet --force
 
 # 3) Analysis: compute angles
 echo "[3/6] Computing angles per event..."
@@ -3,8 +3,11 @@
 src/analysis.py
 
 Cálculo angular y métricas a partir de:
- - un fichero preprocesado por partícula (parquet/csv) o
- - directamente desde un ROOT (usando las ramas Muon_pt, Muon_eta, Muon_phi).
+ - un fichero preprocesado por partícula (parquet/csv),
+ - un fichero per_event_jagged (parquet con columnas lista mu_pt/mu_eta/mu_phi, leído sin reagrupar),
+ - un skim parquet de src/skim.py (columnas lista Muon_pt/Muon_eta/Muon_phi) o
+ - directamente desde un ROOT (usando las ramas Muon_pt, Muon_eta, Muon_phi); un .root.gz se descomprime
+   una sola vez en la caché de src/gz_cache.py y se reutiliza.
 
 Salida:
  - results/angles_summary.csv  (por evento: n_mu, n_pairs, min/mean/max angle en grados)
@@ -40,119 +43,253 @@ try:
 except Exception:
     uproot = None
 
+# optional import for Hive-partitioned Parquet directories (data_preprocessing.py --partition-by)
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as pads
+except Exception:
+    pa = pads = None
+
+try:  # executed as a script: python src/analysis.py
+    import array_cache
+    import coalesced_io
+    import column_cache
+    import dtype_policy
+    import gz_cache
+    import kinematics
+    import parallel_io
+    import pushdown
+    import schema_catalog
+    import selection
+    import sharding
+except ImportError:  # imported as src.analysis (tests, notebooks)
+    from src import array_cache
+    from src import coalesced_io
+    from src import column_cache
+    from src import dtype_policy
+    from src import gz_cache
+    from src import kinematics
+    from src import parallel_io
+    from src import pushdown
+    from src import schema_catalog
+    from src import selection
+    from src import sharding
+
+
+def partitioned_dataset(path):
+    """
+    pyarrow dataset of a Hive-partitioned output directory (partition columns restored from the paths).
+    The partition column keeps its dtype_policy width (run=1 is uint32, not the int32 pyarrow infers).
+    """
+    if pads is None:
+        raise RuntimeError("Reading partitioned Parquet directories requires pyarrow (pip install pyarrow).")
+    keys = {d.name.partition("=")[0] for d in Path(path).iterdir() if d.is_dir() and "=" in d.name}
+    dtypes = {k: dtype_policy.column_dtype(k) for k in keys}
+    if dtypes and all(dt is not None for dt in dtypes.values()):
+        schema = pa.schema([(k, pa.from_numpy_dtype(dt)) for k, dt in sorted(dtypes.items())])
+        return pads.dataset(str(path), format="parquet", partitioning=pads.partitioning(schema, flavor="hive"))
+    return pads.dataset(str(path), format="parquet", partitioning="hive")
+
+
+# unit vectors precomputed at ingest (data_preprocessing.py --cartesian): pair angles need only a dot product
+UNIT_COLUMNS = ["mu_ux", "mu_uy", "mu_uz"]
+
+# muon list columns of event-level Parquet tables: per_event_jagged (mu_pt, ...) and Parquet skims (Muon_pt, ...)
+JAGGED_PREFIXES = ("mu_", "Muon_")
+
+
+def _jagged_prefix(path):
+    """Prefix of the muon list columns of a Parquet file / partitioned directory, or None if it has none."""
+    if Path(path).is_dir():
+        schema = partitioned_dataset(path).schema
+        for prefix in JAGGED_PREFIXES:
+            if prefix + "pt" in schema.names and "list" in str(schema.field(prefix + "pt").type):
+                return prefix
+        return None
+    form = ak.metadata_from_parquet(str(path))["form"]
+    for prefix in JAGGED_PREFIXES:
+        if prefix + "pt" in form.fields and form.content(prefix + "pt").purelist_depth > 1:
+            return prefix
+    return None
+
+
+def is_jagged_table(path):
+    """True for a per_event_jagged or skim Parquet file or partitioned directory (muon pt stored as a list column)."""
+    if Path(path).suffix.lower() not in [".parquet", ".pq"]:
+        return False
+    return _jagged_prefix(path) is not None
+
+
+def read_preprocessed_event_table(path):
+    """
+    Read a per_event_jagged Parquet file (data_preprocessing.py --mode per_event_jagged) or a Parquet
+    skim (skim.py, Muon_pt/Muon_eta/Muon_phi) straight into awkward arrays with ak.from_parquet: the
+    list offsets are used as stored, nothing is regrouped.
+    """
+    prefix = _jagged_prefix(path)
+    kin = [prefix + v for v in ("pt", "eta", "phi")]
+    if Path(path).is_dir():
+        dataset = partitioned_dataset(path)
+        names = dataset.schema.names
+    else:
+        names = ak.metadata_from_parquet(str(path))["form"].fields
+    ids = [c for c in ("run", "luminosityBlock", "event") if c in names]
+    unit = UNIT_COLUMNS if all(c in names for c in UNIT_COLUMNS) else []
+    if Path(path).is_dir():
+        arr = ak.from_arrow(dataset.to_table(columns=ids + kin + unit))
+    else:
+        arr = ak.from_parquet(str(path), columns=ids + kin + unit)
+    n = len(arr)
+    if "event" not in ids:
+        raise RuntimeError(f"Event table {path} has no 'event' column.")
+    data = {
+        "run": dtype_policy.id_array("run", ak.to_numpy(arr["run"]) if "run" in ids else np.zeros(n)),
+        "luminosityBlock": dtype_policy.id_array(
+            "luminosityBlock", ak.to_numpy(arr["luminosityBlock"]) if "luminosityBlock" in ids else np.zeros(n)),
+        "event": dtype_policy.id_array("event", ak.to_numpy(arr["event"])),
+        "pt": arr[kin[0]],
+        "eta": arr[kin[1]],
+        "phi": arr[kin[2]],
+    }
+    data.update({c[3:]: arr[c] for c in unit})
+    return data
+
 
 def read_preprocessed_particle_table(path):
-    """Read a per-particle table (parquet or csv) and return awkward arrays grouped by event."""
+    """
+    Read a per-particle table (parquet or csv) and return awkward arrays grouped by event
+    (plus ux/uy/uz when the table has the precomputed mu_ux/mu_uy/mu_uz columns).
+    Column widths follow dtype_policy (float32 kinematics, uint32 run/lumi, uint64 event), also for CSV.
+    per_event_jagged Parquet files are delegated to read_preprocessed_event_table.
+    """
     p = Path(path)
     if not p.exists():
         raise FileNotFoundError(path)
-    if p.suffix.lower() in [".parquet", ".pq"]:
+    if is_jagged_table(p):
+        return read_preprocessed_event_table(p)
+    if p.is_dir():  # Hive-partitioned output (--partition-by)
+        df = partitioned_dataset(p).to_table().to_pandas()
+    elif p.suffix.lower() in [".parquet", ".pq"]:
         df = pd.read_parquet(p)
     else:
-        df = pd.read_csv(p)
+        header = pd.read_csv(p, nrows=0).columns
+        df = pd.read_csv(p, dtype=dtype_policy.csv_dtypes(header))
     # Expect columns: run, luminosityBlock, event, mu_pt, mu_eta, mu_phi
     required = {"run", "event", "mu_pt", "mu_eta", "mu_phi"}
     if not required.issubset(set(df.columns)):
         raise RuntimeError(f"Input table missing required columns. Found columns: {list(df.columns)}")
-    # group by event identifier to create jagged arrays
-    # keep run/lumi/event as identifiers per event
-    gb = df.groupby(["run", "luminosityBlock", "event"], sort=False)
-    runs = []
-    lumis = []
-    events = []
-    pts = []
-    etas = []
-    phis = []
-    for (r, l, e), sub in gb:
-        runs.append(int(r))
-        lumis.append(int(l))
-        events.append(int(e))
-        pts.append(sub["mu_pt"].to_numpy())
-        etas.append(sub["mu_eta"].to_numpy())
-        phis.append(sub["mu_phi"].to_numpy())
-    return {
-        "run": np.asarray(runs),
-        "luminosityBlock": np.asarray(lumis),
-        "event": np.asarray(events),
-        "pt": ak.Array(pts),
-        "eta": ak.Array(etas),
-        "phi": ak.Array(phis),
+    if "luminosityBlock" not in df.columns:
+        df["luminosityBlock"] = 0
+    # group by event identifier to create jagged arrays (order of first appearance, as groupby(sort=False))
+    # keep run/lumi/event as identifiers per event, in their native widths (no Python int round trip)
+    codes = df.groupby(["run", "luminosityBlock", "event"], sort=False).ngroup().to_numpy()
+    order = np.argsort(codes, kind="stable")
+    counts = np.bincount(codes, minlength=codes.max() + 1 if len(codes) else 0)
+    first = order[np.concatenate([[0], np.cumsum(counts)[:-1]])] if len(codes) else order
+
+    def ids(col):
+        return dtype_policy.id_array(col, df[col].to_numpy()[first])
+
+    def jagged(col):
+        return ak.unflatten(df[col].to_numpy()[order], counts)
+
+    data = {
+        "run": ids("run"),
+        "luminosityBlock": ids("luminosityBlock"),
+        "event": ids("event"),
+        "pt": jagged("mu_pt"),
+        "eta": jagged("mu_eta"),
+        "phi": jagged("mu_phi"),
     }
+    if all(c in df.columns for c in UNIT_COLUMNS):
+        data.update({c[3:]: jagged(c) for c in UNIT_COLUMNS})
+    return data
 
 
-def read_root_particles(root_path, entry_stop=None):
-    """Read muon branches from a ROOT file and return the same structure as read_preprocessed_particle_table."""
+def read_root_particles(root_path, entry_stop=None, entry_start=None, threads=1, executors=None, cuts=None,
+                        stats=None):
+    """
+    Read muon branches from a ROOT file and return the same structure as read_preprocessed_particle_table.
+    threads > 1 reads cluster-aligned entry ranges concurrently; executors: see parallel_io.make_executors.
+    cuts (selection.event_cuts): nMuon & co. are read first and the kinematics decoded only for the
+    passing events (pushdown.py); stats collects the pushdown counters.
+    """
     if uproot is None:
         raise RuntimeError("uproot is required to read ROOT files. Install with: pip install uproot")
-    f = uproot.open(root_path)
-    # detect tree
-    keys = list(f.keys())
-    tree_name = "Events" if "Events" in keys else keys[0]
-    tree = f[tree_name]
-    branches = list(tree.keys())
-    # detect common branch names
-    pt_b = "Muon_pt" if "Muon_pt" in branches else next((b for b in branches if "Muon" in b and "pt" in b.lower()), None)
-    eta_b = "Muon_eta" if "Muon_eta" in branches else next((b for b in branches if "Muon" in b and "eta" in b.lower()), None)
-    phi_b = "Muon_phi" if "Muon_phi" in branches else next((b for b in branches if "Muon" in b and "phi" in b.lower()), None)
+    root_path = str(gz_cache.local_path(root_path))  # .root.gz: cached decompressed copy
+    # tree name and branch aliases from the schema catalog (no branch-name rescan on later runs)
+    schema = schema_catalog.load_schema(root_path)
+    aliases = schema["aliases"]
+    pt_b, eta_b, phi_b = aliases["pt"], aliases["eta"], aliases["phi"]
     if not (pt_b and eta_b and phi_b):
         raise RuntimeError("Could not detect Muon_pt / Muon_eta / Muon_phi branches in ROOT file.")
     # identifiers
-    run_b = "run" if "run" in branches else None
-    lumi_b = "luminosityBlock" if "luminosityBlock" in branches else None
-    evt_b = "event" if "event" in branches else None
+    run_b = aliases["run"]
+    lumi_b = aliases["luminosityBlock"]
+    evt_b = aliases["event"]
+    tree = array_cache.open_tree(root_path, schema["tree"])  # reused across calls in one session
     # read
-    read_kwargs = {}
-    if entry_stop is not None:
-        read_kwargs["entry_stop"] = entry_stop
-    mu_pt = tree[pt_b].array(library="ak", **read_kwargs)
-    mu_eta = tree[eta_b].array(library="ak", **read_kwargs)
-    mu_phi = tree[phi_b].array(library="ak", **read_kwargs)
+    branches = [b for b in (pt_b, eta_b, phi_b, run_b, lumi_b, evt_b) if b]
+    entries = None
+    if cuts:
+        start, stop = sharding.entry_range(schema["num_entries"], entry_start, entry_stop)
+        arrs, entries = pushdown.read_selected_all(tree, branches, start, stop, cuts, schema["clusters"],
+                                                   parallel=threads, executors=executors, stats=stats)
+    elif threads > 1:
+        start, stop = sharding.entry_range(schema["num_entries"], entry_start, entry_stop)
+        arrs = parallel_io.read_concurrent(tree, branches, start, stop, threads, clusters=schema["clusters"],
+                                           executors=executors)
+    else:
+        start, stop = sharding.entry_range(schema["num_entries"], entry_start, entry_stop)
+        arrs = parallel_io.read_range(tree, branches, start, stop, executors)
+    mu_pt = arrs[pt_b]
+    mu_eta = arrs[eta_b]
+    mu_phi = arrs[phi_b]
     # ids
-    run = tree[run_b].array(library="ak", **read_kwargs) if run_b else ak.Array([0] * len(mu_pt))
-    lumi = tree[lumi_b].array(library="ak", **read_kwargs) if lumi_b else ak.Array([0] * len(mu_pt))
-    evt = tree[evt_b].array(library="ak", **read_kwargs) if evt_b else ak.Array(list(range(len(mu_pt))))
-    # convert ids to numpy per event (they are scalars per event)
+    run = arrs[run_b] if run_b else ak.Array([0] * len(mu_pt))
+    lumi = arrs[lumi_b] if lumi_b else ak.Array([0] * len(mu_pt))
+    if entries is None:
+        first = entry_start or 0
+        entries = np.arange(first, first + len(mu_pt))
+    evt = arrs[evt_b] if evt_b else ak.Array(entries)
+    # convert ids to numpy per event (they are scalars per event), native widths
     return {
-        "run": ak.to_numpy(run),
-        "luminosityBlock": ak.to_numpy(lumi),
-        "event": ak.to_numpy(evt),
+        "run": dtype_policy.id_array("run", ak.to_numpy(run)),
+        "luminosityBlock": dtype_policy.id_array("luminosityBlock", ak.to_numpy(lumi)),
+        "event": dtype_policy.id_array("event", ak.to_numpy(evt)),
         "pt": mu_pt,
         "eta": mu_eta,
         "phi": mu_phi,
     }
 
 
+def sample_events(data, fraction):
+    """Keep the events of a read_* result selected by selection.sample_mask (hash of run, luminosityBlock, event)."""
+    keep = selection.sample_mask(data["run"], data["luminosityBlock"], data["event"], fraction)
+    return {k: v[keep] for k, v in data.items()}
+
+
+def compute_angles_from_unit_vectors(ux, uy, uz):
+    """
+    Pairwise angles in degrees per event from jagged unit vectors (float64 mu_ux/mu_uy/mu_uz written by
+    data_preprocessing.py --cartesian): per pair only a dot product, a clip and arccos. Matches
+    compute_angles_from_pt_eta_phi for float64 vectors; float32 ones lose precision near 0° / 180°.
+    """
+    return kinematics.pair_angles(ux, uy, uz)
+
+
 def compute_angles_from_pt_eta_phi(pt, eta, phi):
     """
     Given jagged arrays pt, eta, phi (awkward arrays shape=(n_events, n_particles_event)),
-    compute pairwise angles in degrees per event and return jagged array of angles (deg).
+    compute pairwise angles in degrees per event and return jagged array of angles (deg, float64).
+    The unit vectors are computed once per particle (kinematics.unit_vectors), in float64 like the
+    per-pair dot product and arccos. pt only scales the momentum and cancels in the angle, except for
+    pt == 0: the direction is undefined and the pair's angle is NaN, as with the momentum-vector formula.
     """
-    # compute Cartesian components (px,py,pz)
-    px = pt * np.cos(phi)
-    py = pt * np.sin(phi)
-    pz = pt * np.sinh(eta)
-    p = ak.zip({"px": px, "py": py, "pz": pz})
-    # combinations of pairs per event
-    pairs = ak.combinations(p, 2, axis=1)
-    p0 = pairs["0"]
-    p1 = pairs["1"]
-    dot = p0["px"] * p1["px"] + p0["py"] * p1["py"] + p0["pz"] * p1["pz"]
-    norm0 = np.sqrt(p0["px"] ** 2 + p0["py"] ** 2 + p0["pz"] ** 2)
-    norm1 = np.sqrt(p1["px"] ** 2 + p1["py"] ** 2 + p1["pz"] ** 2)
-    cosang = dot / (norm0 * norm1)
-    # numerical safety: clip
-    cosang = ak.where(ak.is_none(cosang), 1.0, cosang)
-    cosang = ak.where(cosang < -1.0, -1.0, ak.where(cosang > 1.0, 1.0, cosang))
-    ang = np.degrees(np.arccos(cosang))
-    # Ensure a consistent jagged array (no union types): convert to Python lists per-event
-    try:
-        ang_list = ak.to_list(ang)
-    except Exception:
-        # fallback: coerce to numpy then to list
-        ang_list = [list(a) if hasattr(a, '__iter__') else [float(a)] for a in ang]
-    ang = ak.Array(ang_list)
-
-    return ang  # jagged array same shape as number of pairs per event
+    eta, phi = (ak.values_astype(x, dtype_policy.ACCUMULATOR) for x in (eta, phi))
+    angles = compute_angles_from_unit_vectors(*kinematics.unit_vectors(eta, phi))
+    moving = ak.combinations(pt != 0, 2, axis=1)
+    return ak.where(moving["0"] & moving["1"], angles, np.nan)
 
 
 def summarize_angles(angles_jagged):
@@ -160,11 +297,13 @@ def summarize_angles(angles_jagged):
     Given jagged array of angles per event, return numpy arrays:
     n_pairs, min_angle, mean_angle, max_angle (degrees). If no pairs, n_pairs=0 and stats=nan.
     """
-    n_pairs = ak.num(angles_jagged)
-    min_a = ak.where(n_pairs > 0, ak.min(angles_jagged, axis=1), ak.fill_none(ak.Array([np.nan] * len(n_pairs)), np.nan))
-    mean_a = ak.where(n_pairs > 0, ak.mean(angles_jagged, axis=1), ak.fill_none(ak.Array([np.nan] * len(n_pairs)), np.nan))
-    max_a = ak.where(n_pairs > 0, ak.max(angles_jagged, axis=1), ak.fill_none(ak.Array([np.nan] * len(n_pairs)), np.nan))
-    return ak.to_numpy(n_pairs), ak.to_numpy(min_a), ak.to_numpy(mean_a), ak.to_numpy(max_a)
+    n_pairs = ak.to_numpy(ak.num(angles_jagged, axis=1)).astype(dtype_policy.COUNT_DTYPE)
+    # min/max keep the angle width; the mean accumulates in float64
+    nan = np.full((), np.nan, dtype=ak.to_numpy(ak.flatten(angles_jagged, axis=1)).dtype)
+    min_a = ak.to_numpy(ak.fill_none(ak.min(angles_jagged, axis=1), nan))
+    mean_a = ak.to_numpy(ak.fill_none(ak.mean(angles_jagged, axis=1), np.nan)).astype(dtype_policy.ACCUMULATOR)
+    max_a = ak.to_numpy(ak.fill_none(ak.max(angles_jagged, axis=1), nan))
+    return n_pairs, min_a, mean_a, max_a
 
 
 def main():
@@ -172,8 +311,28 @@ def main():
     parser.add_argument("--input", "-i", required=True, help="Input file (parquet/csv for per-particle table, or ROOT file).")
     parser.add_argument("--input-format", "-f", choices=["auto", "parquet", "csv", "root"], default="auto",
                         help="Input format. 'auto' infers from extension.")
+    parser.add_argument("--entry-start", type=int, default=None, help="If reading ROOT, first entry to read (optional).")
     parser.add_argument("--entry-stop", type=int, default=None, help="If reading ROOT, limit entries (optional).")
+    parser.add_argument("--shard", default=None,
+                        help="If reading ROOT, process only shard i/N (0-based) aligned to cluster boundaries; "
+                             "combine the N outputs with src/merge_shards.py")
     parser.add_argument("--output", "-o", default="results/angles_summary.csv", help="Output CSV path for per-event summary.")
+    parser.add_argument("--config", default=None, help="Selection/IO config (default: config/selection.yaml if present)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="If reading ROOT: reader threads (default: io.threads in the config, else 1)")
+    parser.add_argument("--decompression-threads", type=int, default=None, help="uproot decompression executor size (default: --threads)")
+    parser.add_argument("--interpretation-threads", type=int, default=None, help="uproot interpretation executor size (default: --threads)")
+    parser.add_argument("--column-cache", action=argparse.BooleanOptionalAction, default=None,
+                        help="Serve decoded branches from the on-disk column cache (src/column_cache.py) and fill it "
+                             "(default: cache.columns in the config)")
+    parser.add_argument("--select", action="store_true",
+                        help="If reading ROOT: keep only events passing the event-level cuts of the config "
+                             "(e.g. muon_selection.min_n_muons); nMuon is read first and the kinematics decoded "
+                             "only where events pass")
+    parser.add_argument("--sample-fraction", type=float, default=None,
+                        help="Keep this fraction of events by a stable hash of (run, luminosityBlock, event) "
+                             "(default: global.sample_fraction in the config, 1.0 = all); per-event sampling, so at "
+                             "low fractions nearly every cluster is still read")
     parser.add_argument("--pairs-output", default=None, help="Optional output parquet path to save per-pair rows (can be large).")
     args = parser.parse_args()
 
@@ -187,16 +346,77 @@ def main():
             infmt = "parquet"
         elif inp.suffix.lower() in [".csv", ".txt"]:
             infmt = "csv"
-        elif inp.suffix.lower() in [".root", ".root.gz"]:
+        elif inp.suffix.lower() == ".root" or inp.name.lower().endswith(".root.gz"):
             infmt = "root"
         else:
             raise SystemExit("Could not infer input format. Use --input-format explicitly.")
 
     print("Input:", inp, "format:", infmt)
+    shard = None
+    entry_range = None
+    cuts = None
+    stats = None
+    io = None
+    try:
+        config = selection.load_config(args.config)
+    except (FileNotFoundError, RuntimeError) as e:
+        raise SystemExit(f"Could not load config: {e}")
+    column_cache.configure_from(config, args.column_cache)
+    array_cache.configure_from(config)
+    coalesced_io.configure(config)
+    gz_cache.configure_from(config)
+    try:
+        sample_fraction = selection.resolve_sample_fraction(args.sample_fraction, config)
+    except ValueError as e:
+        raise SystemExit(str(e))
     if infmt in ("parquet", "csv"):
+        if args.shard or args.select:
+            raise SystemExit("--shard / --select apply to ROOT input only.")
         data = read_preprocessed_particle_table(str(inp))
+        if sample_fraction < 1:
+            # same hash as at read time: a table preprocessed with this fraction is kept whole
+            data = sample_events(data, sample_fraction)
     elif infmt == "root":
-        data = read_root_particles(str(inp), entry_stop=args.entry_stop)
+        # .root.gz: uproot cannot seek in gzip; read the cached decompressed copy (made once per gz hash)
+        root_path = str(gz_cache.local_path(inp))
+        if root_path != str(inp):
+            print("Decompressed copy:", root_path)
+        entry_start, entry_stop = args.entry_start, args.entry_stop
+        if args.shard:
+            try:
+                shard = sharding.parse_shard(args.shard)
+            except ValueError as e:
+                raise SystemExit(str(e))
+            schema = schema_catalog.load_schema(root_path)
+            entry_start, entry_stop = sharding.shard_range(schema["clusters"], schema["num_entries"], *shard,
+                                                           entry_start=entry_start, entry_stop=entry_stop)
+            print(f"Shard {shard[0]}/{shard[1]}: entries [{entry_start}, {entry_stop})")
+        entry_range = [entry_start, entry_stop]
+        if args.select or sample_fraction < 1:
+            schema = schema_catalog.load_schema(root_path)
+            try:
+                cuts = selection.event_cuts(config, schema["aliases"], schema["branches"]) if args.select else []
+                sample = selection.sample_cut(sample_fraction, schema["aliases"], schema["branches"])
+            except RuntimeError as e:
+                raise SystemExit(str(e))
+            cuts = cuts + [sample] if sample else cuts
+            stats = pushdown.new_stats()
+        threads = parallel_io.resolve_threads(args.threads, config)
+        executors = parallel_io.make_executors(
+            threads,
+            parallel_io.resolve_threads(args.decompression_threads, config, "decompression_threads"),
+            parallel_io.resolve_threads(args.interpretation_threads, config, "interpretation_threads"),
+        )
+        tree = array_cache.open_tree(root_path, schema_catalog.load_schema(root_path)["tree"])
+        io_before = coalesced_io.io_stats(tree)
+        try:
+            data = read_root_particles(root_path, entry_stop=entry_stop, entry_start=entry_start,
+                                       threads=threads, executors=executors, cuts=cuts, stats=stats)
+        finally:
+            parallel_io.shutdown_executors(executors)
+        io = coalesced_io.stats_delta(io_before, coalesced_io.io_stats(tree))
+        print(f"I/O: {io['requests']} requests, {io['basket_ranges']} basket ranges, {io['reads']} reads, "
+              f"{io['bytes_read'] / 2**20:.1f} MB read")
     else:
         raise SystemExit("Unsupported format")
 
@@ -208,7 +428,11 @@ def main():
     phi = data["phi"]
 
     print("Computing pairwise angles (deg)...")
-    angles = compute_angles_from_pt_eta_phi(pt, eta, phi)
+    # stored unit vectors only when float64: older float32 tables would shift nearly collinear pairs
+    if "ux" in data and all(str(data[c].type).endswith("float64") for c in ("ux", "uy", "uz")):
+        angles = compute_angles_from_unit_vectors(data["ux"], data["uy"], data["uz"])
+    else:
+        angles = compute_angles_from_pt_eta_phi(pt, eta, phi)
 
     print("Summarizing angles per event...")
     n_pairs, min_angle, mean_angle, max_angle = summarize_angles(angles)
@@ -218,7 +442,7 @@ def main():
         "run": np.asarray(runs),
         "luminosityBlock": np.asarray(lumis),
         "event": np.asarray(events),
-        "n_mu": ak.to_numpy(ak.num(pt)),
+        "n_mu": ak.to_numpy(ak.num(pt, axis=1)).astype(dtype_policy.COUNT_DTYPE),
         "n_pairs": n_pairs,
         "min_angle_deg": min_angle,
         "mean_angle_deg": mean_angle,
@@ -235,15 +459,14 @@ def main():
         print("Writing per-pair table (may be large) to:", args.pairs_output)
         # flatten pairs into rows: run, lumi, event, angle_deg, px0,py0,pz0, px1,py1,pz1 (optional)
         # We'll construct minimal table: run,lumi,event,angle_deg
-        run_rep = ak.repeat(runs, ak.num(angles))
-        lumi_rep = ak.repeat(lumis, ak.num(angles))
-        evt_rep = ak.repeat(events, ak.num(angles))
+        # per-event ids repeated by the number of pairs (offsets-based, no Python lists)
+        pair_counts = ak.to_numpy(n_pairs)
         # angles is jagged array of floats
         angle_flat = ak.flatten(angles)
         pair_df = pd.DataFrame({
-            "run": ak.to_numpy(run_rep),
-            "luminosityBlock": ak.to_numpy(lumi_rep),
-            "event": ak.to_numpy(evt_rep),
+            "run": np.repeat(np.asarray(runs), pair_counts),
+            "luminosityBlock": np.repeat(np.asarray(lumis), pair_counts),
+            "event": np.repeat(np.asarray(events), pair_counts),
             "angle_deg": ak.to_numpy(angle_flat),
         })
         pair_out = Path(args.pairs_output)
@@ -259,6 +482,16 @@ def main():
         "output": str(outp),
         "pairs_output": str(args.pairs_output) if args.pairs_output else None,
     }
+    if entry_range is not None:
+        prov["entry_range"] = entry_range
+    if shard is not None:
+        prov["shard"] = {"index": shard[0], "count": shard[1]}
+    if cuts:
+        prov["selection"] = dict(stats, cuts=cuts)
+    if io is not None:
+        prov["io"] = io
+    if sample_fraction < 1:
+        prov["sample_fraction"] = sample_fraction
     prov_path = outp.with_suffix(outp.suffix + ".provenance.json")
     with open(prov_path, "w") as fh:
         json.dump(prov, fh, indent=2)
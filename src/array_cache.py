@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+src/array_cache.py
+
+In-process LRU cache of decoded arrays, for notebooks and repeated library calls in one Python session.
+
+ - read_range: parallel_io.read_range consults it first (then the on-disk column cache, then the
+   ROOT file). Key: (file path, inode, size, mtime_ns, tree, branch, entry range, library), so a
+   rewritten file never serves stale arrays. A repeated read of the same branches and range returns
+   the cached awkward/NumPy objects without touching the file.
+ - open_tree: open uproot trees are kept per (file, tree), so read_root_particles and the notebooks
+   do not reopen the file on every call.
+
+The memory budget (default 512 MB; 0 disables the cache) bounds the decoded bytes held; least
+recently used arrays are dropped first. The batch CLIs (data_preprocessing.py, analysis.py, skim.py)
+read every chunk once, so they keep the cache off unless cache.memory_mb is set in
+config/selection.yaml: peak memory stays bounded by the chunk size, not by the file. Cached NumPy arrays are
+marked read-only (callers share them).
+
+Notebook use:
+  from src import array_cache
+  array_cache.configure(max_mb=2048)
+  array_cache.stats()    # hits, misses, evictions, bytes held
+  array_cache.clear()
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:  # executed as a script from src/
+    import coalesced_io
+    import digest_cache
+except ImportError:  # imported as src.array_cache
+    from src import coalesced_io
+    from src import digest_cache
+
+DEFAULT_MAX_MB = 512
+MAX_OPEN_TREES = 16
+
+
+def _nbytes(arr):
+    return int(getattr(arr, "nbytes", 0))
+
+
+class ArrayCache:
+    """Thread-safe LRU mapping key -> array, bounded by the total nbytes of the arrays held."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = int(max_bytes)
+        self._items = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return item[0]
+
+    def put(self, key, arr):
+        size = _nbytes(arr)
+        if size > self.max_bytes:
+            return
+        if isinstance(arr, np.ndarray):
+            arr.flags.writeable = False
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._items[key] = (arr, size)
+            self._bytes += size
+            self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes and self._items:
+            _, (_, size) = self._items.popitem(last=False)
+            self._bytes -= size
+            self.evictions += 1
+
+    def resize(self, max_bytes):
+        with self._lock:
+            self.max_bytes = int(max_bytes)
+            self._evict()
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._items), "bytes": self._bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions}
+
+
+CACHE = ArrayCache(float(os.environ.get("HGRF_ARRAY_CACHE_MB", DEFAULT_MAX_MB)) * 2**20)
+_TREES = OrderedDict()
+_TREES_LOCK = threading.Lock()
+
+
+def configure(max_mb=DEFAULT_MAX_MB):
+    """Set the memory budget in MB (0 disables the cache and drops what it holds; also exported to worker processes)."""
+    CACHE.resize(float(max_mb) * 2**20)
+    os.environ["HGRF_ARRAY_CACHE_MB"] = str(max_mb)
+    if not max_mb:
+        CACHE.clear()
+
+
+def configure_from(config=None, default=0):
+    """Budget from cache.memory_mb of the config; default (off) when it is not set, as in single-pass CLI runs."""
+    value = ((config or {}).get("cache") or {}).get("memory_mb")
+    configure(default if value is None else value)
+
+
+def enabled():
+    return CACHE.max_bytes > 0
+
+
+def stats():
+    return CACHE.stats()
+
+
+def clear():
+    """Drop all cached arrays and open trees."""
+    CACHE.clear()
+    with _TREES_LOCK:
+        _TREES.clear()
+
+
+def _file_key(tree):
+    path = getattr(tree.file, "file_path", None)
+    if not path or not os.path.isfile(path):
+        return None
+    return digest_cache.stat_key(path) + (tree.object_path,)
+
+
+def read_range(tree, branches, start, stop, reader, executors=None, library="ak"):
+    """
+    Cached variant of parallel_io.read_range: branches held in memory are returned as they are, the
+    others are read in one reader(tree, missing, start, stop, executors, library) call and kept.
+    """
+    fkey = _file_key(tree)
+    if fkey is None:
+        return reader(tree, branches, start, stop, executors, library)
+    out = {}
+    for b in branches:
+        arr = CACHE.get(fkey + (b, start, stop, library))
+        if arr is not None:
+            out[b] = arr
+    missing = [b for b in branches if b not in out]
+    if missing:
+        arrs = reader(tree, missing, start, stop, executors, library)
+        for b in missing:
+            out[b] = arrs[b]
+            CACHE.put(fkey + (b, start, stop, library), arrs[b])
+    return {b: out[b] for b in branches}
+
+
+def open_tree(path, tree_name):
+    """uproot TTree of a local file, opened once per (file state, tree) and reused."""
+    try:
+        key = digest_cache.stat_key(path) + (tree_name,)
+    except OSError:
+        return coalesced_io.open_tree(path, tree_name)
+    with _TREES_LOCK:
+        tree = _TREES.get(key)
+        if tree is not None:
+            _TREES.move_to_end(key)
+            return tree
+    tree = coalesced_io.open_tree(path, tree_name)
+    with _TREES_LOCK:
+        _TREES[key] = tree
+        while len(_TREES) > MAX_OPEN_TREES:
+            _TREES.popitem(last=False)
+    return tree
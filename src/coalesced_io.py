@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+src/coalesced_io.py
+
+Lecturas agrupadas (coalesced) de ficheros ROOT y contadores de I/O por ejecución.
+
+Todas las ramas necesarias de un rango de entradas se piden en una sola llamada tree.arrays
+(parallel_io.read_range), es decir, una sola petición con todos los baskets. La fuente de uproot
+(FSSpecSource) ordena esos rangos de bytes por offset y junta los que están a menos de
+io.coalesce_gap_kb en lecturas grandes (hasta io.coalesce_max_request_mb por petición), en lugar de
+una lectura pequeña por basket y rama.
+
+CountingSource cuenta lo que llega realmente al sistema de ficheros:
+ - requests: peticiones de uproot (una por tree.arrays / TBranch.array)
+ - basket_ranges / bytes_requested: rangos de bytes pedidos (baskets y metadatos) y su tamaño
+ - reads / bytes_read: lecturas tras agrupar (≈ syscalls de lectura) y bytes leídos de disco / red
+io_stats(tree) da esos contadores; data_preprocessing.py y skim.py los guardan en la provenance ("io").
+"""
+try:
+    import uproot
+    from uproot.source.coalesce import CoalesceConfig
+    from uproot.source.fsspec import FSSpecSource
+except Exception:
+    uproot = None
+    CoalesceConfig = None
+    FSSpecSource = object
+
+DEFAULT_GAP_KB = 64
+DEFAULT_MAX_REQUEST_MB = 64
+
+
+def coalesce_config(config=None):
+    """uproot CoalesceConfig from io.coalesce_gap_kb / io.coalesce_max_request_mb of the config."""
+    io = (config or {}).get("io") or {}
+    gap_kb = io.get("coalesce_gap_kb")
+    max_mb = io.get("coalesce_max_request_mb")
+    return CoalesceConfig(
+        max_range_gap=int((DEFAULT_GAP_KB if gap_kb is None else gap_kb) * 1024),
+        max_request_bytes=int((max_mb or DEFAULT_MAX_REQUEST_MB) * 2**20),
+    )
+
+
+_SETTINGS = {"config": None}
+
+
+def configure(config=None):
+    """Coalescing settings used by open_file for the rest of the process."""
+    _SETTINGS["config"] = config
+
+
+class _CountingFS:
+    """fsspec filesystem proxy counting the byte ranges that reach it (one per coalesced read)."""
+
+    def __init__(self, fs, counters):
+        self._fs = fs
+        self._counters = counters
+
+    def __getattr__(self, name):
+        return getattr(self._fs, name)
+
+    def _count(self, starts, ends):
+        self._counters["reads"] += len(starts)
+        self._counters["bytes_read"] += sum(e - s for s, e in zip(starts, ends))
+
+    def cat_ranges(self, paths, starts, ends, **kwargs):
+        self._count(starts, ends)
+        return self._fs.cat_ranges(paths=paths, starts=starts, ends=ends, **kwargs)
+
+    async def _cat_ranges(self, paths, starts, ends, **kwargs):
+        self._count(starts, ends)
+        return await self._fs._cat_ranges(paths=paths, starts=starts, ends=ends, **kwargs)
+
+    def cat_file(self, path, start=None, end=None, **kwargs):
+        if start is not None and end is not None:
+            self._count([start], [end])
+        return self._fs.cat_file(path, start=start, end=end, **kwargs)
+
+
+class CountingSource(FSSpecSource):
+    """uproot FSSpecSource (read coalescing via cat_ranges) that counts coalesced reads and bytes read."""
+
+    def __init__(self, file_path, **options):
+        self.counters = {"reads": 0, "bytes_read": 0}
+        super().__init__(file_path, **options)
+
+    def _open(self):
+        super()._open()
+        if not hasattr(self, "counters"):
+            self.counters = {"reads": 0, "bytes_read": 0}
+        self._fs = _CountingFS(self._fs, self.counters)
+
+
+def open_file(path, config=None):
+    """uproot.open with the counting, coalescing source (config: io block settings, default: configure())."""
+    if uproot is None:
+        raise RuntimeError("uproot is required to read ROOT files. Install with: pip install uproot")
+    cfg = coalesce_config(config if config is not None else _SETTINGS["config"])
+    return uproot.open(str(path), handler=CountingSource, coalesce_config=cfg)
+
+
+def open_tree(path, tree_name, config=None):
+    return open_file(path, config)[tree_name]
+
+
+def io_stats(tree):
+    """I/O counters of the file behind a tree (cumulative since it was opened)."""
+    source = tree.file.source
+    counters = getattr(source, "counters", {})
+    return {
+        "requests": source.num_requests,
+        "basket_ranges": source.num_requested_chunks,
+        "bytes_requested": source.num_requested_bytes,
+        "reads": counters.get("reads"),
+        "bytes_read": counters.get("bytes_read"),
+    }
+
+
+def stats_delta(before, after):
+    """Counters of one run: after - before (None stays None for sources that do not count reads)."""
+    return {k: (after[k] - before[k] if after[k] is not None and before[k] is not None else after[k]) for k in after}
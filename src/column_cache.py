@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+src/column_cache.py
+
+On-disk cache of decoded ROOT branches, keyed by (file SHA-256, tree, branch, entry range).
+
+Every read of parallel_io.read_range (data_preprocessing.py, analysis.py, skim.py, notebooks) goes
+through the cache when it is enabled: branches already decoded for that range are served with
+np.load(mmap_mode='r') (no decompression, pages loaded on demand) and only the missing ones are
+read from the ROOT file, then stored. Entry ranges come from the cluster-aligned chunk plan, so
+repeated runs over the same file hit the same keys. The file hash is never computed in the read
+path: on the first run over a file, ranges read before its background hash finishes are not cached.
+
+ - flat numeric branches (run, event, nMuon, HLT_*): data.npy
+ - jagged numeric branches (Muon_pt, Muon_tightId, ...): offsets.npy + content.npy
+ - anything else (strings, nested records) is read through, not cached
+
+Entries: <cache dir>/columns/<sha256>/<tree>/<branch>/<start>-<stop>/ (cache dir: $HGRF_CACHE_DIR,
+default .hgrf_cache). The total size is capped (cache.columns_max_mb in config/selection.yaml);
+least recently used entries are evicted first (a hit refreshes the entry's meta.json mtime).
+
+Activation: --column-cache in the scripts, cache.columns: true in the config, or configure() from
+a notebook.
+
+Usage:
+  python src/column_cache.py info                      # entries, size and cap, per input file
+  python src/column_cache.py list --file data/raw/sample.root
+  python src/column_cache.py clear [--file data/raw/sample.root]
+  python src/column_cache.py trim --max-mb 500         # evict LRU entries down to 500 MB
+"""
+import argparse
+import json
+import os
+import shutil
+import threading
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import awkward as ak
+except Exception:
+    ak = None
+
+try:  # executed as a script: python src/column_cache.py
+    import digest_cache
+    import gz_cache
+except ImportError:  # imported as src.column_cache
+    from src import digest_cache
+    from src import gz_cache
+
+CACHE_DIR = Path(os.environ.get("HGRF_CACHE_DIR", ".hgrf_cache"))
+DEFAULT_MAX_MB = 2048
+META_NAME = "meta.json"
+
+# process-wide switch; exported through the environment so process-pool workers inherit it
+_STATE = {
+    "enabled": os.environ.get("HGRF_COLUMN_CACHE", "0") == "1",
+    "max_bytes": int(float(os.environ.get("HGRF_COLUMN_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 2**20),
+}
+_LOCK = threading.Lock()
+_STATS = {"hits": 0, "misses": 0, "bytes_served": 0, "bytes_stored": 0, "evicted": 0}
+
+
+def column_dir(cache_dir=None):
+    return Path(cache_dir or CACHE_DIR) / "columns"
+
+
+def configure(enabled=True, max_mb=None):
+    """Switch the cache on/off for this process (and its worker processes); max_mb: size cap."""
+    _STATE["enabled"] = bool(enabled)
+    os.environ["HGRF_COLUMN_CACHE"] = "1" if enabled else "0"
+    if max_mb is not None:
+        _STATE["max_bytes"] = int(float(max_mb) * 2**20)
+        os.environ["HGRF_COLUMN_CACHE_MAX_MB"] = str(max_mb)
+
+
+def configure_from(config=None, cli_value=None):
+    """--column-cache / --no-column-cache if given, else cache.columns / cache.columns_max_mb of the config."""
+    block = (config or {}).get("cache") or {}
+    enabled = cli_value if cli_value is not None else bool(block.get("columns"))
+    configure(enabled, block.get("columns_max_mb") or DEFAULT_MAX_MB)
+
+
+def enabled():
+    return _STATE["enabled"]
+
+
+def stats():
+    """Hit/miss counters of this process."""
+    return dict(_STATS)
+
+
+def _safe(name):
+    return str(name).strip("/").replace("/", "__")
+
+
+def tree_key(tree):
+    """
+    (sha256, tree name) of an uproot TTree read from a local file, or None (remote / unknown file, or
+    digest not known yet). The digest is never computed here: it comes from the digest cache or from the
+    background hash the stages start on open (digest_cache.sha256_in_background, shared while in flight);
+    until it resolves, ranges are read through uncached instead of waiting for a full-file hash.
+    A decompressed .root.gz copy is keyed by the .gz digest it is named after (no second hash).
+    """
+    path = getattr(tree.file, "file_path", None)
+    if not path or not os.path.isfile(path):
+        return None
+    tree_name = tree.object_path.strip("/").split(";")[0]
+    source = gz_cache.source_digest(path)
+    if source is not None:
+        return source, tree_name
+    digest = digest_cache.sha256_in_background(path)
+    if not digest.done() or digest.exception() is not None:
+        return None
+    return digest.result(), tree_name
+
+
+def entry_path(key, branch, start, stop, cache_dir=None):
+    sha256, tree_name = key
+    return column_dir(cache_dir) / sha256 / _safe(tree_name) / _safe(branch) / f"{start}-{stop}"
+
+
+def _encode(arr):
+    """{file stem: ndarray} and kind for a cacheable branch array, or (None, None)."""
+    if isinstance(arr, np.ndarray):
+        return ({"data": arr}, "flat") if arr.dtype.kind in "biuf" and arr.ndim == 1 else (None, None)
+    if ak is None or not isinstance(arr, ak.Array):
+        return None, None
+    layout = ak.to_layout(arr)
+    if isinstance(layout, ak.contents.NumpyArray) and layout.data.ndim == 1 and layout.data.dtype.kind in "biuf":
+        return {"data": np.asarray(layout.data)}, "flat"
+    if layout.is_list and not layout.parameters:
+        packed = ak.to_layout(ak.to_packed(arr))
+        content = packed.content
+        if (isinstance(packed, ak.contents.ListOffsetArray) and isinstance(content, ak.contents.NumpyArray)
+                and not content.parameters and content.data.ndim == 1 and content.data.dtype.kind in "biuf"):
+            return {"offsets": np.asarray(packed.offsets), "content": np.asarray(content.data)}, "jagged"
+    return None, None
+
+
+_INDEX = {np.dtype(np.int32): "Index32", np.dtype(np.uint32): "IndexU32", np.dtype(np.int64): "Index64"}
+
+
+def _decode(files, kind, library):
+    if kind == "flat":
+        return files["data"] if library == "np" else ak.Array(ak.contents.NumpyArray(files["data"]))
+    if library == "np":
+        return None  # uproot's library="np" object arrays are not rebuilt from the cache
+    index = getattr(ak.index, _INDEX[files["offsets"].dtype])(files["offsets"])
+    return ak.Array(ak.contents.ListOffsetArray(index, ak.contents.NumpyArray(files["content"])))
+
+
+def load(key, branch, start, stop, library="ak", cache_dir=None):
+    """Cached branch array for the entry range (memory-mapped), or None on a miss."""
+    d = entry_path(key, branch, start, stop, cache_dir)
+    try:
+        meta = json.loads((d / META_NAME).read_text())
+        files = {stem: np.load(d / f"{stem}.npy", mmap_mode="r") for stem in meta["files"]}
+    except (OSError, ValueError, KeyError):
+        return None
+    arr = _decode(files, meta["kind"], library)
+    if arr is None:
+        return None
+    try:
+        os.utime(d / META_NAME)  # LRU: most recently used
+    except OSError:
+        pass
+    return arr
+
+
+def store(key, branch, start, stop, arr, source=None, cache_dir=None):
+    """Write one decoded branch array; returns the bytes stored (0 if not cacheable or too large)."""
+    files, kind = _encode(arr)
+    if files is None:
+        return 0
+    nbytes = sum(a.nbytes for a in files.values())
+    if nbytes > _STATE["max_bytes"]:
+        return 0
+    d = entry_path(key, branch, start, stop, cache_dir)
+    if (d / META_NAME).exists():
+        return 0
+    tmp = d.with_name(f"{d.name}.tmp{os.getpid()}.{threading.get_ident()}")
+    try:
+        tmp.mkdir(parents=True, exist_ok=True)
+        for stem, a in files.items():
+            np.save(tmp / f"{stem}.npy", np.ascontiguousarray(a))
+        meta = {"sha256": key[0], "tree": key[1], "branch": branch, "entry_range": [start, stop], "kind": kind,
+                "dtype": str(files.get("content", files.get("data")).dtype), "files": list(files), "nbytes": nbytes,
+                "source": source}
+        (tmp / META_NAME).write_text(json.dumps(meta))
+        os.replace(tmp, d)
+    except OSError:
+        shutil.rmtree(tmp, ignore_errors=True)  # read-only cache dir or a concurrent writer won
+        return 0
+    return nbytes
+
+
+def entries(cache_dir=None):
+    """[(meta dict, entry dir, bytes on disk, last use), ...] of all cache entries."""
+    out = []
+    for meta_path in column_dir(cache_dir).glob(f"*/*/*/*/{META_NAME}"):
+        try:
+            meta = json.loads(meta_path.read_text())
+            d = meta_path.parent
+            size = sum(f.stat().st_size for f in d.iterdir())
+            out.append((meta, d, size, meta_path.stat().st_mtime))
+        except (OSError, ValueError):
+            continue
+    return out
+
+
+def _remove(d):
+    shutil.rmtree(d, ignore_errors=True)
+    for parent in (d.parent, d.parent.parent, d.parent.parent.parent):
+        try:
+            parent.rmdir()  # only succeeds when empty
+        except OSError:
+            break
+
+
+def trim(max_bytes=None, cache_dir=None):
+    """Evict least recently used entries until the cache fits in max_bytes; returns the number evicted."""
+    max_bytes = _STATE["max_bytes"] if max_bytes is None else max_bytes
+    found = sorted(entries(cache_dir), key=lambda e: e[3])
+    total = sum(e[2] for e in found)
+    evicted = 0
+    for _, d, size, _ in found:
+        if total <= max_bytes:
+            break
+        _remove(d)
+        total -= size
+        evicted += 1
+    return evicted
+
+
+def clear(sha256=None, cache_dir=None):
+    """Remove all entries (or those of one file hash); returns the number removed."""
+    found = [e for e in entries(cache_dir) if sha256 is None or e[0]["sha256"] == sha256]
+    for _, d, _, _ in found:
+        _remove(d)
+    return len(found)
+
+
+def read_range(tree, branches, start, stop, reader, executors=None, library="ak"):
+    """
+    Cached variant of parallel_io.read_range: cached branches are memory-mapped, the others are read
+    in one reader(tree, missing, start, stop, executors, library) call and stored.
+    """
+    key = tree_key(tree)
+    if key is None:
+        return reader(tree, branches, start, stop, executors, library)
+    out = {}
+    for b in branches:
+        arr = load(key, b, start, stop, library)
+        if arr is not None:
+            out[b] = arr
+    missing = [b for b in branches if b not in out]
+    with _LOCK:
+        _STATS["hits"] += len(out)
+        _STATS["misses"] += len(missing)
+        _STATS["bytes_served"] += sum(getattr(a, "nbytes", 0) for a in out.values())
+    if missing:
+        arrs = reader(tree, missing, start, stop, executors, library)
+        stored = 0
+        for b in missing:
+            out[b] = arrs[b]
+            stored += store(key, b, start, stop, arrs[b], source=tree.file.file_path)
+        if stored:
+            with _LOCK:
+                _STATS["bytes_stored"] += stored
+                if _STATE.get("size") is None:
+                    _STATE["size"] = sum(e[2] for e in entries())  # disk scan once per process
+                else:
+                    _STATE["size"] += stored
+                over = _STATE["size"] > _STATE["max_bytes"]
+            if over:
+                evicted = trim()
+                with _LOCK:
+                    _STATS["evicted"] += evicted
+                    _STATE["size"] = sum(e[2] for e in entries())
+    return {b: out[b] for b in branches}
+
+
+def _sha_of(file_arg):
+    return file_arg if (len(file_arg) == 64 and not os.path.exists(file_arg)) else digest_cache.cached_sha256(file_arg)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or clear the on-disk decoded column cache.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("info", help="Entries and size, per input file")
+    p_list = sub.add_parser("list", help="One line per cached branch / entry range")
+    p_list.add_argument("--file", default=None, help="Only entries of this ROOT file (path or SHA-256)")
+    p_clear = sub.add_parser("clear", help="Remove cached entries")
+    p_clear.add_argument("--file", default=None, help="Only entries of this ROOT file (path or SHA-256)")
+    p_trim = sub.add_parser("trim", help="Evict least recently used entries down to a size")
+    p_trim.add_argument("--max-mb", type=float, default=DEFAULT_MAX_MB)
+    args = parser.parse_args()
+
+    if args.command == "clear":
+        n = clear(_sha_of(args.file) if args.file else None)
+        print(f"Removed {n} entries from {column_dir()}")
+        return
+    if args.command == "trim":
+        n = trim(int(args.max_mb * 2**20))
+        print(f"Evicted {n} entries; cache size now {sum(e[2] for e in entries()) / 2**20:.1f} MB")
+        return
+
+    found = entries()
+    if args.command == "list":
+        sha256 = _sha_of(args.file) if args.file else None
+        for meta, _, size, _ in sorted(found, key=lambda e: (e[0]["sha256"], e[0]["branch"], e[0]["entry_range"])):
+            if sha256 is None or meta["sha256"] == sha256:
+                a, b = meta["entry_range"]
+                print(f"{meta['sha256'][:12]}  {meta['tree']}/{meta['branch']}  [{a}, {b})  {meta['kind']} {meta['dtype']}  {size / 2**20:.2f} MB")
+        return
+    total = sum(e[2] for e in found)
+    print("Cache dir:", column_dir())
+    print(f"Entries: {len(found)}  size: {total / 2**20:.1f} MB  cap: {_STATE['max_bytes'] / 2**20:.0f} MB")
+    per_file = {}
+    for meta, _, size, _ in found:
+        info = per_file.setdefault(meta["sha256"], {"source": meta.get("source"), "entries": 0, "bytes": 0, "branches": set()})
+        info["entries"] += 1
+        info["bytes"] += size
+        info["branches"].add(meta["branch"])
+    for sha256, info in sorted(per_file.items(), key=lambda kv: -kv[1]["bytes"]):
+        print(f"  {sha256[:12]}  {info['source']}  {len(info['branches'])} branches  {info['entries']} entries  "
+              f"{info['bytes'] / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
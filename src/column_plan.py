@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""
+src/column_plan.py
+
+Grafo declarativo columna de salida -> entradas lógicas (alias de schema_catalog.resolve_aliases)
+para las tablas de muones del preprocesado (per_event, per_particle, per_event_jagged, counts).
+
+ - Solo se calculan las columnas pedidas (--columns en data_preprocessing.py) y solo se decodifican
+   las ramas que esas columnas necesitan: per_event con mean/min/max_mu_pt lee Muon_pt, no eta/phi;
+   n_mu sola lee nMuon (escalar) en lugar de la colección.
+ - Una columna puede tener alternativas (n_mu: nMuon o Muon_pt); se elige la que no añade ramas
+   nuevas al plan, si no la primera disponible.
+ - mu_px, mu_py, mu_pz, mu_p y el vector unitario mu_ux, mu_uy, mu_uz (kinematics.py) se calculan
+   en la ingesta solo si se piden (--cartesian o --columns).
+ - run / luminosityBlock / event pueden faltar en el fichero (se rellenan con ceros / número de entrada).
+
+describe(plan, tree, ...) da el plan de lectura (ramas, bytes comprimidos y descomprimidos, baskets)
+sin decodificar nada: data_preprocessing.py --dry-run lo imprime para estimar el coste de I/O.
+"""
+# output column -> alternative input sets (alias keys); the first satisfiable alternative that adds
+# no new branch wins, else the first satisfiable one
+COLUMN_GRAPH = {
+    "per_event": {
+        "run": [("run",)],
+        "luminosityBlock": [("luminosityBlock",)],
+        "event": [("event",)],
+        "n_mu": [("counts",), ("pt",)],
+        "mean_mu_pt": [("pt",)],
+        "min_mu_pt": [("pt",)],
+        "max_mu_pt": [("pt",)],
+    },
+    "per_particle": {
+        "run": [("run",)],
+        "luminosityBlock": [("luminosityBlock",)],
+        "event": [("event",)],
+        "mu_pt": [("pt",)],
+        "mu_eta": [("eta",)],
+        "mu_phi": [("phi",)],
+        # derived (kinematics.py), float32: only when requested (--cartesian / --columns)
+        "mu_px": [("pt", "phi")],
+        "mu_py": [("pt", "phi")],
+        "mu_pz": [("pt", "eta")],
+        "mu_p": [("pt", "eta")],
+        "mu_ux": [("eta", "phi")],
+        "mu_uy": [("eta", "phi")],
+        "mu_uz": [("eta",)],
+    },
+}
+COLUMN_GRAPH["per_event_jagged"] = COLUMN_GRAPH["per_particle"]
+# --mode counts: ids and multiplicity from the nMuon counter only, the collection is never decoded
+COLUMN_GRAPH["counts"] = {
+    "run": [("run",)],
+    "luminosityBlock": [("luminosityBlock",)],
+    "event": [("event",)],
+    "n_mu": [("counts",)],
+}
+PARTICLE_MODES = ("per_particle", "per_event_jagged")
+
+# inputs that may be absent from a file: the tables fall back to zeros / entry numbers
+OPTIONAL_INPUTS = ("run", "luminosityBlock", "event")
+ID_COLUMNS = ("run", "luminosityBlock", "event")
+# columns computed from the kinematics at ingest (not read from a branch of the same name)
+CARTESIAN_COLUMNS = ("mu_px", "mu_py", "mu_pz", "mu_p", "mu_ux", "mu_uy", "mu_uz")
+
+
+def output_columns(mode):
+    """Default output columns of a mode, in table order (the derived Cartesian columns only on request)."""
+    return [c for c in COLUMN_GRAPH[mode] if c not in CARTESIAN_COLUMNS]
+
+
+def with_cartesian(mode, columns=None):
+    """columns (default: all of the mode) plus the Cartesian / unit-vector columns (--cartesian)."""
+    if mode not in PARTICLE_MODES:
+        raise ValueError("--cartesian adds per-particle columns; use --mode per_particle or per_event_jagged.")
+    columns = list(columns or output_columns(mode))
+    return columns + [c for c in CARTESIAN_COLUMNS if c not in columns]
+
+
+def parse_columns(spec):
+    """'n_mu,mean_mu_pt' -> ['n_mu', 'mean_mu_pt'] (None / empty -> None: all columns)."""
+    cols = [c.strip() for c in (spec or "").split(",") if c.strip()]
+    return cols or None
+
+
+def resolve(mode, columns, names):
+    """
+    Read plan for the requested output columns (default: all) of a mode:
+    {"mode", "columns" (table order), "inputs" {column: [branches]}, "branches" (to decode, in order)}.
+    Raises ValueError for unknown columns and RuntimeError when a required branch is not in the file.
+    """
+    graph = COLUMN_GRAPH[mode]
+    requested = list(columns or output_columns(mode))
+    unknown = [c for c in requested if c not in graph]
+    if unknown:
+        raise ValueError(f"Unknown {mode} column(s) {', '.join(unknown)}; available: {', '.join(graph)}")
+    ordered = [c for c in graph if c in requested]
+    if mode in PARTICLE_MODES and not any(c not in ID_COLUMNS for c in ordered):
+        raise ValueError(f"{mode} needs at least one muon column ({', '.join(c for c in graph if c not in ID_COLUMNS)}).")
+
+    def usable(alternative):
+        return all(names.get(k) or k in OPTIONAL_INPUTS for k in alternative)
+
+    def branches_of(alternative):
+        return [names[k] for k in alternative if names.get(k)]
+
+    chosen = set()
+    inputs = {}
+    # columns without alternatives first, so the others can reuse their branches
+    for col in sorted(ordered, key=lambda c: len(graph[c]) > 1):
+        options = [a for a in graph[col] if usable(a)]
+        if not options:
+            missing = sorted({k for a in graph[col] for k in a if not names.get(k)})
+            raise RuntimeError(f"Column {col} needs branch(es) for {', '.join(missing)}, not found in the file.")
+        pick = next((a for a in options if set(branches_of(a)) <= chosen), options[0])
+        inputs[col] = branches_of(pick)
+        chosen.update(inputs[col])
+    # may be empty: event ids absent from the file come from entry numbers / zeros (event_id_columns)
+    branches = list(dict.fromkeys(b for col in ordered for b in inputs[col]))
+    return {"mode": mode, "columns": ordered, "inputs": {c: inputs[c] for c in ordered}, "branches": branches}
+
+
+def describe(plan, tree, entry_start, entry_stop, cut_branches=(), chunks=None):
+    """
+    Dry-run report of a plan: per branch (phase-1 cut branches first) the compressed / uncompressed
+    bytes and baskets of the entry range, scaled from the branch totals. Metadata only, nothing decoded.
+    """
+    n_total = max(1, tree.num_entries)
+    frac = (entry_stop - entry_start) / n_total
+    lines = [f"Read plan ({plan['mode']}): entries [{entry_start}, {entry_stop}) of {tree.num_entries}"
+             + (f", {len(chunks)} chunks" if chunks is not None else "")]
+    lines.append("Output columns: " + ", ".join(f"{c} <- {'+'.join(plan['inputs'][c]) or '(entry number / 0)'}"
+                                                for c in plan["columns"]))
+    rows = [("cut", b) for b in cut_branches] + [("data", b) for b in plan["branches"] if b not in cut_branches]
+    total_c = total_u = 0
+    lines.append(f"  {'phase':5}  {'branch':32} {'compressed MB':>14} {'uncompressed MB':>16} {'baskets':>8}")
+    for phase, b in rows:
+        br = tree[b]
+        comp, unc = br.compressed_bytes * frac, br.uncompressed_bytes * frac
+        total_c += comp
+        total_u += unc
+        lines.append(f"  {phase:5}  {b:32} {comp / 2**20:14.3f} {unc / 2**20:16.3f} {br.num_baskets:8d}")
+    lines.append(f"  {'total':5}  {'':32} {total_c / 2**20:14.3f} {total_u / 2**20:16.3f}")
+    if cut_branches:
+        lines.append("  (data branches are decoded only for clusters with passing events: upper bound)")
+    return "\n".join(lines)
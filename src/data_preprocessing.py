@@ -6,218 +6,940 @@ Lectura y preprocesado de archivos ROOT (NanoAOD / ROOT TTrees) usando uproot +
 Genera:
  - modo per_event: resumen por evento (n_mu, mean_pt, etc.) -> parquet/csv
  - modo per_particle: tabla por partícula (run,event,pt,eta,phi, ...) -> parquet/csv
+ - modo per_event_jagged: una fila por evento con columnas lista (mu_pt: list<float32>, ...) -> parquet;
+   analysis.py la lee directamente como arrays awkward (sin reagrupar filas planas)
 
 Uso (ejemplo):
   python src/data_preprocessing.py --input data/raw/sample.root --mode per_event --output results/angles_input.parquet
+  # modo streaming (memoria acotada por --step-size, un row group Parquet por bloque):
+  python src/data_preprocessing.py --input data/raw/sample.root --mode per_particle --stream --step-size 100000 --output results/preprocessed_particles.parquet
+  # varios ficheros (glob o --input-list), un proceso por fichero -> dataset Parquet (un part por fichero):
+  python src/data_preprocessing.py --input 'data/raw/*.root' --workers 8 --mode per_particle --output results/preprocessed_particles.parquet
+  # varias colecciones en una sola lectura (una tabla por colección: preprocessed_particles_<Colección>.parquet):
+  python src/data_preprocessing.py --input data/raw/sample.root --mode per_particle --collections Muon,Electron,Jet --collection-vars Jet=pt,eta,phi,mass --output results/preprocessed_particles.parquet
+  # solo eventos que pasan los cortes de evento de config/selection.yaml (min_n_muons, ...): nMuon se lee primero
+  # y la cinemática se decodifica solo en los rangos con eventos seleccionados
+  python src/data_preprocessing.py --input data/raw/sample.root --mode per_particle --select --output results/preprocessed_particles.parquet
 
 Requisitos:
   - uproot, awkward, numpy, pandas
 """
 import argparse
-import hashlib
+import glob
+import importlib.util
 import json
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import numpy as np
 import pandas as pd
 
 try:
-    import uproot
     import awkward as ak
 except Exception as e:
     raise SystemExit("Requires uproot and awkward. Install them in the active env: pip install uproot awkward") from e
+# uproot is used through coalesced_io / schema_catalog / parallel_io; fail early with the same hint
+if importlib.util.find_spec("uproot") is None:
+    raise SystemExit("Requires uproot and awkward. Install them in the active env: pip install uproot awkward")
+
+# optional import for streaming Parquet output
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
+try:  # executed as a script: python src/data_preprocessing.py
+    import digest_cache
+    import array_cache
+    import coalesced_io
+    import column_cache
+    import column_plan
+    import dtype_policy
+    import gz_cache
+    import kinematics
+    import parallel_io
+    import parquet_writer
+    import pushdown
+    import schema_catalog
+    import selection
+    import sharding
+    import sketches
+except ImportError:  # imported as src.data_preprocessing (tests, notebooks)
+    from src import digest_cache
+    from src import array_cache
+    from src import coalesced_io
+    from src import column_cache
+    from src import column_plan
+    from src import dtype_policy
+    from src import gz_cache
+    from src import kinematics
+    from src import parallel_io
+    from src import parquet_writer
+    from src import pushdown
+    from src import schema_catalog
+    from src import selection
+    from src import sharding
+    from src import sketches
 
 
 def sha256_of_file(path, block_size=65536):
-    h = hashlib.sha256()
-    with open(path, "rb") as f:
-        for block in iter(lambda: f.read(block_size), b""):
-            h.update(block)
-    return h.hexdigest()
+    return digest_cache.sha256_of_file(path, block_size=block_size)
 
 
 def detect_tree(root_file):
-    f = uproot.open(root_file)
-    # prefer 'Events' if present, else first TTree-like key
-    keys = list(f.keys())
-    if "Events" in keys:
-        return "Events"
-    # find first key whose classname contains 'TTree'
-    for k in keys:
-        try:
-            obj = f[k]
-            cname = getattr(obj, "classname", "")
-            if isinstance(cname, (bytes, bytearray)):
-                cname = cname.decode(errors="ignore")
-            if "TTree" in str(cname) or "TTree" in str(obj):
-                return k
-        except Exception:
-            continue
-    # fallback: first key
-    return keys[0] if keys else None
-
-
-def read_branches(tree, branches, entry_stop=None, library="ak"):
-    """Read branches from uproot tree, return awkward arrays (or numpy if library='np')."""
-    if entry_stop is not None:
-        arrs = {b: tree[b].array(entry_stop=entry_stop, library=library) for b in branches}
+    """Tree name of a ROOT file ('Events' if present, else first TTree), served from the schema catalog."""
+    return schema_catalog.load_schema(root_file)["tree"]
+
+
+def read_branches(tree, branches, entry_stop=None, library="ak", entry_start=None,
+                  threads=1, executors=None, clusters=None):
+    """
+    Read branches from uproot tree, return awkward arrays (or numpy if library='np').
+    executors: uproot decompression/interpretation executors (parallel_io.make_executors);
+    threads > 1: the entry range is split at cluster boundaries and the pieces are read concurrently.
+    """
+    if threads > 1:
+        start, stop = sharding.entry_range(tree.num_entries, entry_start, entry_stop)
+        return parallel_io.read_concurrent(tree, branches, start, stop, threads, clusters=clusters,
+                                           executors=executors, library=library)
+    start, stop = sharding.entry_range(tree.num_entries, entry_start, entry_stop)
+    return parallel_io.read_range(tree, branches, start, stop, executors, library)
+
+
+def read_selected_branches(tree, branches, entry_stop=None, library="ak", entry_start=None, cuts=None,
+                           threads=1, executors=None, clusters=None, stats=None, sketch=None):
+    """
+    read_branches with predicate pushdown (see pushdown.py): only events passing the event-level cuts
+    are decoded and returned. Returns (arrays, entry numbers of the events; None without cuts).
+    sketch (sketches.DatasetSketch) is fed with the arrays returned.
+    """
+    if not cuts:
+        arrs, entries = read_branches(tree, branches, entry_stop=entry_stop, library=library, entry_start=entry_start,
+                                      threads=threads, executors=executors, clusters=clusters), None
+    else:
+        start, stop = sharding.entry_range(tree.num_entries, entry_start, entry_stop)
+        if clusters is None:
+            clusters = tree.common_entry_offsets(filter_name=branches + selection.cut_branches(cuts))
+        arrs, entries = pushdown.read_selected_all(tree, branches, start, stop, cuts, clusters, parallel=threads,
+                                                   executors=executors, library=library, stats=stats)
+    if sketch is not None:
+        sketch.update(arrs)
+    return arrs, entries
+
+
+# logical columns of the muon tables (keys of schema_catalog.resolve_aliases)
+MUON_TABLE_KEYS = ("pt", "eta", "phi", "run", "luminosityBlock", "event")
+
+
+def needed_branches(names, extra=None):
+    """
+    Branches to read for an alias map from schema_catalog.resolve_aliases (deduplicated, stable order).
+    With extra (collection branches) only the event ids are taken from the alias map.
+    """
+    keys = MUON_TABLE_KEYS if extra is None else ("run", "luminosityBlock", "event")
+    return list(dict.fromkeys([names[k] for k in keys if names.get(k)] + list(extra or [])))
+
+
+def event_summary_frame(arrs, names, entry_start=0, entries=None, columns=None, entry_stop=None):
+    """
+    Per-event summary for one block of arrays (whole tree or the chunk [entry_start, entry_stop)).
+    entries: entry numbers of the events (selected reads), used as event when there is no event branch.
+    columns: output columns to compute (column_plan.resolve; default all); arrs only needs their branches.
+    """
+    columns = columns or column_plan.output_columns("per_event")
+    out = {}
+    if names["pt"] in arrs or any(c.endswith("_mu_pt") for c in columns):
+        mu_pt = arrs.get(names["pt"], ak.Array(np.zeros((0, 0), dtype=dtype_policy.KINEMATIC_DTYPE)))
+        # summaries keep the branch width (float32 in NanoAOD); only the mean accumulates in float64
+        pt_dtype = ak.to_numpy(ak.flatten(mu_pt, axis=1)).dtype
+        out["n_mu"] = ak.to_numpy(ak.num(mu_pt, axis=1))
+        if "mean_mu_pt" in columns:
+            # ak.mean of an empty list is NaN, not None: zero-muon events get 0.0 like min/max
+            mean = ak.to_numpy(ak.fill_none(ak.mean(mu_pt, axis=1), 0.0))
+            out["mean_mu_pt"] = np.where(out["n_mu"] > 0, mean, 0.0).astype(pt_dtype)
+        if "min_mu_pt" in columns:
+            out["min_mu_pt"] = ak.to_numpy(ak.fill_none(ak.min(mu_pt, axis=1), 0.0)).astype(pt_dtype, copy=False)
+        if "max_mu_pt" in columns:
+            out["max_mu_pt"] = ak.to_numpy(ak.fill_none(ak.max(mu_pt, axis=1), 0.0)).astype(pt_dtype, copy=False)
+    elif names.get("counts") in arrs:
+        out["n_mu"] = ak.to_numpy(arrs[names["counts"]])  # multiplicity without decoding the collection
+
+    # optional event ids (native widths)
+    # number of events from any decoded array; with no branch read (ids derived from entry numbers),
+    # from the selected entries or the entry range
+    if arrs:
+        n_events = len(next(iter(arrs.values())))
+    elif entries is not None:
+        n_events = len(entries)
     else:
-        arrs = {b: tree[b].array(library=library) for b in branches}
-    return arrs
-
-
-def per_event_summary(tree, entry_stop=None):
-    branches = list(tree.keys())
-    # Choose typical branches
-    mu_pt_b = "Muon_pt" if "Muon_pt" in branches else next((b for b in branches if "Muon" in b and "pt" in b.lower()), None)
-    mu_eta_b = "Muon_eta" if "Muon_eta" in branches else next((b for b in branches if "Muon" in b and "eta" in b.lower()), None)
-    mu_phi_b = "Muon_phi" if "Muon_phi" in branches else next((b for b in branches if "Muon" in b and "phi" in b.lower()), None)
-
-    # always try to get event identifiers if present
-    id_run = "run" if "run" in branches else None
-    id_lumi = "luminosityBlock" if "luminosityBlock" in branches else None
-    id_evt = "event" if "event" in branches else None
-
-    # Read needed branches
-    needed = [b for b in (mu_pt_b, mu_eta_b, mu_phi_b, id_run, id_lumi, id_evt) if b]
-    arrs = read_branches(tree, needed, entry_stop=entry_stop, library="ak")
-
-    mu_pt = arrs.get(mu_pt_b, ak.Array([]))
-    mu_eta = arrs.get(mu_eta_b, ak.Array([]))
-    mu_phi = arrs.get(mu_phi_b, ak.Array([]))
-
-    # per-event metrics
-    n_mu = ak.num(mu_pt)
-    mean_pt = ak.where(n_mu > 0, ak.mean(mu_pt, axis=1), ak.zeros_like(n_mu, dtype=float))
-    min_pt = ak.where(n_mu > 0, ak.min(mu_pt, axis=1), ak.zeros_like(n_mu, dtype=float))
-    max_pt = ak.where(n_mu > 0, ak.max(mu_pt, axis=1), ak.zeros_like(n_mu, dtype=float))
-
-    # optional event ids
-    run = arrs.get(id_run, ak.zeros_like(n_mu, dtype=int))
-    lumi = arrs.get(id_lumi, ak.zeros_like(n_mu, dtype=int))
-    evt = arrs.get(id_evt, ak.Array(np.arange(len(n_mu))))
-
-    df = pd.DataFrame({
-        "run": ak.to_numpy(run),
-        "luminosityBlock": ak.to_numpy(lumi),
-        "event": ak.to_numpy(evt),
-        "n_mu": ak.to_numpy(n_mu),
-        "mean_mu_pt": ak.to_numpy(mean_pt),
-        "min_mu_pt": ak.to_numpy(min_pt),
-        "max_mu_pt": ak.to_numpy(max_pt),
-    })
-    return df
-
-
-def per_particle_table(tree, entry_stop=None):
-    branches = list(tree.keys())
-    mu_pt_b = "Muon_pt" if "Muon_pt" in branches else next((b for b in branches if "Muon" in b and "pt" in b.lower()), None)
-    mu_eta_b = "Muon_eta" if "Muon_eta" in branches else next((b for b in branches if "Muon" in b and "eta" in b.lower()), None)
-    mu_phi_b = "Muon_phi" if "Muon_phi" in branches else next((b for b in branches if "Muon" in b and "phi" in b.lower()), None)
-
-    id_run = "run" if "run" in branches else None
-    id_lumi = "luminosityBlock" if "luminosityBlock" in branches else None
-    id_evt = "event" if "event" in branches else None
-
-    needed = [b for b in (mu_pt_b, mu_eta_b, mu_phi_b, id_run, id_lumi, id_evt) if b]
-    arrs = read_branches(tree, needed, entry_stop=entry_stop, library="ak")
-
-    if not (mu_pt_b and mu_eta_b and mu_phi_b):
+        n_events = entry_stop - entry_start
+    out.update(event_id_columns(arrs, names, n_events, entry_start=entry_start, entries=entries))
+    return pd.DataFrame(dtype_policy.cast_columns({c: out[c] for c in columns}))
+
+
+def flatten_jagged(arr):
+    """Return (counts, flat) NumPy arrays for a jagged awkward array, using its offsets (no Python loops)."""
+    counts = ak.to_numpy(ak.num(arr, axis=1))
+    flat = ak.to_numpy(ak.flatten(arr, axis=1))
+    return counts, flat
+
+
+def repeat_per_event(values, counts):
+    """Broadcast one value per event to one value per particle (np.repeat over the jagged counts)."""
+    return np.repeat(np.asarray(values), counts)
+
+
+# default per-particle variables and column prefixes (mu_pt, ...; other collections: electron_pt, jet_pt, ...)
+DEFAULT_VARIABLES = ("pt", "eta", "phi")
+COLUMN_PREFIXES = {"Muon": "mu"}
+
+
+def collection_spec(branches, collection, variables=DEFAULT_VARIABLES, names=None):
+    """
+    Output columns -> branches for one collection, e.g. Jet with (pt, mass) -> {"jet_pt": "Jet_pt", "jet_mass": "Jet_mass"}.
+    Muon pt/eta/phi come from the alias map (names) when given.
+    """
+    branch_set = set(branches)
+    prefix = COLUMN_PREFIXES.get(collection, collection.lower())
+    columns = {}
+    for var in variables:
+        b = f"{collection}_{var}"
+        if collection == "Muon" and names and var in DEFAULT_VARIABLES:
+            b = names.get(var)
+        if not b or b not in branch_set:
+            raise RuntimeError(f"Branch {collection}_{var} not found for collection {collection}.")
+        columns[f"{prefix}_{var}"] = b
+    return {"name": collection, "columns": columns}
+
+
+def muon_spec(names, columns=None):
+    """
+    Collection spec of the default muon table (mu_pt, mu_eta, mu_phi) from an alias map;
+    columns (column_plan.resolve) keeps only the requested muon columns; derived ones (mu_px, mu_ux, ...)
+    map to themselves and are filled by with_derived_columns.
+    """
+    if columns:
+        return {"name": "Muon", "columns": {c: c if c in column_plan.CARTESIAN_COLUMNS else names[c[3:]]
+                                            for c in columns if c.startswith("mu_")}}
+    if not (names["pt"] and names["eta"] and names["phi"]):
         raise RuntimeError("No se detectaron ramas muon (pt/eta/phi) para generar tabla por partícula.")
+    return {"name": "Muon", "columns": {"mu_pt": names["pt"], "mu_eta": names["eta"], "mu_phi": names["phi"]}}
+
+
+def specs_branches(specs):
+    return [b for spec in specs for b in spec["columns"].values()]
+
+
+def with_derived_columns(arrs, names, specs):
+    """
+    arrs plus the Cartesian / unit-vector muon columns the specs ask for (kinematics.py): px/py/pz/p in
+    float32, ux/uy/uz computed and stored in float64 so the angle kernel matches the pt/eta/phi path.
+    """
+    wanted = [b for b in specs_branches(specs) if b in column_plan.CARTESIAN_COLUMNS and b not in arrs]
+    if not wanted:
+        return arrs
+    pt, eta, phi = (arrs.get(names[k]) for k in ("pt", "eta", "phi"))
+    cartesian = [c[3:] for c in wanted if c[3:] in kinematics.CARTESIAN]
+    unit = [c[3:] for c in wanted if c[3:] in kinematics.UNIT]
+    comps = kinematics.components(cartesian, pt=pt, eta=eta, phi=phi, dtype=dtype_policy.KINEMATIC_DTYPE)
+    if unit:
+        eta, phi = (ak.values_astype(x, dtype_policy.UNIT_VECTOR_DTYPE) if x is not None else None for x in (eta, phi))
+        comps.update(kinematics.components(unit, eta=eta, phi=phi, dtype=dtype_policy.UNIT_VECTOR_DTYPE))
+    return dict(arrs, **{c: comps[c[3:]] for c in wanted})
+
+
+def event_id_columns(arrs, names, n_events, entry_start=0, entries=None):
+    """run/luminosityBlock/event as one NumPy value per event (zeros / entry numbers when a branch is absent)."""
+    if entries is None:
+        entries = np.arange(entry_start, entry_start + n_events)
+    run = ak.to_numpy(arrs[names["run"]]) if names["run"] in arrs else np.zeros(n_events)
+    lumi = ak.to_numpy(arrs[names["luminosityBlock"]]) if names["luminosityBlock"] in arrs else np.zeros(n_events)
+    evt = ak.to_numpy(arrs[names["event"]]) if names["event"] in arrs else entries
+    # native widths (uint32 run/lumi, uint64 event) whatever the branch or fallback type
+    return {"run": dtype_policy.id_array("run", run), "luminosityBlock": dtype_policy.id_array("luminosityBlock", lumi),
+            "event": dtype_policy.id_array("event", evt)}
+
+
+def collection_columns(arrs, spec, ids):
+    """Flat per-particle columns of one collection; per-event ids (already decoded) are broadcast per particle."""
+    cols = {}
+    counts = None
+    for col, b in spec["columns"].items():
+        counts, cols[col] = flatten_jagged(arrs[b])
+    out = {k: repeat_per_event(v, counts) for k, v in ids.items()}
+    out.update(cols)
+    return out
+
+
+def collection_tables_columns(arrs, names, specs, entry_start=0, entries=None, id_columns=column_plan.ID_COLUMNS):
+    """
+    {collection: flat columns} for several collections read together; event ids are decoded once and shared.
+    id_columns: the event id columns to include (column_plan; default all three).
+    """
+    arrs = with_derived_columns(arrs, names, specs)
+    first = arrs[specs_branches(specs)[0]]
+    ids = event_id_columns(arrs, names, len(first), entry_start=entry_start, entries=entries)
+    ids = {k: v for k, v in ids.items() if k in id_columns}
+    return {spec["name"]: collection_columns(arrs, spec, ids) for spec in specs}
+
+
+def particle_table_columns(arrs, names, entry_start=0, entries=None, columns=None):
+    """
+    Columnar per-particle flattening: dict of flat NumPy columns
+    (run, luminosityBlock, event, mu_pt, mu_eta, mu_phi), ready for pandas or pyarrow.
+    columns: only these output columns (column_plan.resolve; default all).
+    """
+    id_columns = [c for c in columns if c in column_plan.ID_COLUMNS] if columns else column_plan.ID_COLUMNS
+    return collection_tables_columns(arrs, names, [muon_spec(names, columns)], entry_start=entry_start,
+                                     entries=entries, id_columns=id_columns)["Muon"]
+
+
+def particle_table_frame(arrs, names, entry_start=0, entries=None, columns=None):
+    """Per-particle table for one block of arrays (whole tree or one chunk starting at entry_start)."""
+    return pd.DataFrame(particle_table_columns(arrs, names, entry_start=entry_start, entries=entries, columns=columns))
+
+
+# per_* tables: cuts (selection.event_cuts) restrict them to the passing events, decoded via pushdown.py;
+# columns (default all) are resolved by column_plan, so only the branches they need are decoded
+def per_event_summary(tree, entry_stop=None, names=None, entry_start=None, io_opts=None, cuts=None, columns=None):
+    names = names or schema_catalog.resolve_aliases(tree.keys())
+    plan = column_plan.resolve("per_event", columns, names)
+    arrs, entries = read_selected_branches(tree, plan["branches"], entry_stop=entry_stop, library="ak",
+                                           entry_start=entry_start, cuts=cuts, **(io_opts or {}))
+    start, stop = sharding.entry_range(tree.num_entries, entry_start, entry_stop)
+    return event_summary_frame(arrs, names, entry_start=start, entries=entries, columns=plan["columns"], entry_stop=stop)
+
+
+def event_counts(tree, entry_stop=None, names=None, entry_start=None, io_opts=None, cuts=None, columns=None):
+    """--mode counts: run, luminosityBlock, event and n_mu from the nMuon counter; Muon_* is never decoded."""
+    names = names or schema_catalog.resolve_aliases(tree.keys())
+    plan = column_plan.resolve("counts", columns, names)
+    arrs, entries = read_selected_branches(tree, plan["branches"], entry_stop=entry_stop, library="ak",
+                                           entry_start=entry_start, cuts=cuts, **(io_opts or {}))
+    start, stop = sharding.entry_range(tree.num_entries, entry_start, entry_stop)
+    return event_summary_frame(arrs, names, entry_start=start, entries=entries, columns=plan["columns"], entry_stop=stop)
+
+
+def per_particle_table(tree, entry_stop=None, names=None, entry_start=None, io_opts=None, cuts=None, columns=None):
+    names = names or schema_catalog.resolve_aliases(tree.keys())
+    if columns is None:
+        muon_spec(names)
+    plan = column_plan.resolve("per_particle", columns, names)
+    arrs, entries = read_selected_branches(tree, plan["branches"], entry_stop=entry_stop, library="ak",
+                                           entry_start=entry_start, cuts=cuts, **(io_opts or {}))
+    return particle_table_frame(arrs, names, entry_start=entry_start or 0, entries=entries, columns=plan["columns"])
+
+
+def jagged_event_array(arrs, names, specs, entry_start=0, entries=None, id_columns=column_plan.ID_COLUMNS):
+    """
+    One record per event: run/luminosityBlock/event plus one list column per collection variable
+    (mu_pt, mu_eta, mu_phi, ...), keeping the jagged structure (and offsets) as read from the tree.
+    """
+    arrs = with_derived_columns(arrs, names, specs)
+    first = arrs[specs_branches(specs)[0]]
+    ids = event_id_columns(arrs, names, len(first), entry_start, entries)
+    fields = {k: ak.Array(v) for k, v in ids.items() if k in id_columns}
+    for spec in specs:
+        fields.update({col: arrs[b] for col, b in spec["columns"].items()})
+    return ak.zip(fields, depth_limit=1)
+
+
+def per_event_jagged(tree, entry_stop=None, names=None, entry_start=None, io_opts=None, cuts=None, specs=None,
+                     columns=None):
+    """per_event_jagged table (ak.Array of records) for the muons (columns: subset), or for the collections of specs."""
+    names = names or schema_catalog.resolve_aliases(tree.keys())
+    id_columns = column_plan.ID_COLUMNS
+    if specs:
+        branches = needed_branches(names, extra=specs_branches(specs))
+    else:
+        plan = column_plan.resolve("per_event_jagged", columns, names)
+        specs, branches = [muon_spec(names, plan["columns"] if columns else None)], plan["branches"]
+        id_columns = [c for c in plan["columns"] if c in column_plan.ID_COLUMNS]
+    arrs, entries = read_selected_branches(tree, branches, entry_stop=entry_stop, library="ak",
+                                           entry_start=entry_start, cuts=cuts, **(io_opts or {}))
+    return jagged_event_array(arrs, names, specs, entry_start=entry_start or 0, entries=entries, id_columns=id_columns)
+
+
+# plain Arrow list<...> types (32-bit offsets, no awkward extension metadata): pyarrow/pandas/Spark read them too
+JAGGED_PARQUET_OPTIONS = {"extensionarray": False, "list_to32": True}
+
+
+def jagged_arrow_table(array):
+    """
+    Arrow table of a per_event_jagged array. List children are named 'element',
+    as Parquet readers report them, so merge_shards can copy row groups without changing the schema.
+    """
+    table = ak.to_arrow_table(array, **JAGGED_PARQUET_OPTIONS)
+    fields = [pa.field(f.name, pa.list_(f.type.value_field.with_name("element")), f.nullable)
+              if pa.types.is_list(f.type) else f for f in table.schema]
+    return table.cast(pa.schema(fields, metadata=table.schema.metadata))
+
+
+def write_jagged(array, outp, writer_opts=None):
+    """Write a per_event_jagged array as Parquet with list-typed columns (list<float32> for NanoAOD kinematics)."""
+    parquet_writer.write_table(jagged_arrow_table(array), outp, writer_opts)
+
+
+def per_collection_tables(tree, specs, entry_stop=None, names=None, entry_start=None, io_opts=None, cuts=None):
+    """
+    Single-pass extraction of several collections (e.g. Muon, Electron, Jet): all branches are read
+    in one go, the shared run/luminosityBlock/event branches once. Returns {collection: DataFrame}.
+    """
+    names = names or schema_catalog.resolve_aliases(tree.keys())
+    branches = needed_branches(names, extra=specs_branches(specs))
+    arrs, entries = read_selected_branches(tree, branches, entry_stop=entry_stop, library="ak",
+                                           entry_start=entry_start, cuts=cuts, **(io_opts or {}))
+    tables = collection_tables_columns(arrs, names, specs, entry_start=entry_start or 0, entries=entries)
+    return {c: pd.DataFrame(cols) for c, cols in tables.items()}
+
+
+def stream_to_parquet(tree, mode, outp, step_size=100000, entry_stop=None, names=None, specs=None,
+                      entry_start=None, clusters=None, chunks=None, io_opts=None, cuts=None, writer_opts=None,
+                      columns=None):
+    """
+    Streaming mode: read the tree in fixed-size entry chunks and append each chunk's table to
+    a Parquet file as a new row group. Peak memory scales with step_size, not with the size of
+    the input file.
+
+    Chunks follow sharding.chunk_plan: whole clusters (clusters, default: the tree's common
+    basket boundaries) grouped up to step_size entries, so no basket is decompressed twice.
+    An explicit chunk plan (e.g. one shard's chunks) can be passed as chunks.
+    io_opts (threads, executors): with threads > 1 up to that many chunks are read concurrently;
+    io_opts["sketch"] (sketches.DatasetSketch) is fed with every chunk.
+    cuts (selection.event_cuts): only passing events are decoded and written (pushdown.read_selected);
+    chunks without passing events add no row group.
+    writer_opts: parquet_writer options (codec, row group size, dictionary columns, statistics, partition_by).
+    columns: output columns of the muon tables (column_plan.resolve; default all), only their branches are read.
+
+    With specs (per_particle, several collections) outp is {collection: path} and every chunk
+    appends one row group to each collection's file.
+
+    Returns a dict with the number of chunks and rows written (plus rows per collection with several specs,
+    and the pushdown counters under "selection" with cuts).
+    """
+    if pq is None:
+        raise RuntimeError("Streaming mode requires pyarrow (pip install pyarrow).")
+    names = names or schema_catalog.resolve_aliases(tree.keys())
+    plan = None if specs else column_plan.resolve(mode, columns, names)
+    id_columns = [c for c in plan["columns"] if c in column_plan.ID_COLUMNS] if plan else column_plan.ID_COLUMNS
+    if mode == "per_particle" and specs is None:
+        specs = [muon_spec(names, columns and plan["columns"])]
+        outp = {"Muon": outp}
+    elif mode == "per_event_jagged":
+        specs = specs or [muon_spec(names, columns and plan["columns"])]
+        outp = outp if not isinstance(outp, dict) else next(iter(outp.values()))
+    branches = plan["branches"] if plan else needed_branches(names, extra=specs_branches(specs))
+    io_opts = io_opts or {}
+    if clusters is None:
+        clusters = io_opts.get("clusters")
+    if clusters is None and (chunks is None or cuts):
+        clusters = tree.common_entry_offsets(filter_name=branches + (selection.cut_branches(cuts) if cuts else []))
+    if chunks is None:
+        step = step_size if isinstance(step_size, int) else tree.num_entries_for(step_size, branches)
+        start, stop = sharding.entry_range(tree.num_entries, entry_start, entry_stop)
+        chunks = sharding.chunk_plan(clusters, start, stop, step)
+
+    def chunk_tables(arrs, entry_start, entries=None, entry_stop=None):
+        if mode in ("per_event", "counts"):
+            frame = event_summary_frame(arrs, names, entry_start=entry_start, entries=entries, columns=plan["columns"],
+                                        entry_stop=entry_stop)
+            return {None: pa.Table.from_pandas(frame, preserve_index=False)}
+        if mode == "per_event_jagged":
+            array = jagged_event_array(arrs, names, specs, entry_start, entries=entries, id_columns=id_columns)
+            return {None: jagged_arrow_table(array)}
+        # flat NumPy columns go straight to Arrow (zero-copy), no pandas round trip
+        tables = collection_tables_columns(arrs, names, specs, entry_start, entries=entries, id_columns=id_columns)
+        return {c: pa.table(cols) for c, cols in tables.items()}
+
+    targets = outp if isinstance(outp, dict) else {None: outp}
+    writers = {key: parquet_writer.TableWriter(path, writer_opts) for key, path in targets.items()}
+    n_chunks = 0
+    n_rows = dict.fromkeys(targets, 0)
+    try:
+        parallel, executors = io_opts.get("threads", 1), io_opts.get("executors")
+        if cuts:
+            stats = pushdown.new_stats()
+            chunk_reader = pushdown.read_selected(tree, branches, chunks, cuts, clusters, parallel, executors, stats=stats)
+        else:
+            chunk_reader = ((start, stop, arrs, None)
+                            for start, stop, arrs in parallel_io.read_ranges(tree, branches, chunks, parallel, executors))
+        sketch = io_opts.get("sketch")
+        for start, stop, arrs, entries in chunk_reader:
+            if sketch is not None:
+                sketch.update(arrs)
+            for key, table in chunk_tables(arrs, start, entries, stop).items():
+                writers[key].write(table)
+                n_rows[key] += table.num_rows
+            n_chunks += 1
+        if not n_chunks:
+            # empty tree / entry range: still leave valid (empty) Parquet files behind
+            arrs = read_branches(tree, branches, entry_stop=0, library="ak")
+            for key, table in chunk_tables(arrs, 0, entry_stop=0).items():
+                writers[key].write(table)
+    finally:
+        for w in writers.values():
+            w.close()
+    info = {"n_chunks": n_chunks, "n_rows": sum(n_rows.values())}
+    if mode == "per_particle" and len(targets) > 1:
+        info["collections"] = {c: {"n_rows": n} for c, n in n_rows.items()}
+    if cuts:
+        info["selection"] = stats
+    return info
+
+
+def expand_inputs(patterns, list_file=None):
+    """
+    Expand --input values (paths or glob patterns) and an optional text file with one path per line.
+    Order follows the arguments; each glob is sorted so the file order is deterministic. Duplicates are dropped.
+    """
+    items = list(patterns or [])
+    if list_file:
+        with open(list_file) as fh:
+            items += [ln.strip() for ln in fh if ln.strip() and not ln.strip().startswith("#")]
+    paths = []
+    for item in items:
+        matches = sorted(glob.glob(item)) if glob.has_magic(item) else [item]
+        paths.extend(Path(m) for m in matches)
+    return list(dict.fromkeys(paths))
+
+
+def parse_collections(collections, collection_vars=None):
+    """
+    --collections "Muon,Electron,Jet" plus optional --collection-vars "Jet=pt,eta,phi,mass" entries
+    -> [(collection, variables), ...] (default variables: pt, eta, phi).
+    """
+    names = [c.strip() for c in collections.split(",") if c.strip()]
+    variables = {}
+    for item in collection_vars or []:
+        c, _, vs = item.partition("=")
+        variables[c.strip()] = tuple(v.strip() for v in vs.split(",") if v.strip())
+    unknown = set(variables) - set(names)
+    if unknown:
+        raise ValueError(f"--collection-vars given for collections not in --collections: {sorted(unknown)}")
+    return [(c, variables.get(c, DEFAULT_VARIABLES)) for c in names]
+
+
+def collection_output(outp, collection):
+    """Per-collection output path: results/particles.parquet -> results/particles_Jet.parquet."""
+    outp = Path(outp)
+    return outp.with_name(f"{outp.stem}_{collection}{outp.suffix}")
+
+
+def collection_outputs(outp, collections):
+    """{collection: path}: a single collection keeps outp, several get one file each."""
+    if len(collections) == 1:
+        return {collections[0][0]: Path(outp)}
+    return {c: collection_output(outp, c) for c, _ in collections}
+
+
+def write_table(df, outp, writer_opts=None):
+    """Write a DataFrame as Parquet (with the parquet_writer options) or CSV, by extension."""
+    outp = Path(outp)
+    if outp.suffix.lower() in [".parquet", ".pq"]:
+        parquet_writer.write_table(pa.Table.from_pandas(df, preserve_index=False), outp, writer_opts)
+    else:
+        df.to_csv(outp, index=False)
 
-    mu_pt = arrs[mu_pt_b]
-    mu_eta = arrs[mu_eta_b]
-    mu_phi = arrs[mu_phi_b]
-
-    # event ids
-    run = arrs.get(id_run, ak.zeros_like(mu_pt, dtype=int))
-    lumi = arrs.get(id_lumi, ak.zeros_like(mu_pt, dtype=int))
-    evt = arrs.get(id_evt, ak.Array(np.arange(len(mu_pt))))
-
-    # repeat per muon using awkward.repeat and flatten
-    counts = ak.num(mu_pt)
-    # Build repeated event ids without ak.repeat (compatible with awkward versions)
-    # Convert run/lumi/event scalars to Python lists and repeat per-event counts
-    run_list = [[int(r)] * int(n) for r, n in zip(ak.to_list(run), ak.to_list(counts))]
-    lumi_list = [[int(l)] * int(n) for l, n in zip(ak.to_list(lumi), ak.to_list(counts))]
-    evt_list = [[int(e)] * int(n) for e, n in zip(ak.to_list(evt), ak.to_list(counts))]
-
-    run_rep = ak.flatten(ak.Array(run_list))
-    lumi_rep = ak.flatten(ak.Array(lumi_list))
-    evt_rep = ak.flatten(ak.Array(evt_list))
-
-    pt_flat = ak.flatten(mu_pt)
-    eta_flat = ak.flatten(mu_eta)
-    phi_flat = ak.flatten(mu_phi)
-
-    table = ak.zip({
-        "run": run_rep,
-        "luminosityBlock": lumi_rep,
-        "event": evt_rep,
-        "mu_pt": pt_flat,
-        "mu_eta": eta_flat,
-        "mu_phi": phi_flat,
-    })
-
-    # convert to pandas DataFrame (1D)
-    df = ak.to_pandas(table)  # returns DataFrame
-    # ensure index reset
-    df = df.reset_index(drop=True)
-    return df
+
+def process_file(inp, outp, mode="per_event", tree=None, entry_stop=None, stream=False, step_size=100000,
+                 collections=None, entry_start=None, shard=None, threads=1, decompression_threads=None,
+                 interpretation_threads=None, config=None, writer_opts=None, sample_fraction=None, columns=None):
+    """
+    Preprocess one ROOT file into outp (parquet or csv). Returns the provenance entry for that file.
+
+    collections: [(collection, variables), ...] for a single-pass per_particle extraction of several
+    collections; outp is then a {collection: path} dict or a base path (see collection_outputs).
+    With mode per_event_jagged all collections go as list columns into the single outp.
+    shard: (index, count) to process only that cluster-aligned share of [entry_start, entry_stop).
+    threads / decompression_threads / interpretation_threads: see parallel_io.
+    config: selection config (selection.load_config) whose event-level cuts are pushed down into the
+    read (only passing events are decoded and written); None keeps every event.
+    sample_fraction: keep only that fraction of events, chosen by a stable hash of (run, luminosityBlock,
+    event) (selection.sample_mask), so every stage and rerun keeps the same events.
+    writer_opts: parquet_writer options for Parquet outputs (default: parquet_writer.DEFAULTS); recorded
+    in the provenance so merge_shards writes merged outputs the same way.
+    columns: output columns of the muon tables (column_plan; default all); only their branches are decoded.
+    mode counts: only nMuon and the event ids are read; the provenance gets the multiplicity histogram and
+    the pass counts of every min_n_muons threshold (sketches.count_summary).
+    """
+    inp = Path(inp)
+    writer_opts = writer_opts or parquet_writer.writer_options()
+    if collections and mode not in ("per_particle", "per_event_jagged"):
+        raise RuntimeError("--collections applies to --mode per_particle / per_event_jagged only.")
+    if collections and columns:
+        raise RuntimeError("--columns selects columns of the muon tables; use --collection-vars with --collections.")
+    if mode == "per_event_jagged" and Path(outp).suffix.lower() not in [".parquet", ".pq"]:
+        raise RuntimeError("--mode per_event_jagged writes list-typed Parquet columns; use a .parquet output path.")
+    outputs = None
+    if collections and mode == "per_particle":
+        outputs = {c: Path(p) for c, p in outp.items()} if isinstance(outp, dict) else collection_outputs(outp, collections)
+    else:
+        outp = Path(outp)
+    # .root.gz: decompressed once into the gunzip cache (its hash is recorded on the way)
+    root_path = gz_cache.local_path(inp)
+    # hash in a background thread (stat-keyed cache hit: already resolved) while the tree is decoded
+    digest = digest_cache.sha256_in_background(inp)
+    prov = {
+        "input_path": str(inp),
+        "input_sha256": None,
+        "mode": mode,
+        "entry_start": entry_start,
+        "entry_stop": entry_stop,
+        "stream": stream,
+        "step_size": step_size if stream else None,
+    }
+
+    # tree name and branch aliases come from the schema catalog (keyed by the content hash)
+    schema = schema_catalog.load_schema(root_path, tree_name=tree, sha256=digest)
+    names = schema["aliases"]
+    t = coalesced_io.open_tree(root_path, schema["tree"])  # batched, offset-ordered basket reads
+    io_before = coalesced_io.io_stats(t)
+    prov["tree"] = schema["tree"]
+    if root_path != inp:
+        prov["decompressed_path"] = str(root_path)
+    specs = [collection_spec(schema["branches"], c, vs, names=names) for c, vs in collections] if collections else None
+    plan = None if specs else column_plan.resolve(mode, columns, names)
+    if columns:
+        prov["columns_requested"] = plan["columns"]
+    cuts = file_cuts(schema, config, sample_fraction)
+    if sample_fraction is not None and sample_fraction < 1:
+        prov["sample_fraction"] = float(sample_fraction)
+
+    # entry range and cluster-aligned chunk plan (the same on every node for a given file)
+    start, stop = sharding.entry_range(schema["num_entries"], entry_start, entry_stop)
+    chunks = None
+    if stream or shard:
+        step = None
+        if stream:
+            branches = plan["branches"] if plan else needed_branches(names, extra=specs_branches(specs))
+            step = step_size if isinstance(step_size, int) else t.num_entries_for(step_size, branches)
+        chunks = sharding.chunk_plan(schema["clusters"], start, stop, step)
+        if shard:
+            chunks = sharding.shard_chunks(chunks, *shard)
+            start, stop = (chunks[0][0], chunks[-1][1]) if chunks else (start, start)
+            prov["shard"] = {"index": shard[0], "count": shard[1]}
+    prov["entry_range"] = [start, stop]
+    prov["threads"] = threads
+    executors = parallel_io.make_executors(threads, decompression_threads, interpretation_threads)
+    sketch = sketches.DatasetSketch(names)  # mergeable column summaries, from the arrays decoded anyway
+    io_opts = dict(threads=threads, executors=executors, clusters=schema["clusters"], sketch=sketch)
+    read_kwargs = dict(entry_start=start, entry_stop=stop, names=names, io_opts=io_opts, cuts=cuts)
+    if columns:
+        read_kwargs["columns"] = columns
+    stats = pushdown.new_stats() if cuts else None
+    if stats is not None and not stream:
+        io_opts["stats"] = stats
+    try:
+        _write_outputs(prov, t, mode, outp, outputs, collections, specs, stream, chunks, read_kwargs, writer_opts)
+    finally:
+        parallel_io.shutdown_executors(executors)
+    if cuts:
+        prov["selection"] = dict(prov.get("selection") or stats, cuts=cuts)
+    prov["io"] = coalesced_io.stats_delta(io_before, coalesced_io.io_stats(t))
+    prov["sketches"] = sketch.to_dict()
+    if mode == "counts":
+        prov.update(sketches.count_summary(prov["sketches"]))
+    prov["input_sha256"] = digest.result()
+    return prov
+
+
+def file_cuts(schema, config=None, sample_fraction=None):
+    """Pushed-down event cuts of one file: the config's event-level cuts (if config) plus hash sampling; None if none."""
+    names = schema["aliases"]
+    cuts = selection.event_cuts(config, names, schema["branches"]) if config else []
+    sample = selection.sample_cut(sample_fraction, names, schema["branches"])
+    return cuts + [sample] if sample else cuts or None
+
+
+def dry_run(inp, mode="per_event", tree=None, entry_start=None, entry_stop=None, config=None, sample_fraction=None,
+            columns=None, collections=None):
+    """Read plan of one file (branches, compressed / uncompressed bytes) as text; only metadata is read."""
+    root_path = gz_cache.local_path(inp)
+    schema = schema_catalog.load_schema(root_path, tree_name=tree)
+    names = schema["aliases"]
+    t = coalesced_io.open_tree(root_path, schema["tree"])
+    if collections:
+        specs = [collection_spec(schema["branches"], c, vs, names=names) for c, vs in collections]
+        branches = needed_branches(names, extra=specs_branches(specs))
+        plan = {"mode": mode, "columns": [], "inputs": {}, "branches": branches}
+        for spec in specs:
+            plan["inputs"].update({col: [b] for col, b in spec["columns"].items()})
+            plan["columns"] += list(spec["columns"])
+    else:
+        plan = column_plan.resolve(mode, columns, names)
+    start, stop = sharding.entry_range(schema["num_entries"], entry_start, entry_stop)
+    cuts = file_cuts(schema, config, sample_fraction)
+    return f"{inp}\n" + column_plan.describe(plan, t, start, stop, selection.cut_branches(cuts) if cuts else ())
+
+
+def _write_outputs(prov, t, mode, outp, outputs, collections, specs, stream, chunks, read_kwargs, writer_opts):
+    """Compute and write the tables of one file (in memory or streamed); row counts go into prov."""
+    targets = outputs.values() if outputs else [outp]
+    if any(Path(p).suffix.lower() in [".parquet", ".pq"] for p in targets):
+        prov["parquet"] = writer_opts
+    read_kwargs = dict(read_kwargs, writer_opts=writer_opts) if stream else read_kwargs
+    if mode == "per_event_jagged":
+        if stream:
+            prov.update(stream_to_parquet(t, mode, outp, specs=specs, chunks=chunks, **read_kwargs))
+        else:
+            array = per_event_jagged(t, specs=specs, **read_kwargs)
+            write_jagged(array, outp, writer_opts)
+            prov["n_rows"] = len(array)
+        if collections:
+            prov["columns"] = {c: [f"{COLUMN_PREFIXES.get(c, c.lower())}_{v}" for v in vs] for c, vs in collections}
+    elif collections:
+        if stream:
+            info = stream_to_parquet(t, mode, outputs, specs=specs, chunks=chunks, **read_kwargs)
+            rows = {c: v["n_rows"] for c, v in info.pop("collections", {}).items()} or {specs[0]["name"]: info["n_rows"]}
+            prov.update(info)
+        else:
+            tables = per_collection_tables(t, specs, **read_kwargs)
+            rows = {}
+            for c, df in tables.items():
+                write_table(df, outputs[c], writer_opts)
+                rows[c] = len(df)
+            prov["n_rows"] = sum(rows.values())
+        prov["collections"] = {
+            c: {"variables": list(vs), "output": str(outputs[c]), "n_rows": rows[c]} for c, vs in collections
+        }
+    elif stream:
+        prov.update(stream_to_parquet(t, mode, outp, chunks=chunks, **read_kwargs))
+    else:
+        if mode == "per_event":
+            df = per_event_summary(t, **read_kwargs)
+        elif mode == "counts":
+            df = event_counts(t, **read_kwargs)
+        else:
+            df = per_particle_table(t, **read_kwargs)
+
+        # save output
+        write_table(df, outp, writer_opts)
+        prov["n_rows"] = len(df)
+
+
+def _process_part(job):
+    """Process-pool worker: (index, input, output path(s), kwargs) -> (index, provenance entry)."""
+    idx, inp, outp, kwargs = job
+    prov = process_file(inp, outp, **kwargs)
+    prov["part"] = f"part-{idx:05d}.parquet"
+    return idx, prov
+
+
+def process_dataset(inputs, outdir, workers=1, **kwargs):
+    """
+    Preprocess several ROOT files into one Parquet dataset directory: one part per input file
+    (part-00000.parquet, part-00001.parquet, ... in input order), fanned out over a process pool.
+    Rows inside each part keep the file's entry order. Returns the per-file provenance entries.
+    With several collections there is one dataset directory per collection (see collection_outputs).
+    Hive partitioning (writer_opts partition_by) is rejected: every part would become its own Hive tree.
+    """
+    if (kwargs.get("writer_opts") or {}).get("partition_by"):
+        raise ValueError("--partition-by writes one Hive tree per output file; partition each input separately "
+                         "(one --output per file) instead of writing a multi-file dataset.")
+    outdir = Path(outdir)
+    # per_particle: one table (dataset) per collection; per_event_jagged keeps them in one table
+    collections = kwargs.get("collections") if kwargs.get("mode") == "per_particle" else None
+    dirs = collection_outputs(outdir, collections) if collections else {None: outdir}
+    for d in dirs.values():
+        d.mkdir(parents=True, exist_ok=True)
+
+    def part_paths(i):
+        if collections:
+            return {c: d / f"part-{i:05d}.parquet" for c, d in dirs.items()}
+        return outdir / f"part-{i:05d}.parquet"
+
+    jobs = [(i, Path(inp), part_paths(i), kwargs) for i, inp in enumerate(inputs)]
+    if workers <= 1 or len(jobs) == 1:
+        results = [_process_part(job) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_process_part, jobs))
+    return [prov for _, prov in sorted(results, key=lambda r: r[0])]
 
 
 def main():
     parser = argparse.ArgumentParser(description="Preprocess ROOT files (NanoAOD) into reduced tables.")
-    parser.add_argument("--input", "-i", required=True, help="Input ROOT file path")
+    parser.add_argument("--input", "-i", nargs="+", default=[],
+                        help="Input ROOT file path(s) or glob pattern(s), e.g. 'data/raw/*.root'")
+    parser.add_argument("--input-list", default=None, help="Text file with one input ROOT path per line")
     parser.add_argument("--tree", "-t", default=None, help="Tree name (default: detect automatically)")
-    parser.add_argument("--mode", "-m", choices=["per_event", "per_particle"], default="per_event")
+    parser.add_argument("--mode", "-m", choices=["per_event", "per_particle", "per_event_jagged", "counts"], default="per_event",
+                        help="per_event: summary per event; per_particle: one row per muon; "
+                             "per_event_jagged: one row per event with list<float32> columns (Parquet only); "
+                             "counts: run/lumi/event/n_mu from nMuon only, plus the multiplicity histogram and "
+                             "pass counts per min_n_muons threshold (fast scan, no kinematics decoded)")
+    parser.add_argument("--entry-start", type=int, default=None, help="First entry to read from the tree")
     parser.add_argument("--entry-stop", type=int, default=None, help="Maximum number of entries to read from the tree")
-    parser.add_argument("--output", "-o", default="results/preprocessed.parquet", help="Output file (parquet or csv). Extension decides format.")
+    parser.add_argument("--shard", default=None,
+                        help="Process only shard i/N (0-based) of the entry range, aligned to the tree's cluster boundaries; "
+                             "combine the N outputs with src/merge_shards.py")
+    parser.add_argument("--output", "-o", default="results/preprocessed.parquet",
+                        help="Output file (parquet or csv). Extension decides format. With several inputs: Parquet dataset directory.")
     parser.add_argument("--force", action="store_true", help="Overwrite output if exists")
+    parser.add_argument("--stream", action="store_true",
+                        help="Streaming mode: process fixed-size entry chunks and append each one to the Parquet output as a row group")
+    parser.add_argument("--step-size", default="100000",
+                        help="Chunk size for --stream: number of entries (e.g. 100000) or memory size (e.g. '200 MB')")
+    parser.add_argument("--workers", type=int, default=1, help="Process pool size for multi-file input (one worker per file)")
+    parser.add_argument("--config", default=None, help="Selection/IO config (default: config/selection.yaml if present)")
+    parser.add_argument("--threads", type=int, default=None,
+                        help="Reader threads: entry ranges read concurrently plus uproot decompression/interpretation "
+                             "executors (default: io.threads in the config, else 1)")
+    parser.add_argument("--decompression-threads", type=int, default=None, help="uproot decompression executor size (default: --threads)")
+    parser.add_argument("--interpretation-threads", type=int, default=None, help="uproot interpretation executor size (default: --threads)")
+    parser.add_argument("--column-cache", action=argparse.BooleanOptionalAction, default=None,
+                        help="Serve decoded branches from the on-disk column cache (src/column_cache.py) and fill it "
+                             "(default: cache.columns in the config)")
+    parser.add_argument("--select", action="store_true",
+                        help="Apply the event-level cuts of the config (muon_selection.min_n_muons/max_n_muons, "
+                             "event_selection.min_vertices/max_missing_et) before decoding the kinematics: "
+                             "only passing events are read and written")
+    parser.add_argument("--sample-fraction", type=float, default=None,
+                        help="Keep this fraction of events, chosen by a stable hash of (run, luminosityBlock, event) "
+                             "(default: global.sample_fraction in the config, 1.0 = all); per-event sampling, so at "
+                             "low fractions nearly every cluster is still read: use --entry-stop to read less")
+    parser.add_argument("--compression", choices=parquet_writer.CODECS, default=None,
+                        help="Parquet codec (default: output.parquet.compression in the config, else zstd)")
+    parser.add_argument("--compression-level", type=int, default=None, help="Codec level (zstd 1-22, gzip 1-9, ...)")
+    parser.add_argument("--row-group-size", type=int, default=None, help="Maximum rows per Parquet row group")
+    parser.add_argument("--partition-by", default=None,
+                        help="Hive-partition the Parquet output by this column (e.g. run): <output>/run=<value>/part.parquet "
+                             "(single input file only)")
+    parser.add_argument("--columns", default=None,
+                        help="Comma-separated output columns to compute, e.g. 'event,n_mu,mean_mu_pt' (default: all of the mode); "
+                             "only the branches they need are decoded")
+    parser.add_argument("--cartesian", action="store_true",
+                        help="per_particle / per_event_jagged: also write float32 mu_px, mu_py, mu_pz, mu_p and the float64 "
+                             "unit vector mu_ux, mu_uy, mu_uz, so analysis.py computes pair angles as a dot product")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="Print the read plan (branches, compressed/uncompressed bytes, baskets) and exit without decoding")
+    parser.add_argument("--collections", default=None,
+                        help="per_particle: comma-separated collections extracted in one pass, e.g. 'Muon,Electron,Jet' "
+                             "(one output table per collection: <output stem>_<collection>.parquet)")
+    parser.add_argument("--collection-vars", action="append", default=[],
+                        help="Variables of one collection, e.g. 'Jet=pt,eta,phi,mass' (repeatable; default pt,eta,phi)")
     args = parser.parse_args()
 
-    inp = Path(args.input)
-    if not inp.exists():
-        raise SystemExit(f"Input file not found: {inp}")
+    inputs = expand_inputs(args.input, args.input_list)
+    if not inputs:
+        raise SystemExit("No input files given (use --input and/or --input-list).")
+    missing = [str(p) for p in inputs if not p.exists()]
+    if missing:
+        raise SystemExit(f"Input file not found: {', '.join(missing)}")
 
     outp = Path(args.output)
     outp.parent.mkdir(parents=True, exist_ok=True)
-    if outp.exists() and not args.force:
-        raise SystemExit(f"Output exists: {outp}. Use --force to overwrite.")
-
-    # provenance
-    prov = {
-        "input_path": str(inp),
-        "input_sha256": sha256_of_file(inp),
-        "mode": args.mode,
-        "entry_stop": args.entry_stop,
-    }
-
-    # open file and choose tree
-    f = uproot.open(str(inp))
-    tree_name = args.tree or detect_tree(str(inp))
-    if tree_name is None:
-        raise SystemExit("No tree detected in ROOT file.")
-    tree = f[tree_name]
-
-    if args.mode == "per_event":
-        df = per_event_summary(tree, entry_stop=args.entry_stop)
-    else:
-        df = per_particle_table(tree, entry_stop=args.entry_stop)
-
-    # save output
-    if outp.suffix.lower() in [".parquet", ".pq"]:
-        df.to_parquet(outp, index=False)
-    else:
-        df.to_csv(outp, index=False)
+    is_parquet = outp.suffix.lower() in [".parquet", ".pq"]
+    if args.mode == "per_event_jagged" and not is_parquet:
+        raise SystemExit("--mode per_event_jagged writes list-typed Parquet columns; use a .parquet output path.")
+    if args.stream and not is_parquet:
+        raise SystemExit("--stream writes Parquet row groups; use a .parquet output path.")
+    if len(inputs) > 1 and not is_parquet:
+        raise SystemExit("Several inputs are written as a Parquet dataset directory; use a .parquet output path.")
+    step_size = int(args.step_size) if str(args.step_size).isdigit() else args.step_size
+    try:
+        collections = parse_collections(args.collections, args.collection_vars) if args.collections else None
+        shard = sharding.parse_shard(args.shard) if args.shard else None
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if shard and len(inputs) > 1:
+        raise SystemExit("--shard splits one tree; give a single input file.")
+    try:
+        config = selection.load_config(args.config)
+    except (FileNotFoundError, RuntimeError) as e:
+        raise SystemExit(f"Could not load config: {e}")
+    column_cache.configure_from(config, args.column_cache)
+    array_cache.configure_from(config)
+    coalesced_io.configure(config)
+    gz_cache.configure_from(config)
+    threads = parallel_io.resolve_threads(args.threads, config)
+    try:
+        sample_fraction = selection.resolve_sample_fraction(args.sample_fraction, config)
+        writer_opts = parquet_writer.writer_options(config, compression=args.compression,
+                                                    compression_level=args.compression_level,
+                                                    row_group_size=args.row_group_size, partition_by=args.partition_by)
+    except ValueError as e:
+        raise SystemExit(str(e))
+    if writer_opts["partition_by"] and not is_parquet:
+        raise SystemExit("--partition-by writes a Hive-partitioned Parquet directory; use a .parquet output path.")
+    if writer_opts["partition_by"] and len(inputs) > 1:
+        raise SystemExit("--partition-by takes a single input file: run it once per file (one --output each).")
+    columns = column_plan.parse_columns(args.columns)
+    if args.cartesian:
+        if collections:
+            raise SystemExit("--cartesian adds muon table columns; it does not combine with --collections.")
+        try:
+            columns = column_plan.with_cartesian(args.mode, columns)
+        except ValueError as e:
+            raise SystemExit(str(e))
+    if args.dry_run:
+        try:
+            for inp in inputs:
+                print(dry_run(inp, mode=args.mode, tree=args.tree, entry_start=args.entry_start, entry_stop=args.entry_stop,
+                              config=config if args.select else None, sample_fraction=sample_fraction, columns=columns,
+                              collections=collections))
+        except (RuntimeError, ValueError) as e:
+            raise SystemExit(str(e))
+        return
+    split = collections if args.mode == "per_particle" else None  # one output per collection
+    existing = [str(p) for p in (collection_outputs(outp, split).values() if split else [outp]) if p.exists()]
+    if existing and not args.force:
+        raise SystemExit(f"Output exists: {', '.join(existing)}. Use --force to overwrite.")
+    # several .root.gz inputs: decompress them concurrently up front (later stages reuse the copies)
+    gz_cache.prepare(inputs)
+    kwargs = dict(mode=args.mode, tree=args.tree, entry_stop=args.entry_stop, stream=args.stream, step_size=step_size,
+                  collections=collections, entry_start=args.entry_start, shard=shard, threads=threads,
+                  decompression_threads=parallel_io.resolve_threads(args.decompression_threads, config, "decompression_threads"),
+                  interpretation_threads=parallel_io.resolve_threads(args.interpretation_threads, config, "interpretation_threads"),
+                  config=config if args.select else None, writer_opts=writer_opts, sample_fraction=sample_fraction,
+                  columns=columns)
+
+    try:
+        if len(inputs) == 1:
+            for target in (collection_outputs(outp, split).values() if split else [outp]):
+                if target.is_dir():  # previous partitioned / dataset output
+                    shutil.rmtree(target)
+            prov = process_file(inputs[0], outp, **kwargs)
+        else:
+            targets = collection_outputs(outp, split).values() if split else [outp]
+            for target in targets:
+                if target.is_dir():
+                    shutil.rmtree(target)
+                elif target.exists():
+                    target.unlink()
+            files = process_dataset(inputs, outp, workers=args.workers, **kwargs)
+            prov = {
+                "mode": args.mode,
+                "entry_start": args.entry_start,
+                "entry_stop": args.entry_stop,
+                "stream": args.stream,
+                "step_size": step_size if args.stream else None,
+                "workers": args.workers,
+                "sample_fraction": sample_fraction,
+                "n_files": len(files),
+                "n_rows": sum(p.get("n_rows", 0) for p in files),
+                "sketches": sketches.merge_dicts(p.get("sketches") for p in files),
+                "files": files,
+            }
+            if args.mode == "counts":
+                prov.update(sketches.count_summary(prov["sketches"]))
+    except (RuntimeError, ValueError) as e:
+        raise SystemExit(str(e))
 
     # save provenance
     prov_path = outp.with_suffix(outp.suffix + ".provenance.json")
     with open(prov_path, "w") as fh:
         json.dump(prov, fh, indent=2)
 
-    print("Wrote:", outp)
+    if args.mode == "counts":
+        print("Muon multiplicity (n_mu: events):", ", ".join(f"{n}: {c}" for n, c in prov["multiplicity"].items()))
+        print("Passing min_n_muons >= k (k: events):", ", ".join(f"{k}: {c}" for k, c in prov["pass_counts"].items()))
+    for target in (collection_outputs(outp, split).values() if split else [outp]):
+        print("Wrote:", target)
     print("Provenance written to:", prov_path)
 
 
@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+src/digest_cache.py
+
+SHA-256 digests of input files with a persistent cache keyed by (path, inode, size, mtime_ns),
+so unchanged inputs are hashed only once across data_preprocessing, analysis and verify_manifest.
+
+ - cached_sha256(path): digest from the cache, or hash the file and record it.
+ - lookup_sha256(path): cache lookup only (None on miss), never reads the file.
+ - record_sha256(key, digest): store a digest computed while streaming the file for another purpose.
+ - sha256_in_background(path): concurrent.futures.Future; the file is hashed in a background
+   thread (hashlib releases the GIL on large blocks) so callers can overlap it with ROOT decoding;
+   concurrent callers share the Future of a hash already in flight.
+
+Cache entries: <cache dir>/digests/<key>.json (cache dir: $HGRF_CACHE_DIR, default .hgrf_cache).
+"""
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("HGRF_CACHE_DIR", ".hgrf_cache"))
+HASH_BLOCK_SIZE = 1 << 20
+
+# in-flight background hashes: (stat_key, cache dir) -> Future
+_PENDING = {}
+_PENDING_LOCK = threading.Lock()
+
+
+def sha256_of_file(path, block_size=65536):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def stat_key(path):
+    """(resolved path, inode, size, mtime_ns) of a file: changes whenever the file is replaced or rewritten."""
+    p = Path(path).resolve()
+    st = p.stat()
+    return str(p), st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def _entry_path(key, cache_dir=None):
+    name = hashlib.sha1("|".join(str(k) for k in key).encode()).hexdigest()
+    return Path(cache_dir or CACHE_DIR) / "digests" / f"{name}.json"
+
+
+def lookup_sha256(path, cache_dir=None):
+    """Cached digest of path if its (path, inode, size, mtime_ns) key is known, else None."""
+    try:
+        key = stat_key(path)
+        entry = json.loads(_entry_path(key, cache_dir).read_text())
+    except (OSError, ValueError):
+        return None
+    if [entry.get("path"), entry.get("inode"), entry.get("size"), entry.get("mtime_ns")] != list(key):
+        return None
+    return entry.get("sha256")
+
+
+def cached_sha256(path, cache_dir=None):
+    """SHA-256 of path, served from the stat-keyed cache when the file is unchanged."""
+    digest = lookup_sha256(path, cache_dir)
+    if digest is not None:
+        return digest
+    key = stat_key(path)
+    digest = sha256_of_file(path, block_size=HASH_BLOCK_SIZE)
+    if stat_key(path) != key:
+        # file changed while hashing: return the digest but do not record it
+        return digest
+    record_sha256(key, digest, cache_dir)
+    return digest
+
+
+def record_sha256(key, digest, cache_dir=None):
+    """Record the digest of a file hashed elsewhere (e.g. while streaming it), under its stat_key taken before reading."""
+    p = _entry_path(key, cache_dir)
+    try:
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_suffix(f".json.tmp{os.getpid()}.{threading.get_ident()}")
+        tmp.write_text(json.dumps({"path": key[0], "inode": key[1], "size": key[2], "mtime_ns": key[3], "sha256": digest}))
+        os.replace(tmp, p)
+    except OSError:
+        pass  # read-only cache dir: the digest is simply not cached
+
+
+def sha256_in_background(path, cache_dir=None):
+    """
+    Start hashing path in a background thread and return a Future with the hex digest.
+    The Future is already resolved when the digest is cached; while a file is being hashed, later
+    calls for it return the same in-flight Future instead of hashing it again.
+    """
+    fut = Future()
+    digest = lookup_sha256(path, cache_dir)
+    if digest is not None:
+        fut.set_result(digest)
+        return fut
+    try:
+        key = (stat_key(path), str(cache_dir or CACHE_DIR))
+    except OSError:
+        key = None  # missing file: the Future carries the error
+    if key is not None:
+        with _PENDING_LOCK:
+            pending = _PENDING.get(key)
+            if pending is not None:
+                return pending
+            _PENDING[key] = fut
+
+    def run():
+        try:
+            fut.set_result(cached_sha256(path, cache_dir))
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with _PENDING_LOCK:
+                _PENDING.pop(key, None)
+
+    threading.Thread(target=run, name=f"sha256:{Path(path).name}", daemon=True).start()
+    return fut
@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+"""
+src/dtype_policy.py
+
+Política de tipos: las columnas conservan el ancho nativo de NanoAOD de extremo a extremo
+(preprocesado, Parquet, lectura de tablas en analysis.py y kernel angular):
+ - cinemática (pt, eta, phi, ...): float32
+ - run / luminosityBlock: uint32; event: uint64 (sin riesgo de overflow en int64 ni pérdida en float)
+ - multiplicidades (n_mu, n_pairs): int32
+
+float64 (ACCUMULATOR) solo se usa donde la acumulación lo necesita: medias por evento y estadística
+(src/stats.py), y en los vectores unitarios mu_ux/mu_uy/mu_uz (--cartesian), que alimentan arccos en
+pares casi colineales: en float32 el ángulo se desviaría ~0.01°. La cinemática nunca se reduce (un fichero con ramas float64 las conserva), solo se evita
+ensancharla; las columnas que no están en la tabla conservan el tipo con el que llegan.
+"""
+import numpy as np
+
+ID_DTYPES = {"run": np.uint32, "luminosityBlock": np.uint32, "event": np.uint64}
+KINEMATIC_DTYPE = np.float32
+COUNT_DTYPE = np.int32
+ACCUMULATOR = np.float64
+UNIT_VECTOR_DTYPE = ACCUMULATOR
+
+# integer columns cast exactly (lossless)
+COLUMN_DTYPES = dict(ID_DTYPES, n_mu=COUNT_DTYPE, n_pairs=COUNT_DTYPE)
+# float columns read back from CSV (text has no width): mu_pt, electron_eta, jet_mass, mean_mu_pt, angle_deg, ...
+KINEMATIC_SUFFIXES = ("_pt", "_eta", "_phi", "_mass", "angle_deg", "_px", "_py", "_pz", "_p")
+UNIT_VECTOR_SUFFIXES = ("_ux", "_uy", "_uz")
+
+
+def column_dtype(name):
+    """Integer storage dtype of a table column under the policy, or None (keep the incoming dtype)."""
+    return np.dtype(COLUMN_DTYPES[name]) if name in COLUMN_DTYPES else None
+
+
+def id_array(name, values):
+    """Event identifier column in its native width (run/lumi uint32, event uint64)."""
+    return np.asarray(values).astype(ID_DTYPES[name], copy=False)
+
+
+def cast_columns(columns):
+    """Cast the id/count columns of a {name: array} dict (or DataFrame) to the policy dtypes; others are left as they are."""
+    for name in list(columns.keys()):
+        dtype = column_dtype(name)
+        if dtype is not None and columns[name].dtype != dtype:
+            columns[name] = np.asarray(columns[name]).astype(dtype)
+    return columns
+
+
+def csv_dtypes(columns):
+    """dtype= mapping for pandas.read_csv so CSV tables come back in the native widths (ids, counts, float32 kinematics)."""
+    dtypes = {}
+    for c in columns:
+        if column_dtype(c) is not None:
+            dtypes[c] = column_dtype(c)
+        elif c.endswith(KINEMATIC_SUFFIXES):
+            dtypes[c] = np.dtype(KINEMATIC_DTYPE)
+        elif c.endswith(UNIT_VECTOR_SUFFIXES):
+            dtypes[c] = np.dtype(UNIT_VECTOR_DTYPE)
+    return dtypes
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+"""
+src/gz_cache.py
+
+Entradas .root.gz transparentes: uproot no puede hacer seek dentro de un gzip, así que cada
+fichero se descomprime una sola vez (en streaming, sin cargarlo en memoria) a una copia local
+sin comprimir, indexada por el SHA-256 del .gz, y se reutiliza en todas las etapas y ejecuciones.
+
+ - local_path(path): ruta ROOT legible por uproot (la propia ruta si no es .gz). El SHA-256 del
+   .gz se calcula mientras se descomprime (una sola lectura) y se guarda en digest_cache, así que
+   las siguientes llamadas solo hacen stat.
+ - source_digest(path): para una copia descomprimida, el SHA-256 del .gz (el nombre del fichero);
+   column_cache y schema_catalog lo usan como clave en vez de hashear de nuevo la copia.
+ - prepare(paths, workers): descomprime varios ficheros en paralelo (zlib libera el GIL).
+ - data_preprocessing.py, analysis.py y skim.py aceptan .root.gz; la provenance conserva la ruta
+   y el hash del .gz ("input_path", "input_sha256") y anota la copia usada ("decompressed_path").
+
+Entradas: <cache dir>/gunzip/<sha256>.root (cache dir: $HGRF_CACHE_DIR, por defecto .hgrf_cache).
+Tamaño máximo: cache.gunzip_max_mb en config/selection.yaml (o $HGRF_GUNZIP_CACHE_MAX_MB); se borran
+primero las copias usadas hace más tiempo.
+
+Uso:
+  python src/gz_cache.py info
+  python src/gz_cache.py prepare data/raw/*.root.gz --workers 4
+  python src/gz_cache.py clear
+  python src/gz_cache.py trim --max-mb 10000
+"""
+import argparse
+import gzip
+import hashlib
+import os
+import shutil
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+try:  # executed as a script: python src/gz_cache.py
+    import digest_cache
+except ImportError:  # imported as src.gz_cache
+    from src import digest_cache
+
+CACHE_DIR = Path(os.environ.get("HGRF_CACHE_DIR", ".hgrf_cache"))
+DEFAULT_MAX_MB = 20480
+COPY_BLOCK_SIZE = 1 << 20
+
+_STATE = {"max_bytes": int(float(os.environ.get("HGRF_GUNZIP_CACHE_MAX_MB", DEFAULT_MAX_MB)) * 2**20)}
+
+
+def gunzip_dir(cache_dir=None):
+    return Path(cache_dir or CACHE_DIR) / "gunzip"
+
+
+def source_digest(path, cache_dir=None):
+    """SHA-256 of the .gz a decompressed copy was made from (its file name), or None for any other path."""
+    p = Path(path)
+    if p.suffix != ".root" or len(p.stem) != 64 or p.parent.resolve() != gunzip_dir(cache_dir).resolve():
+        return None
+    return p.stem if all(c in "0123456789abcdef" for c in p.stem) else None
+
+
+def configure(max_mb=None):
+    """Size cap of the decompressed copies (also exported to worker processes)."""
+    if max_mb is not None:
+        _STATE["max_bytes"] = int(float(max_mb) * 2**20)
+        os.environ["HGRF_GUNZIP_CACHE_MAX_MB"] = str(max_mb)
+
+
+def configure_from(config=None):
+    configure(((config or {}).get("cache") or {}).get("gunzip_max_mb") or DEFAULT_MAX_MB)
+
+
+def is_gzip(path):
+    return Path(path).suffix.lower() == ".gz"
+
+
+class _HashingReader:
+    """Read-only file wrapper hashing every byte read (GzipFile reads its input sequentially, once)."""
+
+    def __init__(self, fh):
+        self._fh = fh
+        self.sha = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self._fh.read(size)
+        self.sha.update(data)
+        return data
+
+    def readable(self):
+        return True
+
+    def __getattr__(self, name):
+        return getattr(self._fh, name)
+
+
+def _decompress(path, cache_dir=None):
+    """Stream path through gzip into the cache; returns (sha256 of the .gz, decompressed path)."""
+    key = digest_cache.stat_key(path)
+    out_dir = gunzip_dir(cache_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    tmp = out_dir / f".tmp{os.getpid()}.{threading.get_ident()}.root"
+    try:
+        with open(path, "rb") as raw, open(tmp, "wb") as out:
+            reader = _HashingReader(raw)
+            with gzip.GzipFile(fileobj=reader, mode="rb") as gz:
+                shutil.copyfileobj(gz, out, COPY_BLOCK_SIZE)
+            # trailing bytes after the last gzip member still belong to the file hash
+            for block in iter(lambda: reader.read(COPY_BLOCK_SIZE), b""):
+                pass
+        digest = reader.sha.hexdigest()
+        target = out_dir / f"{digest}.root"
+        if target.exists():
+            tmp.unlink()
+        else:
+            os.replace(tmp, target)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    if digest_cache.stat_key(path) == key:
+        digest_cache.record_sha256(key, digest, cache_dir)
+    return digest, target
+
+
+def local_path(path, cache_dir=None):
+    """Uncompressed ROOT file for path: path itself, or its cached decompressed copy (created on first use)."""
+    if not is_gzip(path):
+        return Path(path)
+    digest = digest_cache.lookup_sha256(path, cache_dir)
+    if digest is not None:
+        target = gunzip_dir(cache_dir) / f"{digest}.root"
+        if target.exists():
+            os.utime(target)  # LRU: last use
+            return target
+    _, target = _decompress(path, cache_dir)
+    trim(keep=target, cache_dir=cache_dir)
+    return target
+
+
+def prepare(paths, workers=None, cache_dir=None):
+    """local_path of several inputs, the .gz ones decompressed concurrently (default: one thread per file, up to the CPUs)."""
+    gz = [p for p in paths if is_gzip(p)]
+    if len(gz) > 1:
+        workers = workers or min(len(gz), os.cpu_count() or 1)
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gunzip") as pool:
+            resolved = dict(zip(gz, pool.map(lambda p: local_path(p, cache_dir), gz)))
+    else:
+        resolved = {p: local_path(p, cache_dir) for p in gz}
+    return [resolved.get(p, Path(p)) for p in paths]
+
+
+def entries(cache_dir=None):
+    """[(path, bytes, last use), ...] of the decompressed copies."""
+    out = []
+    for p in gunzip_dir(cache_dir).glob("*.root"):
+        try:
+            st = p.stat()
+        except OSError:
+            continue
+        out.append((p, st.st_size, st.st_mtime))
+    return out
+
+
+def trim(max_bytes=None, keep=None, cache_dir=None):
+    """Remove least recently used copies (never keep) until the total fits in max_bytes; returns the number removed."""
+    max_bytes = _STATE["max_bytes"] if max_bytes is None else max_bytes
+    found = sorted(entries(cache_dir), key=lambda e: e[2])
+    total = sum(e[1] for e in found)
+    removed = 0
+    for p, size, _ in found:
+        if total <= max_bytes:
+            break
+        if keep is not None and p == Path(keep):
+            continue
+        p.unlink(missing_ok=True)
+        total -= size
+        removed += 1
+    return removed
+
+
+def clear(cache_dir=None):
+    found = entries(cache_dir)
+    for p, _, _ in found:
+        p.unlink(missing_ok=True)
+    return len(found)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Manage the decompressed copies of .root.gz inputs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("info", help="Copies and size")
+    p_prep = sub.add_parser("prepare", help="Decompress inputs ahead of the first stage")
+    p_prep.add_argument("inputs", nargs="+")
+    p_prep.add_argument("--workers", type=int, default=None, help="Parallel decompressions (default: one per file, up to the CPUs)")
+    sub.add_parser("clear", help="Remove all copies")
+    p_trim = sub.add_parser("trim", help="Remove least recently used copies down to a size")
+    p_trim.add_argument("--max-mb", type=float, default=DEFAULT_MAX_MB)
+    args = parser.parse_args()
+
+    if args.command == "prepare":
+        for src, dst in zip(args.inputs, prepare(args.inputs, args.workers)):
+            print(f"{src} -> {dst}")
+        return
+    if args.command == "clear":
+        print(f"Removed {clear()} copies from {gunzip_dir()}")
+        return
+    if args.command == "trim":
+        n = trim(int(args.max_mb * 2**20))
+        print(f"Removed {n} copies; cache size now {sum(e[1] for e in entries()) / 2**20:.1f} MB")
+        return
+    found = entries()
+    print("Cache dir:", gunzip_dir())
+    print(f"Copies: {len(found)}  size: {sum(e[1] for e in found) / 2**20:.1f} MB  cap: {_STATE['max_bytes'] / 2**20:.0f} MB")
+    for p, size, _ in sorted(found, key=lambda e: -e[2]):
+        print(f"  {p.name}  {size / 2**20:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+src/kinematics.py
+
+Componentes cartesianas por partícula a partir de (pt, eta, phi), calculadas una vez:
+ - px = pt·cos(phi), py = pt·sin(phi), pz = pt·sinh(eta), p = |p| = pt·cosh(eta)
+ - vector unitario: ux = cos(phi)/cosh(eta), uy = sin(phi)/cosh(eta), uz = tanh(eta)
+   (no depende de pt: p/|p| con pt > 0)
+
+data_preprocessing.py --cartesian las escribe como columnas (mu_px, mu_py, mu_pz, mu_p en float32;
+mu_ux, mu_uy, mu_uz en float64, calculadas desde eta/phi en float64); analysis.py usa mu_ux/mu_uy/mu_uz si la tabla las trae, y el ángulo de un par
+es entonces arccos(clip(u0·u1)) sin senos, cosenos ni normas por par (producto escalar y arccos en float64).
+"""
+import numpy as np
+
+try:
+    import awkward as ak
+except Exception:
+    ak = None
+
+CARTESIAN = ("px", "py", "pz", "p")
+UNIT = ("ux", "uy", "uz")
+# logical inputs (alias keys) of each component
+INPUTS = {"px": ("pt", "phi"), "py": ("pt", "phi"), "pz": ("pt", "eta"), "p": ("pt", "eta"),
+          "ux": ("eta", "phi"), "uy": ("eta", "phi"), "uz": ("eta",)}
+
+
+def components(wanted, pt=None, eta=None, phi=None, dtype=np.float32):
+    """
+    {component: array} for the wanted components (CARTESIAN + UNIT) of jagged or flat pt/eta/phi,
+    computed in the input precision and stored as dtype (None: input precision). cos/sin(phi) and
+    cosh(eta) are evaluated once and shared by all the components that need them.
+    """
+    need = set(wanted)
+    cos_phi = np.cos(phi) if need & {"px", "ux"} else None
+    sin_phi = np.sin(phi) if need & {"py", "uy"} else None
+    cosh_eta = np.cosh(eta) if need & {"p", "ux", "uy"} else None
+    formulas = {
+        "px": lambda: pt * cos_phi,
+        "py": lambda: pt * sin_phi,
+        "pz": lambda: pt * np.sinh(eta),
+        "p": lambda: pt * cosh_eta,
+        "ux": lambda: cos_phi / cosh_eta,
+        "uy": lambda: sin_phi / cosh_eta,
+        "uz": lambda: np.tanh(eta),
+    }
+    out = {}
+    for c in wanted:
+        value = formulas[c]()
+        if dtype is None:
+            out[c] = value
+            continue
+        out[c] = ak.values_astype(value, dtype) if ak is not None and isinstance(value, ak.Array) \
+            else np.asarray(value).astype(dtype, copy=False)
+    return out
+
+
+def unit_vectors(eta, phi, dtype=None):
+    """(ux, uy, uz) of jagged eta/phi, in their precision by default."""
+    u = components(UNIT, eta=eta, phi=phi, dtype=dtype)
+    return u["ux"], u["uy"], u["uz"]
+
+
+def pair_angles(ux, uy, uz):
+    """
+    Angles (degrees) of all particle pairs per event from jagged unit vectors: arccos(clip(u0·u1, -1, 1)).
+    The dot product and arccos run in float64: arccos is ill-conditioned near 0° and 180°. Upcasting
+    cannot restore precision already lost, so the unit vectors must be float64 too (data_preprocessing
+    --cartesian stores them so); float32 vectors shift nearly collinear pairs by ~0.01°.
+    """
+    ux, uy, uz = (ak.values_astype(u, np.float64) for u in (ux, uy, uz))
+    pairs = ak.combinations(ak.zip({"x": ux, "y": uy, "z": uz}), 2, axis=1)
+    u0, u1 = pairs["0"], pairs["1"]
+    cosang = u0["x"] * u1["x"] + u0["y"] * u1["y"] + u0["z"] * u1["z"]
+    cosang = ak.fill_none(cosang, 1.0, axis=-1)
+    cosang = np.minimum(np.maximum(cosang, -1.0), 1.0)
+    return np.degrees(np.arccos(cosang))
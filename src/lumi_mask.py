@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+src/lumi_mask.py
+
+Máscara de luminosidad (good run list / golden JSON de CMS: {"run": [[lumi_ini, lumi_fin], ...]},
+rangos inclusivos).
+
+El JSON se compila una vez en dos arrays ordenados de claves (run << 32 | lumi): inicio y fin de
+cada intervalo, con los intervalos solapados o contiguos de un mismo run ya unidos. Un par
+(run, luminosityBlock) es bueno si la clave cae en un intervalo: un único np.searchsorted vectorizado
+para todos los eventos, sin bucles Python ni diccionarios por evento.
+
+Configuración (config/selection.yaml):
+  flags_and_quality:
+    good_run_list: data/Cert_..._Golden.json   # null: sin máscara
+    ignore_bad_lumi: false                       # true: no aplicar la máscara aunque haya good_run_list
+selection.lumi_cut lo convierte en un corte de evento sobre run / luminosityBlock, que pushdown.py evalúa
+antes de decodificar la cinemática (los clusters sin lumi sections buenas no se leen).
+"""
+import json
+from pathlib import Path
+
+import numpy as np
+
+_MEMO = {}
+
+
+def _keys(run, lumi):
+    run = np.asarray(run).astype(np.uint64)
+    lumi = np.asarray(lumi).astype(np.uint64)
+    return (run << np.uint64(32)) | lumi
+
+
+class LumiMask:
+    """Compiled good-lumi intervals: sorted, disjoint [start, end] keys of (run << 32 | lumi)."""
+
+    def __init__(self, runs):
+        pairs = [(int(run), int(lo), int(hi)) for run, ranges in runs.items() for lo, hi in ranges]
+        if pairs:
+            run, lo, hi = np.array(pairs, dtype=np.uint64).T
+            starts, ends = _keys(run, lo), _keys(run, hi)
+            order = np.argsort(starts, kind="stable")
+            starts, ends = starts[order], ends[order]
+            # merge overlapping / adjacent intervals: a new interval starts where it begins after every previous end + 1
+            running_end = np.maximum.accumulate(ends)
+            new = np.ones(len(starts), dtype=bool)
+            new[1:] = starts[1:] > running_end[:-1] + np.uint64(1)
+            self.starts = starts[new]
+            self.ends = np.maximum.reduceat(ends, np.flatnonzero(new))
+        else:
+            self.starts = np.zeros(0, dtype=np.uint64)
+            self.ends = np.zeros(0, dtype=np.uint64)
+
+    @classmethod
+    def from_json(cls, path):
+        with open(path) as fh:
+            return cls(json.load(fh))
+
+    def contains(self, run, lumi):
+        """Boolean mask of the (run, luminosityBlock) pairs inside a good interval."""
+        keys = _keys(run, lumi)
+        idx = np.searchsorted(self.starts, keys, side="right") - 1
+        inside = idx >= 0
+        inside[inside] = keys[inside] <= self.ends[idx[inside]]
+        return inside
+
+    def runs(self):
+        """Runs with at least one good lumi section."""
+        return np.unique(self.starts >> np.uint64(32))
+
+    def n_lumis(self):
+        return int(np.sum((self.ends - self.starts).astype(np.int64) + 1))
+
+
+def load(path):
+    """LumiMask of a JSON file, compiled once per (path, mtime) in this process."""
+    p = Path(path).resolve()
+    key = (str(p), p.stat().st_mtime_ns)
+    mask = _MEMO.get(key)
+    if mask is None:
+        mask = _MEMO[key] = LumiMask.from_json(p)
+    return mask
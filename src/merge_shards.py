@@ -0,0 +1,203 @@
+#!/usr/bin/env python3
+"""
+src/merge_shards.py
+
+Combine the N outputs of a --shard i/N run (src/data_preprocessing.py or src/analysis.py) into
+the output a single-process run would have written, byte for byte.
+Parquet files are written with the writer options recorded in the shards' provenance ("parquet":
+codec, level, row group size, dictionary columns, statistics; see src/parquet_writer.py).
+
+Shards are ordered by the "shard" entry of their .provenance.json sidecars (falling back to the
+command-line order) and must cover 0..N-1 exactly. The writer matches the original run:
+ - streamed Parquet (--stream): row groups are copied in order with the same writer settings;
+ - in-memory Parquet: the tables are concatenated and written once, as the single run does;
+ - Hive-partitioned outputs (--partition-by): each partition file is merged as above;
+ - CSV: rows are concatenated below a single header.
+Multi-collection outputs (--collections) are merged per collection.
+
+Usage:
+  python src/merge_shards.py --output results/preprocessed_particles.parquet results/particles.shard*.parquet
+"""
+import argparse
+import glob
+import json
+import shutil
+from pathlib import Path
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except Exception:
+    pa = None
+    pq = None
+
+try:  # executed as a script: python src/merge_shards.py
+    import parquet_writer
+    import sketches
+except ImportError:  # imported as src.merge_shards
+    from src import parquet_writer
+    from src import sketches
+
+
+def provenance_path(path):
+    path = Path(path)
+    return path.with_suffix(path.suffix + ".provenance.json")
+
+
+def read_provenance(path):
+    p = provenance_path(path)
+    return json.loads(p.read_text()) if p.exists() else {}
+
+
+def order_shards(paths):
+    """[(path, provenance), ...] sorted by shard index; checks that shards 0..N-1 are all present once."""
+    items = [(Path(p), read_provenance(p)) for p in paths]
+    shards = [prov.get("shard") for _, prov in items]
+    if not any(shards):
+        return items
+    if not all(shards):
+        raise ValueError("Mixed inputs: some outputs have no shard provenance.")
+    counts = {s["count"] for s in shards}
+    if len(counts) != 1:
+        raise ValueError(f"Outputs come from different shard counts: {sorted(counts)}")
+    count = counts.pop()
+    indices = sorted(s["index"] for s in shards)
+    if indices != list(range(count)):
+        raise ValueError(f"Expected shards 0..{count - 1} exactly once, got {indices}")
+    return sorted(items, key=lambda item: item[1]["shard"]["index"])
+
+
+def merge_csv(parts, output):
+    with open(output, "wb") as out:
+        for k, part in enumerate(parts):
+            with open(part, "rb") as fh:
+                header = fh.readline()
+                if k == 0:
+                    out.write(header)
+                shutil.copyfileobj(fh, out)
+
+
+def merge_parquet_row_groups(parts, output, options=None):
+    """Copy every row group of every part, in order, into one file (streamed outputs)."""
+    if pq is None:
+        raise RuntimeError("Merging streamed Parquet outputs requires pyarrow (pip install pyarrow).")
+    with parquet_writer.TableWriter(output, options) as writer:
+        for part in parts:
+            pf = pq.ParquetFile(str(part))
+            for i in range(pf.num_row_groups):
+                writer.write(pf.read_row_group(i))
+
+
+def merge_parquet_tables(parts, output, options=None):
+    """Concatenate the parts and write them once (outputs written in one go: per_event, per_particle, per_event_jagged)."""
+    if pq is None:
+        raise RuntimeError("Merging Parquet outputs requires pyarrow (pip install pyarrow).")
+    tables = [pq.read_table(str(p)) for p in parts]
+    parquet_writer.write_table(pa.concat_tables(tables).combine_chunks(), output, options)
+
+
+def merge_parquet_files(parts, output, streamed=False, options=None):
+    if streamed:
+        merge_parquet_row_groups(parts, output, options)
+    else:
+        merge_parquet_tables(parts, output, options)
+
+
+def merge_files(parts, output, streamed=False, options=None):
+    """Merge the parts into output; options: parquet_writer options of the shards (partition_by: directories)."""
+    output = Path(output)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    options = options or parquet_writer.writer_options()
+    if output.suffix.lower() not in [".parquet", ".pq"]:
+        merge_csv(parts, output)
+    elif options.get("partition_by"):
+        # partitioned outputs: merge every partition file across the shards that have it
+        file_opts = dict(options, partition_by=None)
+        rels = dict.fromkeys(rel for part in parts for rel in parquet_writer.partition_files(part))
+        output.mkdir(parents=True, exist_ok=True)
+        for rel in sorted(rels):
+            sub = [Path(part) / rel for part in parts if (Path(part) / rel).exists()]
+            (output / rel).parent.mkdir(parents=True, exist_ok=True)
+            merge_parquet_files(sub, output / rel, streamed, file_opts)
+    else:
+        merge_parquet_files(parts, output, streamed, options)
+
+
+def collection_output(outp, collection):
+    outp = Path(outp)
+    return outp.with_name(f"{outp.stem}_{collection}{outp.suffix}")
+
+
+def merged_provenance(items, output):
+    """Provenance of the merged output: shard 0's record with the combined entry range, row counts and sketches."""
+    provs = [prov for _, prov in items]
+    merged = {k: v for k, v in provs[0].items() if k != "shard"}
+    ranges = [p["entry_range"] for p in provs if p.get("entry_range")]
+    if ranges:
+        merged["entry_range"] = [ranges[0][0], ranges[-1][1]]
+    for key in ("n_rows", "n_chunks"):
+        if all(key in p for p in provs):
+            merged[key] = sum(p[key] for p in provs)
+    if "collections" in merged:
+        merged["collections"] = {
+            c: dict(info, output=str(collection_output(output, c)),
+                    n_rows=sum(p["collections"][c]["n_rows"] for p in provs))
+            for c, info in merged["collections"].items()
+        }
+    if any(p.get("sketches") for p in provs):
+        merged["sketches"] = sketches.merge_dicts(p.get("sketches") for p in provs)
+        if "pass_counts" in merged:  # --mode counts
+            merged.update(sketches.count_summary(merged["sketches"]))
+    if "output" in merged:
+        merged["output"] = str(output)
+    merged["merged_shards"] = [str(path) for path, _ in items]
+    return merged
+
+
+def merge_shards(paths, output):
+    """Merge shard outputs into output; returns the merged provenance dict (also written next to output)."""
+    items = order_shards(paths)
+    if not items:
+        raise ValueError("No shard outputs given.")
+    first = items[0][1]
+    streamed = bool(first.get("stream"))
+    options = parquet_writer.writer_options(**first["parquet"]) if first.get("parquet") else None
+    if first.get("collections"):
+        # multi-collection run: the sidecar sits at the base path, tables are in the per-collection files
+        for c, info in first["collections"].items():
+            parts = [Path(prov["collections"][c]["output"]) for _, prov in items]
+            merge_files(parts, collection_output(output, c), streamed=streamed, options=options)
+    else:
+        merge_files([path for path, _ in items], output, streamed=streamed, options=options)
+    prov = merged_provenance(items, output) if first else {}
+    if prov:
+        with open(provenance_path(output), "w") as fh:
+            json.dump(prov, fh, indent=2)
+    return prov
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Merge --shard i/N outputs into the single-process result.")
+    ap.add_argument("inputs", nargs="+", help="Shard outputs (paths or glob patterns)")
+    ap.add_argument("--output", "-o", required=True, help="Merged output path")
+    ap.add_argument("--force", action="store_true", help="Overwrite output if exists")
+    args = ap.parse_args()
+
+    paths = []
+    for item in args.inputs:
+        paths.extend(sorted(glob.glob(item)) if glob.has_magic(item) else [item])
+    missing = [p for p in paths if not Path(p).exists() and not read_provenance(p).get("collections")]
+    if missing:
+        raise SystemExit(f"Shard output not found: {', '.join(missing)}")
+    out = Path(args.output)
+    if out.exists() and not args.force:
+        raise SystemExit(f"Output exists: {out}. Use --force to overwrite.")
+    try:
+        merge_shards(paths, out)
+    except (ValueError, RuntimeError) as e:
+        raise SystemExit(str(e))
+    print("Merged", len(paths), "shards into:", out)
+
+
+if __name__ == "__main__":
+    main()
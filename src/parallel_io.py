@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+src/parallel_io.py
+
+Multi-threaded ROOT reading on top of uproot:
+ - make_executors: thread pools for uproot's basket decompression and interpretation
+   (decompression_executor / interpretation_executor arguments of TTree.arrays / TBranch.array).
+ - read_ranges: read independent entry ranges concurrently, yielding them in order with a
+   bounded number in flight (decompression in cramjam/zlib/lzma and NumPy interpretation
+   release the GIL, so threads scale on compressed NanoAOD).
+ - read_concurrent: one entry range split into cluster-aligned pieces read at the same time.
+
+All reads go through read_range, which serves decoded branches from the in-process LRU cache
+(src/array_cache.py) and from the on-disk column cache (src/column_cache.py) when it is enabled.
+
+Thread counts come from --threads / --decompression-threads / --interpretation-threads or the
+io block of config/selection.yaml.
+"""
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+try:
+    import awkward as ak
+except Exception:
+    ak = None
+
+try:  # executed as a script from src/
+    import array_cache
+    import column_cache
+    import selection
+    import sharding
+except ImportError:  # imported as src.parallel_io
+    from src import array_cache
+    from src import column_cache
+    from src import selection
+    from src import sharding
+
+
+def resolve_threads(cli_value=None, config=None, key="threads"):
+    """CLI value if given, else the io.<key> entry of the config, else 1 (or the general thread count)."""
+    if cli_value is not None:
+        return max(1, int(cli_value))
+    io = (config or {}).get("io", {}) or {}
+    value = io.get(key)
+    if value is None and key != "threads":
+        value = io.get("threads")
+    return max(1, int(value or 1))
+
+
+def make_executors(threads=1, decompression_threads=None, interpretation_threads=None):
+    """
+    uproot executor keyword arguments; empty dict when single-threaded (uproot's defaults).
+    Call shutdown_executors on the result when done.
+    """
+    decomp = decompression_threads or threads
+    interp = interpretation_threads or threads
+    executors = {}
+    if decomp > 1:
+        executors["decompression_executor"] = ThreadPoolExecutor(decomp, thread_name_prefix="decompress")
+    if interp > 1:
+        executors["interpretation_executor"] = ThreadPoolExecutor(interp, thread_name_prefix="interpret")
+    return executors
+
+
+def shutdown_executors(executors):
+    for ex in (executors or {}).values():
+        ex.shutdown(wait=True)
+
+
+def _read_range(tree, branches, start, stop, executors=None, library="ak"):
+    return tree.arrays(branches, entry_start=start, entry_stop=stop, library=library, how=dict, **(executors or {}))
+
+
+def _read_stored(tree, branches, start, stop, executors=None, library="ak"):
+    if column_cache.enabled():
+        return column_cache.read_range(tree, branches, start, stop, _read_range, executors, library)
+    return _read_range(tree, branches, start, stop, executors, library)
+
+
+def read_range(tree, branches, start, stop, executors=None, library="ak"):
+    """
+    All branches of one entry range in a single tree.arrays call -> {branch: array}.
+    Branches already decoded in this process come from the in-memory cache (array_cache); with the
+    column cache enabled (column_cache.configure) the rest are memory-mapped from disk when stored there.
+    """
+    if array_cache.enabled():
+        return array_cache.read_range(tree, branches, start, stop, _read_stored, executors, library)
+    return _read_stored(tree, branches, start, stop, executors, library)
+
+
+def read_trigger_bits(tree, layout, start, stop, executors=None):
+    """
+    Packed trigger words (selection.pack_triggers) of one entry range. With the column cache enabled the
+    uint64 column (8 bytes per event, whatever the number of HLT_* branches) is stored under
+    selection.trigger_bits_name(layout), so later selections on the file skip the boolean branches.
+    """
+    name = selection.trigger_bits_name(layout)
+
+    def pack(tree, names, start, stop, executors=None, library="np"):
+        return {name: selection.pack_triggers(_read_range(tree, layout, start, stop, executors, "np"), layout)}
+
+    def stored(tree, names, start, stop, executors=None, library="np"):
+        if column_cache.enabled():
+            return column_cache.read_range(tree, names, start, stop, pack, executors, library)
+        return pack(tree, names, start, stop, executors, library)
+
+    if array_cache.enabled():
+        return array_cache.read_range(tree, [name], start, stop, stored, executors, "np")[name]
+    return stored(tree, [name], start, stop, executors)[name]
+
+
+def _read_with_triggers(tree, branches, start, stop, executors=None, library="ak", triggers=None):
+    arrs = read_range(tree, branches, start, stop, executors, library) if branches else {}
+    if triggers:
+        arrs = dict(arrs, **{selection.TRIGGER_BITS: read_trigger_bits(tree, triggers, start, stop, executors)})
+    return arrs
+
+
+def read_ranges(tree, branches, ranges, parallel=1, executors=None, library="ak", triggers=None):
+    """
+    Yield (start, stop, arrays) for each (start, stop) in ranges, in order.
+    With parallel > 1 up to `parallel` ranges are read at the same time (memory: `parallel` chunks).
+    triggers: a selection.trigger_layout; the arrays then also hold its packed words (selection.TRIGGER_BITS).
+    """
+    ranges = list(ranges)
+    if parallel <= 1 or len(ranges) <= 1:
+        for start, stop in ranges:
+            yield start, stop, _read_with_triggers(tree, branches, start, stop, executors, library, triggers)
+        return
+    with ThreadPoolExecutor(parallel, thread_name_prefix="read-range") as pool:
+        pending = deque()
+        it = iter(ranges)
+        for start, stop in it:
+            pending.append((start, stop, pool.submit(_read_with_triggers, tree, branches, start, stop, executors,
+                                                     library, triggers)))
+            if len(pending) >= parallel:
+                break
+        while pending:
+            start, stop, fut = pending.popleft()
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append((nxt[0], nxt[1], pool.submit(_read_with_triggers, tree, branches, nxt[0], nxt[1],
+                                                            executors, library, triggers)))
+            yield start, stop, fut.result()
+
+
+def read_concurrent(tree, branches, entry_start, entry_stop, parallel, clusters=None, executors=None, library="ak"):
+    """
+    Read [entry_start, entry_stop) as about `parallel` cluster-aligned pieces at the same time and
+    concatenate them -> {branch: array}, identical to a single sequential read.
+    """
+    if clusters is None:
+        clusters = tree.common_entry_offsets(filter_name=branches)
+    step = max(1, (entry_stop - entry_start) // max(1, parallel))
+    pieces = sharding.chunk_plan(clusters, entry_start, entry_stop, step)
+    if parallel <= 1 or len(pieces) <= 1:
+        return read_range(tree, branches, entry_start, entry_stop, executors, library)
+    parts = [arrs for _, _, arrs in read_ranges(tree, branches, pieces, parallel, executors, library)]
+    if library == "np":
+        return {b: np.concatenate([p[b] for p in parts]) for b in branches}
+    return {b: ak.concatenate([p[b] for p in parts]) for b in branches}
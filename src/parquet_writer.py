@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+src/parquet_writer.py
+
+Escritura Parquet configurable para las salidas del preprocesado (y merge_shards.py):
+ - codec (zstd / lz4 / snappy / gzip / brotli / none) y nivel de compresión
+ - tamaño de row group (filas)
+ - codificación diccionario solo para las columnas indicadas (por defecto run, luminosityBlock)
+ - estadísticas min/max por row group (los lectores pueden saltar row groups por rango)
+ - partición Hive opcional: <salida>/run=<valor>/part.parquet, para que una lectura por rango de
+   runs solo abra las particiones necesarias (pyarrow.dataset / pandas filters=[("run", ">=", ...)])
+
+Opciones: bloque output.parquet de config/selection.yaml, sobreescrito por la línea de comandos
+(--compression, --compression-level, --row-group-size, --partition-by). Las opciones usadas se
+guardan en la provenance ("parquet") y merge_shards.py las reutiliza.
+"""
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import pyarrow.parquet as pq
+except Exception:
+    pq = None
+
+CODECS = ("zstd", "lz4", "snappy", "gzip", "brotli", "none")
+DEFAULTS = {
+    "compression": "zstd",
+    "compression_level": None,
+    "row_group_size": None,
+    "dictionary_columns": ["run", "luminosityBlock"],
+    "statistics": True,
+    "partition_by": None,
+}
+# file name inside each partition directory
+PART_NAME = "part.parquet"
+
+
+def writer_options(config=None, **overrides):
+    """
+    Writer options: DEFAULTS, then the output.parquet block of the config, then the non-None overrides.
+    Raises ValueError for an unknown codec or a non-positive row group size.
+    """
+    opts = dict(DEFAULTS)
+    block = (((config or {}).get("output") or {}).get("parquet") or {})
+    opts.update({k: v for k, v in block.items() if k in DEFAULTS})
+    opts.update({k: v for k, v in overrides.items() if v is not None})
+    opts["compression"] = str(opts["compression"] or "none").lower()
+    if opts["compression"] not in CODECS:
+        raise ValueError(f"Unknown Parquet codec {opts['compression']!r}; choose one of {', '.join(CODECS)}")
+    if opts["row_group_size"] is not None and int(opts["row_group_size"]) < 1:
+        raise ValueError("row_group_size must be a positive number of rows")
+    return opts
+
+
+def _writer_kwargs(opts, schema):
+    names = set(schema.names)
+    dictionary = [c for c in (opts.get("dictionary_columns") or []) if c in names]
+    return {
+        "compression": opts["compression"],
+        "compression_level": opts.get("compression_level"),
+        "use_dictionary": dictionary or False,
+        "write_statistics": bool(opts.get("statistics", True)),
+    }
+
+
+def split_partitions(table, column):
+    """[(value, sub-table without the column), ...] by ascending value; row order kept inside each partition."""
+    values = table.column(column).to_numpy()
+    order = np.argsort(values, kind="stable")
+    uniq, starts = np.unique(values[order], return_index=True)
+    bounds = list(starts) + [len(order)]
+    rest = table.drop_columns([column])
+    return [(v, rest.take(order[bounds[k]:bounds[k + 1]])) for k, v in enumerate(uniq)]
+
+
+class TableWriter:
+    """
+    Parquet writer applying the writer options to every table written (one call per chunk when
+    streaming: every call adds row groups). With partition_by the output path is a directory and
+    each value gets its own file <path>/<column>=<value>/part.parquet.
+    """
+
+    def __init__(self, path, options=None):
+        if pq is None:
+            raise RuntimeError("Writing Parquet requires pyarrow (pip install pyarrow).")
+        self.path = Path(path)
+        self.options = options or writer_options()
+        self.partition_by = self.options.get("partition_by")
+        self._writers = {}
+        if self.partition_by:
+            self.path.mkdir(parents=True, exist_ok=True)
+
+    def _write(self, path, table):
+        writer = self._writers.get(path)
+        if writer is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            writer = pq.ParquetWriter(str(path), table.schema, **_writer_kwargs(self.options, table.schema))
+            self._writers[path] = writer
+        elif table.schema != writer.schema:
+            table = table.cast(writer.schema)
+        row_group_size = self.options.get("row_group_size")
+        writer.write_table(table, row_group_size=int(row_group_size) if row_group_size else None)
+
+    def write(self, table):
+        if not self.partition_by:
+            self._write(self.path, table)
+            return
+        if self.partition_by not in table.schema.names:
+            raise RuntimeError(f"Cannot partition by {self.partition_by!r}: column not in the output table.")
+        for value, part in split_partitions(table, self.partition_by):
+            self._write(self.path / f"{self.partition_by}={value}" / PART_NAME, part)
+
+    def close(self):
+        for w in self._writers.values():
+            w.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_table(table, path, options=None):
+    """Write one Arrow table with the writer options."""
+    with TableWriter(path, options) as writer:
+        writer.write(table)
+
+
+def partition_files(root):
+    """Data files of a partitioned output directory, as sorted paths relative to it."""
+    root = Path(root)
+    return sorted(p.relative_to(root) for p in root.rglob("*.parquet"))
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+src/pushdown.py
+
+Two-phase (predicate pushdown) reading of a TTree:
+ 1. the cheap scalar cut branches (nMuon, PV_npvs, MET_pt; see selection.event_cuts) are read
+    for the whole entry range and turned into a per-event mask;
+ 2. the expensive jagged branches (Muon_pt/eta/phi, ...) are decoded only for the entry ranges
+    that contain passing events: clusters (common baskets) without any passing event are never
+    read, and each read range is trimmed to the first/last passing event it contains.
+
+The decoded arrays are filtered to the passing events, and the entry numbers of those events
+are returned alongside (used as 'event' when the file has no event branch).
+"""
+import numpy as np
+
+try:
+    import awkward as ak
+except Exception:
+    ak = None
+
+try:  # executed as a script from src/
+    import parallel_io
+    import selection
+    import sharding
+except ImportError:  # imported as src.pushdown
+    from src import parallel_io
+    from src import selection
+    from src import sharding
+
+
+def new_stats():
+    return {"n_events": 0, "n_selected": 0, "entries_decoded": 0, "clusters": 0, "clusters_skipped": 0}
+
+
+def passing_ranges(mask, entry_start, clusters, stats=None):
+    """
+    Entry ranges [(start, stop), ...] to decode for a mask over [entry_start, entry_start + len(mask)):
+    clusters without passing events are dropped, the others trimmed to their first/last passing
+    event; touching pieces of neighbouring clusters are joined into one range.
+    """
+    stop = entry_start + len(mask)
+    pieces = []
+    for a, b in sharding.chunk_plan(clusters, entry_start, stop):
+        idx = np.flatnonzero(mask[a - entry_start:b - entry_start])
+        if stats is not None:
+            stats["clusters"] += 1
+        if len(idx) == 0:
+            if stats is not None:
+                stats["clusters_skipped"] += 1
+            continue
+        lo, hi = a + int(idx[0]), a + int(idx[-1]) + 1
+        if pieces and pieces[-1][1] == lo:
+            pieces[-1] = (pieces[-1][0], hi)
+        else:
+            pieces.append((lo, hi))
+    return pieces
+
+
+def _concat(parts, branches, library):
+    if library == "np":
+        return {b: np.concatenate([p[b] for p in parts]) for b in branches}
+    return {b: ak.concatenate([p[b] for p in parts]) for b in branches}
+
+
+def read_selected(tree, branches, chunks, cuts, clusters, parallel=1, executors=None, library="ak", stats=None):
+    """
+    Yield (start, stop, arrays, entries) for every chunk (start, stop) of `chunks` with at least one
+    event passing `cuts`; arrays hold only the passing events, entries their entry numbers.
+    Chunks without passing events are skipped. stats (see new_stats) is filled in place.
+    """
+    stats = stats if stats is not None else new_stats()
+    # phase 1: scalar cut branches only; trigger / flag branches as one packed uint64 word per event
+    plan = []
+    layout = selection.trigger_layout(cuts)
+    for start, stop, cut_arrs in parallel_io.read_ranges(tree, selection.cut_branches(cuts, packed_triggers=True), chunks,
+                                                         parallel, executors, library="np", triggers=layout):
+        mask = selection.event_mask(cut_arrs, cuts)
+        stats["n_events"] += len(mask)
+        stats["n_selected"] += int(mask.sum())
+        pieces = passing_ranges(mask, start, clusters, stats)
+        if pieces:
+            plan.append((start, stop, mask, pieces))
+    # phase 2: decode the requested branches for the passing ranges only
+    ranges = [piece for *_, pieces in plan for piece in pieces]
+    stats["entries_decoded"] += sum(b - a for a, b in ranges)
+    reader = parallel_io.read_ranges(tree, branches, ranges, parallel, executors, library)
+    for start, stop, mask, pieces in plan:
+        parts, entries = [], []
+        for a, b in pieces:
+            _, _, arrs = next(reader)
+            local = mask[a - start:b - start]
+            parts.append({k: v[local] for k, v in arrs.items()})
+            entries.append(np.arange(a, b)[local])
+        arrs = parts[0] if len(parts) == 1 else _concat(parts, branches, library)
+        yield start, stop, arrs, np.concatenate(entries)
+
+
+def read_selected_all(tree, branches, entry_start, entry_stop, cuts, clusters, parallel=1, executors=None,
+                      library="ak", stats=None):
+    """In-memory variant of read_selected over [entry_start, entry_stop): (arrays, entries) of all passing events."""
+    chunks = sharding.chunk_plan(clusters, entry_start, entry_stop)
+    blocks = list(read_selected(tree, branches, chunks, cuts, clusters, parallel, executors, library, stats))
+    if not blocks:
+        empty = parallel_io.read_range(tree, branches, entry_start, entry_start, executors, library)
+        return empty, np.zeros(0, dtype=np.int64)
+    if len(blocks) == 1:
+        return blocks[0][2], blocks[0][3]
+    return _concat([arrs for _, _, arrs, _ in blocks], branches, library), np.concatenate([e for *_, e in blocks])
@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+src/schema_catalog.py
+
+Persistent catalog of ROOT file schemas, keyed by the file's SHA-256 content hash.
+
+For each file/tree the catalog stores:
+ - tree name (detected once: 'Events' if present, else first TTree)
+ - branch list with typename, uproot interpretation and NumPy dtype
+ - number of entries and cluster (common basket) boundaries
+ - resolved alias map, e.g. pt -> Muon_pt, eta -> Muon_eta, counts -> nMuon
+
+Entries are JSON files under <cache dir>/schema/<sha256>.json (cache dir: $HGRF_CACHE_DIR,
+default .hgrf_cache). Later runs and modules (data_preprocessing, analysis) load the schema
+without re-opening the file's metadata or rescanning branch names.
+
+Usage:
+  python src/schema_catalog.py data/raw/sample.root            # build (if needed) and print summary
+  python src/schema_catalog.py data/raw/sample.root --json     # full schema as JSON
+"""
+import argparse
+import json
+import os
+import threading
+from concurrent.futures import Future
+from pathlib import Path
+
+import numpy as np
+
+# optional import: only needed to build a schema that is not cached yet
+try:
+    import uproot
+except Exception:
+    uproot = None
+
+try:  # executed as a script: python src/schema_catalog.py
+    import digest_cache
+    import gz_cache
+except ImportError:  # imported as src.schema_catalog
+    from src import digest_cache
+    from src import gz_cache
+
+SCHEMA_VERSION = 1
+CACHE_DIR = Path(os.environ.get("HGRF_CACHE_DIR", ".hgrf_cache"))
+
+# in-process memo: (sha256, tree or None) -> schema dict
+_MEMO = {}
+
+
+def schema_dir(cache_dir=None):
+    return Path(cache_dir or CACHE_DIR) / "schema"
+
+
+def strip_cycle(key):
+    """'Events;1' -> 'Events'."""
+    return key.split(";")[0]
+
+
+def detect_tree_name(root_file):
+    """Pick the tree of an open uproot file: prefer 'Events', else the first TTree-like key, else the first key."""
+    keys = [strip_cycle(k) for k in root_file.keys()]
+    if "Events" in keys:
+        return "Events"
+    classnames = root_file.classnames()
+    for k, cname in classnames.items():
+        if "TTree" in str(cname):
+            return strip_cycle(k)
+    return keys[0] if keys else None
+
+
+def resolve_aliases(branches, collection="Muon"):
+    """
+    Map logical names to branch names for one collection (default muons):
+    pt/eta/phi/counts plus the run/luminosityBlock/event identifiers (None if absent).
+    """
+    branches = list(branches)
+    branch_set = set(branches)
+
+    def find(var):
+        exact = f"{collection}_{var}"
+        if exact in branch_set:
+            return exact
+        return next((b for b in branches if collection in b and var in b.lower()), None)
+
+    counter = f"n{collection}"
+    return {
+        "pt": find("pt"),
+        "eta": find("eta"),
+        "phi": find("phi"),
+        "counts": counter if counter in branch_set else None,
+        "run": "run" if "run" in branch_set else None,
+        "luminosityBlock": "luminosityBlock" if "luminosityBlock" in branch_set else None,
+        "event": "event" if "event" in branch_set else None,
+    }
+
+
+def _interpretation_dtype(interp):
+    """NumPy dtype name of a (possibly jagged) uproot interpretation, in native byte order; None if not numeric."""
+    inner = getattr(interp, "content", interp)
+    dtype = getattr(inner, "to_dtype", None)
+    if dtype is None:
+        return None
+    return str(np.dtype(dtype).newbyteorder("="))
+
+
+def describe_tree(tree):
+    """Schema dict for an open uproot TTree (branches, entries, clusters, aliases)."""
+    branches = {}
+    for name, branch in tree.iteritems():
+        try:
+            interp = branch.interpretation
+            interp_repr = repr(interp)
+            dtype = _interpretation_dtype(interp)
+        except Exception:
+            interp_repr = None
+            dtype = None
+        branches[name] = {"typename": branch.typename, "interpretation": interp_repr, "dtype": dtype}
+    try:
+        clusters = [int(x) for x in tree.common_entry_offsets()]
+    except Exception:
+        clusters = [0, int(tree.num_entries)]
+    return {
+        "tree": strip_cycle(tree.name),
+        "num_entries": int(tree.num_entries),
+        "branches": branches,
+        "clusters": clusters,
+        "aliases": resolve_aliases(branches),
+    }
+
+
+def build_schema(path, tree_name=None, sha256=None):
+    """Open the file once and describe the requested (or detected) tree."""
+    if uproot is None:
+        raise RuntimeError("uproot is required to build a ROOT schema. Install with: pip install uproot")
+    with uproot.open(str(path)) as f:
+        name = tree_name or detect_tree_name(f)
+        if name is None:
+            raise RuntimeError(f"No tree detected in ROOT file: {path}")
+        schema = describe_tree(f[name])
+    schema.update({
+        "version": SCHEMA_VERSION,
+        "sha256": sha256,
+        "path": str(path),
+    })
+    return schema
+
+
+def _read_entry(sha256, cache_dir=None):
+    p = schema_dir(cache_dir) / f"{sha256}.json"
+    if not p.exists():
+        return None
+    try:
+        entry = json.loads(p.read_text())
+    except Exception:
+        return None
+    return entry if entry.get("version") == SCHEMA_VERSION else None
+
+
+def _write_entry(entry, cache_dir=None):
+    d = schema_dir(cache_dir)
+    d.mkdir(parents=True, exist_ok=True)
+    p = d / f"{entry['sha256']}.json"
+    tmp = p.with_suffix(f".json.tmp{os.getpid()}.{threading.get_ident()}")
+    tmp.write_text(json.dumps(entry, indent=1))
+    os.replace(tmp, p)
+
+
+def _store(schema, sha256, tree_name=None, cache_dir=None):
+    """Record a freshly built schema under its content hash (on disk and in the memo)."""
+    schema["sha256"] = sha256
+    entry = _read_entry(sha256, cache_dir) or {"version": SCHEMA_VERSION, "sha256": sha256, "default_tree": None, "trees": {}}
+    entry["trees"][schema["tree"]] = schema
+    if tree_name is None:
+        entry["default_tree"] = schema["tree"]
+    _write_entry(entry, cache_dir)
+    _MEMO[(sha256, tree_name)] = schema
+
+
+def load_schema(path, tree_name=None, sha256=None, cache_dir=None, refresh=False):
+    """
+    Return the schema of `tree_name` (default: the detected tree) for a ROOT file.
+
+    sha256 may be a hex digest, a Future from digest_cache.sha256_in_background, or None
+    (digest taken from the stat-keyed digest cache, hashed in the background on a miss; a decompressed
+    .root.gz copy uses the .gz digest it is named after).
+    With a known digest the schema is served from memory or from the on-disk catalog; otherwise
+    it is built (one uproot.open) while the hash runs, and persisted once the digest is available.
+    """
+    if sha256 is None:
+        sha256 = gz_cache.source_digest(path) or digest_cache.sha256_in_background(path)
+    if isinstance(sha256, Future):
+        if not sha256.done():
+            schema = build_schema(path, tree_name=tree_name)
+
+            def persist(fut):
+                if fut.exception() is None:
+                    _store(schema, fut.result(), tree_name, cache_dir)
+
+            sha256.add_done_callback(persist)
+            return schema
+        sha256 = sha256.result()
+
+    key = (sha256, tree_name)
+    if not refresh and key in _MEMO:
+        return _MEMO[key]
+
+    entry = None if refresh else _read_entry(sha256, cache_dir)
+    name = tree_name or (entry or {}).get("default_tree")
+    schema = entry["trees"].get(name) if (entry and name) else None
+    if schema is None:
+        schema = build_schema(path, tree_name=tree_name, sha256=sha256)
+        _store(schema, sha256, tree_name, cache_dir)
+
+    _MEMO[key] = schema
+    return schema
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or show the cached schema of a ROOT file.")
+    parser.add_argument("input", help="ROOT file")
+    parser.add_argument("--tree", "-t", default=None, help="Tree name (default: detect automatically)")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the catalog entry even if cached")
+    parser.add_argument("--json", action="store_true", help="Print the full schema as JSON")
+    args = parser.parse_args()
+
+    schema = load_schema(args.input, tree_name=args.tree, sha256=digest_cache.cached_sha256(args.input), refresh=args.refresh)
+    if args.json:
+        print(json.dumps(schema, indent=2))
+        return
+    print("File:", schema["path"])
+    print("SHA-256:", schema["sha256"])
+    print("Tree:", schema["tree"], "entries:", schema["num_entries"], "branches:", len(schema["branches"]))
+    print("Clusters:", len(schema["clusters"]) - 1)
+    print("Aliases:", json.dumps(schema["aliases"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+"""
+src/selection.py
+
+Carga de config/selection.yaml (cortes de muones/eventos, triggers, calidad y opciones de E/S)
+y cortes a nivel de evento sobre ramas escalares baratas (nMuon, PV_npvs, MET_pt), evaluados
+antes de decodificar la cinemática (ver src/pushdown.py).
+
+Triggers (triggers.require_any / veto_any) y flags (flags_and_quality.require_global_flags) son
+también cortes de evento sobre ramas booleanas; muon_selection (pt, |eta|, aislamiento, IDs) se
+evalúa por muón y el evento pasa si el número de muones buenos está en [min_n_muons, max_n_muons]
+(ver src/skim.py). Las ramas de trigger/flags de los cortes se empaquetan en una palabra uint64 por
+evento (trigger_layout / pack_triggers: bit i = rama i), así que any-of / all-of / veto son una sola
+operación AND por evento; con la caché de columnas activada, parallel_io.read_trigger_bits guarda la
+palabra empaquetada en disco para las selecciones siguientes.
+Si las ramas de ID/ISO tienen otros nombres en tu ROOT, edita MUON_ID_BRANCHES / MUON_ISO_BRANCH.
+
+Good run list (flags_and_quality.good_run_list, JSON de lumi sections certificadas): corte de evento
+sobre (run, luminosityBlock) con un índice de intervalos ordenado (src/lumi_mask.py), evaluado también
+antes de la cinemática; ignore_bad_lumi: true lo desactiva.
+
+Submuestreo determinista (global.sample_fraction): un evento se conserva si el hash estable de
+(run, luminosityBlock, event) cae por debajo de la fracción, de modo que todas las etapas y todas
+las repeticiones eligen exactamente los mismos eventos (y f1 < f2 da un subconjunto).
+Límite: el muestreo es por evento dentro de cada cluster. Un cluster de N eventos contiene algún evento
+muestreado con probabilidad 1 - (1 - f)^N (≈ 1 para f = 0.01 y N ~ 1000), así que casi todos los baskets
+se siguen leyendo y descomprimiendo: se ahorra la decodificación de la cinemática y el tamaño de la
+salida, no la E/S. Para leer menos, limita el rango de entradas (global.entry_stop, --entry-stop, --shard).
+
+Uso (ejemplo):
+  from selection import load_config
+  cfg = load_config("config/selection.yaml")
+  cfg["io"]["threads"]
+"""
+import copy
+import hashlib
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import yaml
+except Exception:
+    yaml = None
+
+# optional import: only the per-muon cuts (jagged arrays) need it
+try:
+    import awkward as ak
+except Exception:
+    ak = None
+
+try:  # executed as a script from src/
+    import lumi_mask
+except ImportError:  # imported as src.selection
+    from src import lumi_mask
+
+DEFAULT_CONFIG_PATH = Path("config/selection.yaml")
+
+# defaults for keys the code reads; values in the YAML override them
+DEFAULTS = {
+    "global": {"entry_stop": None, "sample_fraction": 1.0, "output_format": "parquet"},
+    "io": {"threads": 1, "decompression_threads": None, "interpretation_threads": None,
+           "coalesce_gap_kb": 64, "coalesce_max_request_mb": 64},
+    "cache": {"columns": False, "columns_max_mb": 2048, "memory_mb": None, "gunzip_max_mb": 20480},
+    "skim": {"branches": ["run", "luminosityBlock", "event", "nMuon", "Muon_*"], "output": None},
+}
+
+
+def _merge(base, override):
+    out = copy.deepcopy(base)
+    for k, v in (override or {}).items():
+        if isinstance(v, dict) and isinstance(out.get(k), dict):
+            out[k] = _merge(out[k], v)
+        else:
+            out[k] = v
+    return out
+
+
+def load_config(path=None):
+    """
+    Read the selection YAML (default config/selection.yaml) merged over DEFAULTS.
+    A missing default file yields the defaults; an explicit path must exist.
+    """
+    p = Path(path) if path else DEFAULT_CONFIG_PATH
+    if not p.exists():
+        if path:
+            raise FileNotFoundError(p)
+        return copy.deepcopy(DEFAULTS)
+    if yaml is None:
+        raise RuntimeError("Reading config/selection.yaml requires PyYAML (pip install pyyaml).")
+    with open(p) as fh:
+        data = yaml.safe_load(fh) or {}
+    return _merge(DEFAULTS, data)
+
+
+# event-level cut -> (config section, min key, max key, branch; None: the collection counter from the alias map)
+EVENT_CUTS = {
+    "n_muons": ("muon_selection", "min_n_muons", "max_n_muons", None),
+    "n_vertices": ("event_selection", "min_vertices", None, "PV_npvs"),
+    "missing_et": ("event_selection", None, "max_missing_et", "MET_pt"),
+}
+
+
+def event_cuts(config, aliases, branches=None):
+    """
+    Event-level cuts of the config that only need scalar branches per event:
+    [{"name", "branch", "min", "max"}, ...]. Cuts with no bound set (or min_vertices: 0) are left out.
+    The good run list (lumi_cut), if configured, is appended.
+    Raises RuntimeError if a configured cut has no branch in the file.
+    """
+    branch_set = set(branches) if branches is not None else None
+    cuts = []
+    for name, (section, min_key, max_key, branch) in EVENT_CUTS.items():
+        sec = (config or {}).get(section, {}) or {}
+        lo = sec.get(min_key) if min_key else None
+        hi = sec.get(max_key) if max_key else None
+        if not lo and hi is None:
+            continue
+        branch = branch or aliases.get("counts")
+        if not branch or (branch_set is not None and branch not in branch_set):
+            raise RuntimeError(f"Cut {section}.{min_key or max_key} needs branch {branch or 'nMuon'}, not found in the file.")
+        cuts.append({"name": name, "branch": branch, "min": lo, "max": hi})
+    lumi = lumi_cut(config, aliases, branches)
+    if lumi:
+        cuts.append(lumi)
+    return cuts
+
+
+def lumi_cut(config, aliases, branches=None):
+    """
+    Cut entry for flags_and_quality.good_run_list ({"name": "lumi_mask", "file", "ids": {run, luminosityBlock}}),
+    or None if no list is configured or ignore_bad_lumi is set. The JSON is compiled here once (lumi_mask.load).
+    """
+    quality = (config or {}).get("flags_and_quality") or {}
+    path = quality.get("good_run_list")
+    if not path or quality.get("ignore_bad_lumi"):
+        return None
+    ids = {k: aliases.get(k) for k in ("run", "luminosityBlock")}
+    if not all(ids.values()) or (branches is not None and not set(ids.values()) <= set(branches)):
+        raise RuntimeError("good_run_list needs the run and luminosityBlock branches.")
+    try:
+        lumi_mask.load(path)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(f"Cannot read good_run_list {path}: {e}")
+    return {"name": "lumi_mask", "file": str(path), "ids": ids}
+
+
+def _mix64(x):
+    """splitmix64 finaliser on a uint64 array (wrapping arithmetic)."""
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def event_hash(run, lumi, event):
+    """Stable 64-bit hash of (run, luminosityBlock, event), vectorised; independent of file, entry and process."""
+    run = np.asarray(run).astype(np.uint64)
+    lumi = np.asarray(lumi).astype(np.uint64)
+    event = np.asarray(event).astype(np.uint64)
+    with np.errstate(over="ignore"):
+        return _mix64(_mix64((run << np.uint64(32)) | lumi) ^ event)
+
+
+def sample_mask(run, lumi, event, fraction):
+    """Events kept by a sample_fraction in (0, 1]: hash / 2**64 < fraction."""
+    if fraction >= 1:
+        return np.ones(len(np.asarray(event)), dtype=bool)
+    threshold = np.uint64(int(fraction * 2**53))
+    return (event_hash(run, lumi, event) >> np.uint64(11)) < threshold
+
+
+def resolve_sample_fraction(cli_value=None, config=None):
+    """--sample-fraction if given, else global.sample_fraction of the config (default 1.0); must be in (0, 1]."""
+    value = cli_value if cli_value is not None else ((config or {}).get("global") or {}).get("sample_fraction")
+    value = 1.0 if value is None else float(value)
+    if not 0 < value <= 1:
+        raise ValueError(f"sample_fraction must be in (0, 1], got {value}")
+    return value
+
+
+def sample_cut(fraction, aliases, branches=None):
+    """
+    Cut entry for hash sampling ({"name": "sample", "ids": {...}, "fraction"}), or None for fraction 1.
+    Needs the event branch; run/luminosityBlock count as 0 when absent.
+    """
+    if fraction is None or fraction >= 1:
+        return None
+    ids = {k: aliases.get(k) for k in ("run", "luminosityBlock", "event")}
+    if not ids["event"] or (branches is not None and ids["event"] not in set(branches)):
+        raise RuntimeError("sample_fraction needs the event branch to hash (run, luminosityBlock, event).")
+    return {"name": "sample", "ids": ids, "fraction": float(fraction)}
+
+
+def trigger_cuts(config, branches):
+    """
+    Trigger and quality-flag cuts on boolean event branches:
+     - trigger_any: at least one of triggers.require_any fired (paths missing in the file are ignored,
+       but at least one must exist);
+     - trigger_veto: none of triggers.veto_any fired;
+     - flags: every flags_and_quality.require_global_flags branch is true (all must exist).
+    """
+    branch_set = set(branches)
+    triggers = (config or {}).get("triggers") or {}
+    flags = ((config or {}).get("flags_and_quality") or {}).get("require_global_flags") or []
+    cuts = []
+    required = list(triggers.get("require_any") or [])
+    if required:
+        present = [t for t in required if t in branch_set]
+        if not present:
+            raise RuntimeError(f"None of the required triggers is in the file: {', '.join(required)}")
+        cuts.append({"name": "trigger_any", "branches": present})
+    veto = [t for t in (triggers.get("veto_any") or []) if t in branch_set]
+    if veto:
+        cuts.append({"name": "trigger_veto", "branches": veto})
+    if flags:
+        missing = [f for f in flags if f not in branch_set]
+        if missing:
+            raise RuntimeError(f"Quality flag branches not in the file: {', '.join(missing)}")
+        cuts.append({"name": "flags", "branches": list(flags)})
+    return cuts
+
+
+# boolean branch cuts evaluated on the packed trigger word
+TRIGGER_CUT_NAMES = ("trigger_any", "trigger_veto", "flags")
+TRIGGER_BITS = "trigger_bits"
+MAX_TRIGGER_BITS = 64
+
+
+def trigger_layout(cuts):
+    """Bit order of the packed trigger word: the branches of the trigger / flag cuts (bit i = branch i)."""
+    layout = list(dict.fromkeys(b for c in cuts or [] if c["name"] in TRIGGER_CUT_NAMES for b in c["branches"]))
+    if len(layout) > MAX_TRIGGER_BITS:
+        raise RuntimeError(f"{len(layout)} trigger/flag branches configured; at most {MAX_TRIGGER_BITS} fit the packed word.")
+    return layout
+
+
+def trigger_bits_name(layout):
+    """Cache name of a packed trigger column (the layout is part of the key)."""
+    return f"{TRIGGER_BITS}[{hashlib.sha1(','.join(layout).encode()).hexdigest()[:12]}]"
+
+
+def pack_triggers(arrs, layout):
+    """uint64 word per event from the boolean branches of layout ({branch: flat array}); bit i = layout[i]."""
+    n = len(arrs[layout[0]]) if layout else 0
+    fired = np.stack([np.asarray(arrs[b], dtype=bool) for b in layout], axis=1) if layout else np.zeros((n, 0), bool)
+    words = np.zeros((n, 8), dtype=np.uint8)
+    packed = np.packbits(fired, axis=1, bitorder="little")
+    words[:, :packed.shape[1]] = packed
+    return words.view("<u8").reshape(n).astype(np.uint64, copy=False)
+
+
+def trigger_mask(bits, cut, layout):
+    """Events passing one trigger / flag cut, as a single bitwise test on the packed words."""
+    m = np.uint64(sum(1 << layout.index(b) for b in cut["branches"]))
+    hit = bits & m
+    if cut["name"] == "trigger_any":
+        return hit != 0
+    if cut["name"] == "trigger_veto":
+        return hit == 0
+    return hit == m  # flags: all set
+
+
+def cut_branches(cuts, packed_triggers=False):
+    """Branches the cuts read; packed_triggers: without the trigger / flag branches (read as one packed word)."""
+    names = []
+    for c in cuts:
+        if packed_triggers and c["name"] in TRIGGER_CUT_NAMES:
+            continue
+        if "ids" in c:  # sample, lumi_mask
+            names += [b for b in c["ids"].values() if b]
+        else:
+            names += [c["branch"]] if "branch" in c else list(c["branches"])
+    return list(dict.fromkeys(names))
+
+
+def event_mask(arrs, cuts):
+    """
+    Boolean NumPy mask of the events passing all cuts, from {branch: flat array}. Trigger / flag cuts use
+    arrs[TRIGGER_BITS] (packed words of trigger_layout(cuts)) when present, else pack the raw branches.
+    """
+    mask = None
+    layout = trigger_layout(cuts)
+    bits = None
+    if layout:
+        bits = arrs[TRIGGER_BITS] if TRIGGER_BITS in arrs else pack_triggers(arrs, layout)
+    for c in cuts:
+        if c["name"] == "sample":
+            event = np.asarray(arrs[c["ids"]["event"]])
+            run, lumi = (np.asarray(arrs[b]) if b else np.zeros(len(event), dtype=np.uint64)
+                         for b in (c["ids"]["run"], c["ids"]["luminosityBlock"]))
+            keep = sample_mask(run, lumi, event, c["fraction"])
+        elif c["name"] == "lumi_mask":
+            keep = lumi_mask.load(c["file"]).contains(arrs[c["ids"]["run"]], arrs[c["ids"]["luminosityBlock"]])
+        elif c["name"] in TRIGGER_CUT_NAMES:
+            keep = trigger_mask(bits, c, layout)
+        else:
+            values = np.asarray(arrs[c["branch"]])
+            keep = np.ones(len(values), dtype=bool)
+            if c["min"] is not None:
+                keep &= values >= c["min"]
+            if c["max"] is not None:
+                keep &= values <= c["max"]
+        mask = keep if mask is None else mask & keep
+    return mask
+
+
+# muon ID names of muon_selection.require_id / veto_id -> NanoAOD branches
+MUON_ID_BRANCHES = {
+    "loose": "Muon_looseId",
+    "medium": "Muon_mediumId",
+    "tight": "Muon_tightId",
+    "soft": "Muon_softId",
+    "highPt": "Muon_highPtId",
+}
+MUON_ISO_BRANCH = "Muon_pfRelIso04_all"
+
+
+def muon_object_cuts(config, aliases, branches):
+    """
+    Per-muon cuts of muon_selection: {"pt", "eta", "iso", "require", "veto" (branches), "pt_min", "pt_max",
+    "eta_abs_max", "iso_max", "min_n", "max_n"}. A muon is good if it passes all of them (every
+    require_id, no veto_id); the event needs min_n..max_n good muons. Raises RuntimeError for
+    configured cuts whose branch is not in the file.
+    """
+    sel = (config or {}).get("muon_selection") or {}
+    branch_set = set(branches)
+
+    def id_branch(name):
+        b = MUON_ID_BRANCHES.get(name, f"Muon_{name}Id")
+        if b not in branch_set:
+            raise RuntimeError(f"Muon ID {name!r} needs branch {b}, not found in the file (see selection.MUON_ID_BRANCHES).")
+        return b
+
+    if sel.get("iso_max") is not None and MUON_ISO_BRANCH not in branch_set:
+        raise RuntimeError(f"muon_selection.iso_max needs branch {MUON_ISO_BRANCH}, not found in the file.")
+    return {
+        "pt": aliases.get("pt"),
+        "eta": aliases.get("eta"),
+        "iso": MUON_ISO_BRANCH if sel.get("iso_max") is not None else None,
+        "require": [id_branch(n) for n in sel.get("require_id") or []],
+        "veto": [id_branch(n) for n in sel.get("veto_id") or []],
+        "pt_min": sel.get("pt_min"),
+        "pt_max": sel.get("pt_max"),
+        "eta_abs_max": sel.get("eta_abs_max"),
+        "iso_max": sel.get("iso_max"),
+        "min_n": sel.get("min_n_muons"),
+        "max_n": sel.get("max_n_muons"),
+    }
+
+
+def muon_object_branches(obj):
+    return [b for b in [obj["pt"], obj["eta"], obj["iso"]] + obj["require"] + obj["veto"] if b]
+
+
+def good_muon_counts(arrs, obj):
+    """Number of muons per event passing the per-muon cuts (NumPy int array)."""
+    good = ak.ones_like(arrs[obj["pt"]], dtype=bool)
+    if obj["pt_min"] is not None:
+        good = good & (arrs[obj["pt"]] >= obj["pt_min"])
+    if obj["pt_max"] is not None:
+        good = good & (arrs[obj["pt"]] <= obj["pt_max"])
+    if obj["eta_abs_max"] is not None:
+        good = good & (abs(arrs[obj["eta"]]) <= obj["eta_abs_max"])
+    if obj["iso"]:
+        good = good & (arrs[obj["iso"]] <= obj["iso_max"])
+    for b in obj["require"]:
+        good = good & (arrs[b] > 0)
+    for b in obj["veto"]:
+        good = good & ~(arrs[b] > 0)
+    return ak.to_numpy(ak.sum(good, axis=1))
+
+
+def muon_count_mask(arrs, obj):
+    """Events with min_n..max_n good muons."""
+    n = good_muon_counts(arrs, obj)
+    keep = np.ones(len(n), dtype=bool)
+    if obj["min_n"] is not None:
+        keep &= n >= obj["min_n"]
+    if obj["max_n"] is not None:
+        keep &= n <= obj["max_n"]
+    return keep
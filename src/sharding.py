@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+src/sharding.py
+
+Deterministic, coordination-free splitting of one TTree into entry ranges aligned to its
+cluster (common basket) boundaries, as stored by src/schema_catalog.py.
+
+ - chunk_plan: cut [entry_start, entry_stop) into chunks of about step entries; every cut
+   falls on a cluster boundary, so no basket is decompressed by two chunks.
+ - shard_chunks / shard_range: shard i of N takes a contiguous run of those chunks
+   (--shard i/N). Every node computes the same plan from the same schema, so the shards
+   tile the tree exactly and the merged outputs equal a single-process run (src/merge_shards.py).
+"""
+import numpy as np
+
+
+def parse_shard(spec):
+    """'3/8' -> (3, 8); index is 0-based."""
+    try:
+        i, n = (int(x) for x in str(spec).split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec {spec!r}: expected i/N, e.g. 0/4")
+    if n < 1 or not 0 <= i < n:
+        raise ValueError(f"Invalid shard spec {spec!r}: need 0 <= i < N")
+    return i, n
+
+
+def entry_range(num_entries, entry_start=None, entry_stop=None):
+    """Clamp an (entry_start, entry_stop) request to [0, num_entries]."""
+    start = 0 if entry_start is None else max(0, min(int(entry_start), num_entries))
+    stop = num_entries if entry_stop is None else max(start, min(int(entry_stop), num_entries))
+    return start, stop
+
+
+def chunk_plan(clusters, entry_start, entry_stop, step=None):
+    """
+    Cluster-aligned chunks [(start, stop), ...] covering [entry_start, entry_stop).
+    Each chunk groups whole clusters until it holds at least `step` entries (step=None: one
+    chunk per cluster). Only the first/last chunk can start/end inside a cluster, when the
+    requested range itself does.
+    """
+    if entry_stop <= entry_start:
+        return []
+    inner = [int(c) for c in clusters if entry_start < c < entry_stop]
+    bounds = [entry_start] + inner + [entry_stop]
+    if not step:
+        return list(zip(bounds[:-1], bounds[1:]))
+    chunks = []
+    cur = entry_start
+    for b in bounds[1:]:
+        if b - cur >= step or b == entry_stop:
+            chunks.append((cur, b))
+            cur = b
+    return chunks
+
+
+def shard_chunks(chunks, index, count):
+    """
+    Contiguous run of chunks for shard `index` of `count`: the N-1 cuts are the chunk
+    boundaries closest to equal entry fractions. Shards may be empty if count > len(chunks).
+    """
+    if not chunks:
+        return []
+    bounds = np.array([chunks[0][0]] + [stop for _, stop in chunks])
+    total = bounds[-1] - bounds[0]
+    cuts = [0]
+    for k in range(1, count):
+        target = bounds[0] + total * k / count
+        j = int(np.argmin(np.abs(bounds - target)))
+        cuts.append(max(j, cuts[-1]))
+    cuts.append(len(chunks))
+    return chunks[cuts[index]:cuts[index + 1]]
+
+
+def shard_range(clusters, num_entries, index, count, entry_start=None, entry_stop=None, step=None):
+    """(start, stop) entry range of shard index/count, aligned to the cluster-based chunk plan."""
+    start, stop = entry_range(num_entries, entry_start, entry_stop)
+    mine = shard_chunks(chunk_plan(clusters, start, stop, step), index, count)
+    if not mine:
+        return start, start
+    return mine[0][0], mine[-1][1]
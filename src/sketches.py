@@ -0,0 +1,320 @@
+#!/usr/bin/env python3
+"""
+src/sketches.py
+
+Resúmenes (sketches) combinables de las columnas leídas durante el preprocesado, guardados en la
+provenance ("sketches") para responder al instante a "¿cuántos runs?", "¿cuantiles de pt?" o
+"¿cuántos eventos con ≥2 muones?" sin releer el Parquet:
+ - n_events y, por columna (run, luminosityBlock, event, pt, eta, phi): count / min / max
+ - HyperLogLog (2**12 registros, ~1.6 % de error) de runs y de pares (run, luminosityBlock) distintos
+ - t-digest (compresión 200) de pt / eta / phi: cuantiles con error pequeño en las colas
+ - histograma de multiplicidad de muones (nMuon, o el número de entradas de Muon_pt)
+
+Se calculan sobre los arrays ya decodificados (data_preprocessing.py: cada chunk o la lectura
+completa, tras los cortes), sin I/O extra. Todos se combinan sin perder información relevante:
+merge_dicts une ficheros de un dataset (process_dataset) y shards (merge_shards.py).
+
+Uso:
+  python src/sketches.py results/preprocessed.parquet [otro.parquet ...] [--json]
+"""
+import argparse
+import base64
+import json
+import zlib
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import awkward as ak
+except Exception:
+    ak = None
+
+try:  # executed as a script from src/
+    import selection
+except ImportError:  # imported as src.sketches
+    from src import selection
+
+HLL_PRECISION = 12
+TDIGEST_COMPRESSION = 200
+ID_KEYS = ("run", "luminosityBlock", "event")
+KINEMATIC_KEYS = ("pt", "eta", "phi")
+QUANTILES = (0.01, 0.05, 0.25, 0.5, 0.75, 0.95, 0.99)
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over 64-bit hashes (registers merge by element-wise max)."""
+
+    def __init__(self, precision=HLL_PRECISION, registers=None):
+        self.p = precision
+        self.registers = np.zeros(2**precision, dtype=np.uint8) if registers is None else registers
+
+    def update(self, hashes):
+        h = np.asarray(hashes, dtype=np.uint64)
+        if not len(h):
+            return
+        idx = (h >> np.uint64(64 - self.p)).astype(np.intp)
+        # rank = leading zeros of the remaining 64 - p bits + 1; the top 53 bits convert exactly to float
+        rest = (h << np.uint64(self.p)) >> np.uint64(11)
+        bitlen = np.frexp(rest.astype(np.float64))[1]
+        rank = np.minimum(54 - bitlen, 64 - self.p + 1).astype(np.uint8)
+        np.maximum.at(self.registers, idx, rank)
+
+    def merge(self, other):
+        if other.p != self.p:
+            raise ValueError(f"Cannot merge HyperLogLog sketches of precision {self.p} and {other.p}.")
+        np.maximum(self.registers, other.registers, out=self.registers)
+        return self
+
+    def count(self):
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        zeros = int(np.count_nonzero(self.registers == 0))
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * np.log(m / zeros)  # linear counting for small cardinalities
+        return int(round(estimate))
+
+    def to_dict(self):
+        return {"p": self.p, "registers": base64.b64encode(zlib.compress(self.registers.tobytes())).decode("ascii")}
+
+    @classmethod
+    def from_dict(cls, d):
+        registers = np.frombuffer(zlib.decompress(base64.b64decode(d["registers"])), dtype=np.uint8).copy()
+        return cls(d["p"], registers)
+
+
+class TDigest:
+    """Merging t-digest (k1 scale function): weighted centroids, combined by re-clustering their union."""
+
+    def __init__(self, compression=TDIGEST_COMPRESSION, means=None, weights=None, vmin=None, vmax=None):
+        self.compression = compression
+        self.means = np.zeros(0) if means is None else np.asarray(means, dtype=np.float64)
+        self.weights = np.zeros(0) if weights is None else np.asarray(weights, dtype=np.float64)
+        self.min = vmin
+        self.max = vmax
+
+    def _compress(self, means, weights):
+        order = np.argsort(means, kind="stable")
+        means, weights = means[order], weights[order]
+        q = (np.cumsum(weights) - weights / 2) / weights.sum()
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * q - 1)
+        _, group = np.unique(np.floor(k), return_inverse=True)  # each centroid spans at most one unit of k
+        w = np.bincount(group, weights)
+        self.means, self.weights = np.bincount(group, means * weights) / w, w
+
+    def update(self, values):
+        v = np.asarray(values, dtype=np.float64)
+        v = v[np.isfinite(v)]
+        if not len(v):
+            return
+        self._extend(v.min(), v.max())
+        self._compress(np.concatenate([self.means, v]), np.concatenate([self.weights, np.ones(len(v))]))
+
+    def merge(self, other):
+        if len(other.weights):
+            self._extend(other.min, other.max)
+            self._compress(np.concatenate([self.means, other.means]), np.concatenate([self.weights, other.weights]))
+        return self
+
+    def _extend(self, lo, hi):
+        self.min = float(lo) if self.min is None else min(self.min, float(lo))
+        self.max = float(hi) if self.max is None else max(self.max, float(hi))
+
+    def quantile(self, q):
+        """Quantile(s) q in [0, 1], interpolated between centroid midpoints (exact min / max at 0 and 1)."""
+        if not len(self.weights):
+            return np.full(np.shape(q), np.nan) if np.ndim(q) else float("nan")
+        mids = (np.cumsum(self.weights) - self.weights / 2) / self.weights.sum()
+        out = np.interp(q, np.concatenate([[0.0], mids, [1.0]]), np.concatenate([[self.min], self.means, [self.max]]))
+        return out if np.ndim(q) else float(out)
+
+    def to_dict(self):
+        return {"compression": self.compression, "min": self.min, "max": self.max,
+                "means": self.means.tolist(), "weights": self.weights.tolist()}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["compression"], d["means"], d["weights"], d["min"], d["max"])
+
+
+def _flat(arr):
+    """NumPy values of a flat or jagged array (jagged: all particles)."""
+    if ak is not None and isinstance(arr, ak.Array):
+        return ak.to_numpy(ak.flatten(arr, axis=None))
+    return np.asarray(arr)
+
+
+class DatasetSketch:
+    """Sketches of one output (file, shard or dataset), fed with the decoded arrays of each read."""
+
+    def __init__(self, names=None):
+        self.names = names or {}
+        self.n_events = 0
+        self.columns = {}
+        self.runs = HyperLogLog()
+        self.lumis = HyperLogLog()
+        self.digests = {}
+        self.multiplicity = np.zeros(0, dtype=np.int64)
+
+    def update(self, arrs):
+        """Add one block of decoded arrays ({branch: array}, as returned by parallel_io / pushdown)."""
+        if not arrs:
+            return
+        names = self.names
+        present = {k: arrs[names[k]] for k in ID_KEYS + KINEMATIC_KEYS + ("counts",) if names.get(k) in arrs}
+        self.n_events += len(next(iter(arrs.values())))
+        for key in ID_KEYS + KINEMATIC_KEYS:
+            if key in present:
+                self._minmax(key, _flat(present[key]))
+        if "run" in present:
+            run = _flat(present["run"])
+            self.runs.update(selection.event_hash(run, 0, 0))
+            if "luminosityBlock" in present:
+                self.lumis.update(selection.event_hash(run, _flat(present["luminosityBlock"]), 0))
+        for key in KINEMATIC_KEYS:
+            if key in present:
+                self.digests.setdefault(key, TDigest()).update(_flat(present[key]))
+        if "counts" in present:
+            counts = _flat(present["counts"])
+        elif "pt" in present and ak is not None:
+            counts = ak.to_numpy(ak.num(present["pt"], axis=1))
+        else:
+            return
+        self._add_multiplicity(np.bincount(counts.astype(np.int64), minlength=0))
+
+    def _minmax(self, key, values):
+        if not len(values):
+            self.columns.setdefault(key, {"count": 0, "min": None, "max": None})
+            return
+        lo, hi = values.min().item(), values.max().item()
+        self._merge_column(key, {"count": int(len(values)), "min": lo, "max": hi})
+
+    def _merge_column(self, key, col):
+        cur = self.columns.setdefault(key, {"count": 0, "min": None, "max": None})
+        cur["count"] += col["count"]
+        if col["min"] is not None:
+            cur["min"] = col["min"] if cur["min"] is None else min(cur["min"], col["min"])
+            cur["max"] = col["max"] if cur["max"] is None else max(cur["max"], col["max"])
+
+    def _add_multiplicity(self, hist):
+        hist = np.asarray(hist, dtype=np.int64)
+        if len(hist) > len(self.multiplicity):
+            self.multiplicity = np.pad(self.multiplicity, (0, len(hist) - len(self.multiplicity)))
+        self.multiplicity[:len(hist)] += hist
+
+    def merge(self, other):
+        self.n_events += other.n_events
+        for key, col in other.columns.items():
+            self._merge_column(key, col)
+        self.runs.merge(other.runs)
+        self.lumis.merge(other.lumis)
+        for key, digest in other.digests.items():
+            self.digests.setdefault(key, TDigest(digest.compression)).merge(digest)
+        self._add_multiplicity(other.multiplicity)
+        return self
+
+    def to_dict(self):
+        d = {"n_events": self.n_events, "columns": self.columns}
+        if "run" in self.columns:
+            d["distinct"] = {"run": self.runs.to_dict()}
+            if "luminosityBlock" in self.columns:
+                d["distinct"]["luminosityBlock"] = self.lumis.to_dict()
+        if self.digests:
+            d["quantiles"] = {k: v.to_dict() for k, v in self.digests.items()}
+        if len(self.multiplicity):
+            d["multiplicity"] = self.multiplicity.tolist()
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        s = cls()
+        s.n_events = d.get("n_events", 0)
+        s.columns = {k: dict(v) for k, v in d.get("columns", {}).items()}
+        distinct = d.get("distinct", {})
+        if "run" in distinct:
+            s.runs = HyperLogLog.from_dict(distinct["run"])
+        if "luminosityBlock" in distinct:
+            s.lumis = HyperLogLog.from_dict(distinct["luminosityBlock"])
+        s.digests = {k: TDigest.from_dict(v) for k, v in d.get("quantiles", {}).items()}
+        s.multiplicity = np.asarray(d.get("multiplicity", []), dtype=np.int64)
+        return s
+
+    def summary(self, quantiles=QUANTILES):
+        """Plain numbers: events, distinct runs / lumi sections, column ranges, quantiles, multiplicity."""
+        out = {"n_events": self.n_events, "columns": self.columns}
+        if "run" in self.columns:
+            out["distinct_runs"] = self.runs.count()
+            if "luminosityBlock" in self.columns:
+                out["distinct_lumis"] = self.lumis.count()
+        out["quantiles"] = {k: dict(zip([f"q{q:g}" for q in quantiles], d.quantile(list(quantiles)).tolist()))
+                            for k, d in self.digests.items()}
+        if len(self.multiplicity):
+            hist = self.multiplicity
+            out["multiplicity"] = {str(n): int(c) for n, c in enumerate(hist) if c}
+            at_least = np.cumsum(hist[::-1])[::-1]
+            out["events_with_at_least"] = {str(n): int(c) for n, c in enumerate(at_least) if n and c}
+        return out
+
+
+def merge_dicts(dicts):
+    """Merged to_dict() of several sketches (None entries skipped); None if there is none."""
+    dicts = [d for d in dicts if d]
+    if not dicts:
+        return None
+    merged = DatasetSketch.from_dict(dicts[0])
+    for d in dicts[1:]:
+        merged.merge(DatasetSketch.from_dict(d))
+    return merged.to_dict()
+
+
+def count_summary(d):
+    """
+    --mode counts provenance: muon multiplicity histogram {n_mu: events} and pass counts {k: events with
+    n_mu >= k}, i.e. the events kept by min_n_muons = k, from a sketches dict.
+    """
+    summary = DatasetSketch.from_dict(d).summary() if d else {}
+    passing = dict(summary.get("events_with_at_least", {}), **{"0": summary.get("n_events", 0)})
+    return {"multiplicity": summary.get("multiplicity", {}),
+            "pass_counts": {k: passing[k] for k in sorted(passing, key=int)}}
+
+
+def output_sketch(path):
+    """Sketches recorded in the provenance sidecar of an output (dataset: merged over its files)."""
+    prov_path = Path(path).with_suffix(Path(path).suffix + ".provenance.json")
+    if not prov_path.exists():
+        raise FileNotFoundError(f"No provenance sidecar for {path} ({prov_path}).")
+    prov = json.loads(prov_path.read_text())
+    d = prov.get("sketches") or merge_dicts(f.get("sketches") for f in prov.get("files", []))
+    if not d:
+        raise RuntimeError(f"{prov_path} has no sketches (written before they were recorded?).")
+    return d
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Instant dataset summary from the sketches stored in provenance sidecars.")
+    ap.add_argument("outputs", nargs="+", help="Preprocessed outputs (their .provenance.json sidecars are read)")
+    ap.add_argument("--json", action="store_true", help="Print the summary as JSON")
+    args = ap.parse_args()
+    try:
+        merged = DatasetSketch.from_dict(merge_dicts(output_sketch(p) for p in args.outputs))
+    except (FileNotFoundError, RuntimeError, ValueError) as e:
+        raise SystemExit(str(e))
+    summary = merged.summary()
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+    print(f"Events: {summary['n_events']}")
+    if "distinct_runs" in summary:
+        print(f"Distinct runs: ~{summary['distinct_runs']}" +
+              (f", lumi sections: ~{summary['distinct_lumis']}" if "distinct_lumis" in summary else ""))
+    for key, col in summary["columns"].items():
+        print(f"  {key:16} count {col['count']:>12}  min {col['min']}  max {col['max']}")
+    for key, qs in summary["quantiles"].items():
+        print(f"  {key:16} " + "  ".join(f"{q} {v:.4g}" for q, v in qs.items()))
+    if "multiplicity" in summary:
+        print("Muon multiplicity: " + ", ".join(f"{n}: {c}" for n, c in summary["multiplicity"].items()))
+        print("Events with >= n muons: " + ", ".join(f"{n}: {c}" for n, c in summary["events_with_at_least"].items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+src/skim.py
+
+Skim: fichero reducido con solo los eventos que pasan la selección de config/selection.yaml
+(muon_selection, event_selection, triggers, flags_and_quality y, si se pide, global.sample_fraction)
+y solo las ramas de una lista blanca (skim.branches: patrones tipo 'Muon_*').
+
+ - Los cortes de evento (nMuon, PV_npvs, MET_pt, HLT_*, Flag_*, hash de muestreo) se evalúan primero
+   sobre ramas escalares; las ramas de la lista blanca solo se decodifican en los rangos con eventos
+   que pasan (src/pushdown.py).
+ - Después se aplican los cortes por muón (pt, |eta|, aislamiento, IDs): pasa el evento con
+   min_n_muons..max_n_muons muones buenos. Las colecciones se escriben completas.
+ - Salida .root (writer de uproot: TTree 'Events' con los nombres originales, p.ej. nMuon + Muon_pt)
+   o .parquet (una columna por rama, listas para las colecciones).
+
+Un skim .root sustituye al fichero original en todos los scripts (data_preprocessing.py, analysis.py,
+schema_catalog.py, --shard / merge_shards.py); un skim .parquet lo lee analysis.py directamente.
+
+Uso:
+  python src/skim.py --input data/raw/sample.root --output data/skims/sample_skim.root
+  python src/skim.py --input data/raw/sample.root --output data/skims/sample_skim.parquet --branches 'Muon_*' HLT_IsoMu24
+"""
+import argparse
+import fnmatch
+import json
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import uproot
+    import awkward as ak
+except Exception as e:
+    raise SystemExit("Requires uproot and awkward. Install them in the active env: pip install uproot awkward") from e
+
+try:  # executed as a script: python src/skim.py
+    import array_cache
+    import coalesced_io
+    import column_cache
+    import data_preprocessing
+    import digest_cache
+    import gz_cache
+    import parallel_io
+    import parquet_writer
+    import pushdown
+    import schema_catalog
+    import selection
+    import sharding
+except ImportError:  # imported as src.skim
+    from src import array_cache
+    from src import coalesced_io
+    from src import column_cache
+    from src import data_preprocessing
+    from src import digest_cache
+    from src import gz_cache
+    from src import parallel_io
+    from src import parquet_writer
+    from src import pushdown
+    from src import schema_catalog
+    from src import selection
+    from src import sharding
+
+
+def select_branches(available, patterns):
+    """Branches matching any of the whitelist patterns (fnmatch), in file order."""
+    return [b for b in available if any(fnmatch.fnmatchcase(b, p) for p in patterns)]
+
+
+def skim_cuts(config, schema, sample_fraction=None):
+    """
+    (event cuts for the pushdown read, per-muon cuts). nMuon only pre-filters on min_n_muons: the
+    exact window applies to the number of good muons (selection.muon_count_mask).
+    """
+    aliases, branches = schema["aliases"], schema["branches"]
+    cuts = []
+    for c in selection.event_cuts(config, aliases, branches):
+        if c["name"] == "n_muons":
+            if not c["min"]:
+                continue
+            c = dict(c, max=None)
+        cuts.append(c)
+    cuts += selection.trigger_cuts(config, branches)
+    sample = selection.sample_cut(sample_fraction, aliases, branches)
+    if sample:
+        cuts.append(sample)
+    return cuts, selection.muon_object_cuts(config, aliases, branches)
+
+
+def root_chunk(arrs, branches):
+    """
+    uproot writer input for one chunk: jagged branches grouped per collection (Muon_pt, Muon_eta -> {"Muon":
+    record array}, so uproot writes nMuon + Muon_*), scalars as NumPy. Counters of written collections are
+    left to uproot.
+    """
+    data = {}
+    collections = {}
+    for b in branches:
+        arr = arrs[b]
+        if arr.ndim > 1:
+            prefix, _, field = b.partition("_")
+            collections.setdefault(prefix, {})[field] = arr
+        else:
+            data[b] = ak.to_numpy(arr)
+    for prefix in collections:
+        data.pop(f"n{prefix}", None)
+    for prefix, fields in collections.items():
+        data[prefix] = ak.zip(fields)
+    return data
+
+
+def _types(chunk):
+    return {k: (v.type if isinstance(v, ak.Array) else v.dtype) for k, v in chunk.items()}
+
+
+def skim_file(inp, outp, config, branches=None, tree=None, step_size=100000, entry_start=None, entry_stop=None,
+              threads=1, sample_fraction=None, writer_opts=None):
+    """
+    Write the skim of one ROOT file to outp (.root or .parquet). branches: whitelist patterns
+    (default: skim.branches of the config). Returns the provenance dict (also the sidecar content).
+    """
+    inp, outp = Path(inp), Path(outp)
+    root_path = gz_cache.local_path(inp)  # .root.gz: decompressed once, reused
+    digest = digest_cache.sha256_in_background(inp)
+    schema = schema_catalog.load_schema(root_path, tree_name=tree, sha256=digest)
+    patterns = branches or (config.get("skim") or {}).get("branches") or selection.DEFAULTS["skim"]["branches"]
+    out_branches = select_branches(schema["branches"], patterns)
+    if not out_branches:
+        raise RuntimeError(f"No branch matches the skim whitelist {patterns}.")
+    cuts, obj = skim_cuts(config, schema, sample_fraction)
+    object_branches = selection.muon_object_branches(obj)
+    read = list(dict.fromkeys(out_branches + object_branches))
+
+    start, stop = sharding.entry_range(schema["num_entries"], entry_start, entry_stop)
+    t = coalesced_io.open_tree(root_path, schema["tree"])
+    io_before = coalesced_io.io_stats(t)
+    step = step_size if isinstance(step_size, int) else t.num_entries_for(step_size, read)
+    chunks = sharding.chunk_plan(schema["clusters"], start, stop, step)
+    stats = pushdown.new_stats()
+    executors = parallel_io.make_executors(threads)
+    if cuts:
+        reader = pushdown.read_selected(t, read, chunks, cuts, schema["clusters"], threads, executors, stats=stats)
+    else:
+        reader = ((a, b, arrs, None) for a, b, arrs in parallel_io.read_ranges(t, read, chunks, threads, executors))
+
+    is_root = outp.suffix.lower() == ".root"
+    outp.parent.mkdir(parents=True, exist_ok=True)
+    sink = uproot.recreate(str(outp)) if is_root else parquet_writer.TableWriter(outp, writer_opts)
+    n_written = 0
+    n_read = 0
+    try:
+        for _, _, arrs, _ in reader:
+            n_read += len(arrs[read[0]])
+            keep = selection.muon_count_mask(arrs, obj) if obj["pt"] in arrs else np.ones(len(arrs[read[0]]), dtype=bool)
+            if not keep.any():
+                continue
+            arrs = {b: arrs[b][keep] for b in out_branches}
+            if is_root:
+                chunk = root_chunk(arrs, out_branches)
+                if n_written == 0:
+                    sink.mktree(schema["tree"], _types(chunk))
+                sink[schema["tree"]].extend(chunk)
+            else:
+                sink.write(data_preprocessing.jagged_arrow_table(ak.zip(arrs, depth_limit=1)))
+            n_written += int(keep.sum())
+        if n_written == 0:
+            # nothing passes: still leave a valid, empty skim behind
+            empty = parallel_io.read_range(t, out_branches, start, start)
+            if is_root:
+                sink.mktree(schema["tree"], _types(root_chunk(empty, out_branches)))
+            else:
+                sink.write(data_preprocessing.jagged_arrow_table(ak.zip(empty, depth_limit=1)))
+    finally:
+        sink.close()
+        parallel_io.shutdown_executors(executors)
+
+    if not cuts:
+        stats.update(n_events=n_read, n_selected=n_read, entries_decoded=n_read)
+    prov = {
+        "input_path": str(inp),
+        "input_sha256": digest.result(),
+        "tree": schema["tree"],
+        "output": str(outp),
+        "entry_range": [start, stop],
+        "branches": out_branches,
+        "event_cuts": cuts,
+        "muon_selection": obj,
+        "sample_fraction": sample_fraction,
+        "pushdown": stats,
+        "io": coalesced_io.stats_delta(io_before, coalesced_io.io_stats(t)),
+        "n_events": stats["n_events"],
+        "n_rows": n_written,
+    }
+    if root_path != inp:
+        prov["decompressed_path"] = str(root_path)
+    if not is_root:
+        prov["parquet"] = writer_opts or parquet_writer.writer_options()
+    return prov
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Write a skim (selected events, whitelisted branches) of a ROOT file.")
+    ap.add_argument("--input", "-i", required=True, help="Input ROOT file")
+    ap.add_argument("--output", "-o", default=None, help="Skim path, .root or .parquet (default: skim.output in the config)")
+    ap.add_argument("--config", default=None, help="Selection config (default: config/selection.yaml if present)")
+    ap.add_argument("--branches", nargs="+", default=None,
+                    help="Branch whitelist patterns, e.g. 'Muon_*' HLT_IsoMu24 (default: skim.branches in the config)")
+    ap.add_argument("--tree", "-t", default=None, help="Tree name (default: detect automatically)")
+    ap.add_argument("--entry-start", type=int, default=None)
+    ap.add_argument("--entry-stop", type=int, default=None)
+    ap.add_argument("--step-size", default="100000", help="Entries (or memory size, e.g. '200 MB') per chunk")
+    ap.add_argument("--threads", type=int, default=None, help="Reader threads (default: io.threads in the config)")
+    ap.add_argument("--sample-fraction", type=float, default=None,
+                    help="Also keep only this hash-sampled fraction (default: global.sample_fraction in the config)")
+    ap.add_argument("--column-cache", action=argparse.BooleanOptionalAction, default=None,
+                    help="Use the on-disk decoded column cache (default: cache.columns in the config)")
+    ap.add_argument("--force", action="store_true", help="Overwrite output if exists")
+    args = ap.parse_args()
+
+    try:
+        config = selection.load_config(args.config)
+    except (FileNotFoundError, RuntimeError) as e:
+        raise SystemExit(f"Could not load config: {e}")
+    column_cache.configure_from(config, args.column_cache)
+    array_cache.configure_from(config)
+    coalesced_io.configure(config)
+    gz_cache.configure_from(config)
+    inp = Path(args.input)
+    if not inp.exists():
+        raise SystemExit(f"Input not found: {inp}")
+    outp = Path(args.output or (config.get("skim") or {}).get("output") or inp.with_name(f"{inp.name.split('.root')[0]}_skim.root"))
+    if outp.suffix.lower() not in (".root", ".parquet", ".pq"):
+        raise SystemExit("Skim output must be a .root or .parquet path.")
+    if outp.exists() and not args.force:
+        raise SystemExit(f"Output exists: {outp}. Use --force to overwrite.")
+    step_size = int(args.step_size) if str(args.step_size).isdigit() else args.step_size
+    try:
+        sample_fraction = selection.resolve_sample_fraction(args.sample_fraction, config)
+        prov = skim_file(inp, outp, config, branches=args.branches, tree=args.tree, step_size=step_size,
+                         entry_start=args.entry_start, entry_stop=args.entry_stop,
+                         threads=parallel_io.resolve_threads(args.threads, config),
+                         sample_fraction=sample_fraction if sample_fraction < 1 else None,
+                         writer_opts=parquet_writer.writer_options(config))
+    except (RuntimeError, ValueError) as e:
+        raise SystemExit(str(e))
+
+    prov_path = outp.with_suffix(outp.suffix + ".provenance.json")
+    with open(prov_path, "w") as fh:
+        json.dump(prov, fh, indent=2)
+    print(f"Skim: {prov['n_rows']} / {prov['n_events']} events, {len(prov['branches'])} branches -> {outp}")
+    print("Provenance written to:", prov_path)
+
+
+if __name__ == "__main__":
+    main()
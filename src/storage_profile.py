@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+"""
+src/storage_profile.py
+
+Perfil de almacenamiento de un fichero ROOT, para decidir qué ramas skimear, cachear o leer en
+paralelo (en NanoAOD de ~1500 ramas unas pocas concentran casi todos los bytes):
+ - por rama: bytes comprimidos / sin comprimir, ratio, codec, número y tamaño de baskets,
+   si los baskets están alineados con los clusters, y coste de decodificación estimado;
+ - por tree: entradas, clusters (entradas por cluster), totales y cuántas ramas cubren el
+   50 % / 90 % de los bytes comprimidos.
+
+Tamaños y baskets salen de los metadatos del TBranch (fZipBytes, fTotBytes, fBasketBytes,
+fBasketEntry), sin leer datos. El coste de decodificación se mide decodificando el primer basket de
+cada rama y se extrapola por bytes comprimidos (depende de la máquina; --no-decode lo omite).
+
+El perfil se guarda indexado por el SHA-256 del fichero en <cache dir>/profiles/<sha256>.json
+(cache dir: $HGRF_CACHE_DIR, por defecto .hgrf_cache), así que repetirlo sobre el mismo fichero
+solo lee el JSON. Acepta entradas .root.gz (src/gz_cache.py).
+
+Uso:
+  python src/storage_profile.py data/raw/sample.root --top 30
+  python src/storage_profile.py data/raw/sample.root --match 'Muon_*' --sort decode
+  python src/storage_profile.py data/raw/sample.root --json > profile.json
+  python scripts/inspect_root.py data/raw/sample.root          # mismo informe
+"""
+import argparse
+import fnmatch
+import json
+import os
+import threading
+import time
+from pathlib import Path
+
+import numpy as np
+
+# optional import: only needed to build a profile that is not cached yet
+try:
+    import uproot
+except Exception:
+    uproot = None
+
+try:  # executed as a script: python src/storage_profile.py
+    import digest_cache
+    import gz_cache
+    import schema_catalog
+except ImportError:  # imported as src.storage_profile
+    from src import digest_cache
+    from src import gz_cache
+    from src import schema_catalog
+
+PROFILE_VERSION = 1
+CACHE_DIR = Path(os.environ.get("HGRF_CACHE_DIR", ".hgrf_cache"))
+
+SORT_KEYS = {
+    "compressed": "compressed_bytes",
+    "uncompressed": "uncompressed_bytes",
+    "ratio": "ratio",
+    "baskets": "baskets",
+    "decode": "decode_s",
+}
+
+
+def profile_dir(cache_dir=None):
+    return Path(cache_dir or CACHE_DIR) / "profiles"
+
+
+def _stats(values):
+    """{"min", "median", "max"} of a list of numbers (None if empty)."""
+    if not values:
+        return None
+    a = np.asarray(values)
+    return {"min": int(a.min()), "median": float(np.median(a)), "max": int(a.max())}
+
+
+def _decode_first_basket(branch, stop, repeat=2):
+    """
+    Seconds to decompress and interpret entries [0, stop) of branch (its first basket), best of repeat
+    (the first call also pays one-off setup); None if it cannot be read.
+    """
+    best = None
+    for _ in range(repeat):
+        try:
+            t0 = time.perf_counter()
+            branch.array(entry_start=0, entry_stop=stop, array_cache=None)
+            t = time.perf_counter() - t0
+        except Exception:
+            return None
+        best = t if best is None else min(best, t)
+    return best
+
+
+def branch_profile(branch, clusters, decode=True):
+    """Storage record of one TBranch; clusters: the tree's cluster boundaries (entry offsets)."""
+    n = int(branch.num_baskets)
+    basket_bytes = [int(branch.basket_compressed_bytes(i)) for i in range(n)]
+    bounds = [tuple(int(x) for x in branch.basket_entry_start_stop(i)) for i in range(n)]
+    compressed = int(branch.compressed_bytes)
+    uncompressed = int(branch.uncompressed_bytes)
+    try:
+        codec = str(branch.compression) if branch.compression is not None else None
+    except Exception:
+        codec = None
+    cluster_set = set(clusters)
+    rec = {
+        "typename": branch.typename,
+        "codec": codec,
+        "compressed_bytes": compressed,
+        "uncompressed_bytes": uncompressed,
+        "ratio": round(uncompressed / compressed, 3) if compressed else None,
+        "baskets": n,
+        "basket_bytes": _stats(basket_bytes),
+        "basket_entries": _stats([b - a for a, b in bounds]),
+        # every basket starts on a cluster boundary: clusters can be read independently
+        "cluster_aligned": all(a in cluster_set for a, _ in bounds),
+        "decode_s": None,
+    }
+    if decode and n and basket_bytes[0]:
+        t = _decode_first_basket(branch, bounds[0][1])
+        if t is not None:
+            rec["decode_s"] = round(t * compressed / basket_bytes[0], 6)
+    return rec
+
+
+def describe_storage(tree, decode=True, match=None):
+    """Storage profile dict of an open uproot TTree (match: fnmatch pattern restricting the branches)."""
+    try:
+        clusters = [int(x) for x in tree.common_entry_offsets()]
+    except Exception:
+        clusters = [0, int(tree.num_entries)]
+    branches = {}
+    for name, branch in tree.iteritems():
+        if match and not fnmatch.fnmatchcase(name, match):
+            continue
+        branches[name] = branch_profile(branch, clusters, decode=decode)
+    return {
+        "tree": schema_catalog.strip_cycle(tree.name),
+        "num_entries": int(tree.num_entries),
+        "clusters": clusters,
+        "cluster_entries": _stats(np.diff(clusters).tolist()),
+        "decode": bool(decode),
+        "match": match,
+        "branches": branches,
+        "totals": totals(branches),
+    }
+
+
+def totals(branches):
+    """Tree totals and concentration: number of branches (largest first) holding 50 % / 90 % of the compressed bytes."""
+    comp = sorted((b["compressed_bytes"] for b in branches.values()), reverse=True)
+    total = sum(comp)
+    cum = np.cumsum(comp) if comp else np.zeros(0)
+    decode = [b["decode_s"] for b in branches.values() if b["decode_s"] is not None]
+    return {
+        "branches": len(branches),
+        "compressed_bytes": total,
+        "uncompressed_bytes": sum(b["uncompressed_bytes"] for b in branches.values()),
+        "baskets": sum(b["baskets"] for b in branches.values()),
+        "decode_s": round(sum(decode), 6) if decode else None,
+        "branches_for_50pct": int(np.searchsorted(cum, 0.5 * total) + 1) if total else 0,
+        "branches_for_90pct": int(np.searchsorted(cum, 0.9 * total) + 1) if total else 0,
+    }
+
+
+def build_profile(path, tree_name=None, decode=True, match=None, sha256=None):
+    """Open the file once and profile the requested (or detected) tree."""
+    if uproot is None:
+        raise RuntimeError("uproot is required to profile a ROOT file. Install with: pip install uproot")
+    with uproot.open(str(path)) as f:
+        name = tree_name or schema_catalog.detect_tree_name(f)
+        if name is None:
+            raise RuntimeError(f"No tree detected in ROOT file: {path}")
+        profile = describe_storage(f[name], decode=decode, match=match)
+        profile["trees_in_file"] = sorted({schema_catalog.strip_cycle(k) for k, c in f.classnames().items() if "TTree" in str(c)})
+    profile.update({"version": PROFILE_VERSION, "sha256": sha256, "path": str(path)})
+    return profile
+
+
+def _entry_path(sha256, cache_dir=None):
+    return profile_dir(cache_dir) / f"{sha256}.json"
+
+
+def _read_entry(sha256, cache_dir=None):
+    p = _entry_path(sha256, cache_dir)
+    if not p.exists():
+        return None
+    try:
+        entry = json.loads(p.read_text())
+    except Exception:
+        return None
+    return entry if entry.get("version") == PROFILE_VERSION else None
+
+
+def _write_entry(entry, cache_dir=None):
+    p = _entry_path(entry["sha256"], cache_dir)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    tmp = p.with_suffix(f".json.tmp{os.getpid()}.{threading.get_ident()}")
+    tmp.write_text(json.dumps(entry, indent=1))
+    os.replace(tmp, p)
+
+
+def _profile_key(tree_name, match):
+    return f"{tree_name or ''}|{match or ''}"
+
+
+def load_profile(path, tree_name=None, decode=True, match=None, cache_dir=None, refresh=False):
+    """
+    Storage profile of a ROOT (or .root.gz) file, served from the profile cache when the file's SHA-256
+    is known there. A cached profile without decode timings is rebuilt if decode is requested.
+    """
+    root_path = gz_cache.local_path(path)
+    sha256 = digest_cache.cached_sha256(root_path)
+    key = _profile_key(tree_name, match)
+    entry = None if refresh else _read_entry(sha256, cache_dir)
+    profile = (entry or {}).get("profiles", {}).get(key)
+    if profile is not None and (profile["decode"] or not decode):
+        return dict(profile, path=str(path))
+    profile = build_profile(root_path, tree_name=tree_name, decode=decode, match=match, sha256=sha256)
+    profile["path"] = str(path)
+    entry = _read_entry(sha256, cache_dir) or {"version": PROFILE_VERSION, "sha256": sha256, "profiles": {}}
+    entry["profiles"][key] = profile
+    try:
+        _write_entry(entry, cache_dir)
+    except OSError:
+        pass  # read-only cache dir: the profile is simply not cached
+    return profile
+
+
+def _mb(n):
+    return n / 2**20
+
+
+def format_report(profile, top=20, sort="compressed"):
+    """Text report: tree and cluster summary, totals, then the top branches by the sort key."""
+    t = profile["totals"]
+    ce = profile["cluster_entries"] or {"min": 0, "median": 0, "max": 0}
+    lines = [
+        f"File: {profile['path']}",
+        f"SHA-256: {profile['sha256']}",
+        f"TTrees: {', '.join(profile.get('trees_in_file') or [profile['tree']])}",
+        f"Tree: {profile['tree']}  entries: {profile['num_entries']}  branches: {t['branches']}"
+        + (f" (matching {profile['match']})" if profile.get("match") else ""),
+        f"Clusters: {len(profile['clusters']) - 1}  entries/cluster min/median/max: {ce['min']}/{ce['median']:g}/{ce['max']}",
+        f"Total: {_mb(t['compressed_bytes']):.2f} MB compressed, {_mb(t['uncompressed_bytes']):.2f} MB uncompressed"
+        + (f" (ratio {t['uncompressed_bytes'] / t['compressed_bytes']:.2f})" if t["compressed_bytes"] else "")
+        + f", {t['baskets']} baskets"
+        + (f", est. decode {t['decode_s']:.3f} s" if t["decode_s"] is not None else ""),
+        f"Branches holding 50% / 90% of compressed bytes: {t['branches_for_50pct']} / {t['branches_for_90pct']}",
+    ]
+    unaligned = [n for n, b in profile["branches"].items() if not b["cluster_aligned"]]
+    if unaligned:
+        lines.append(f"Branches with baskets not aligned to clusters: {len(unaligned)} (e.g. {', '.join(unaligned[:5])})")
+    field = SORT_KEYS[sort]
+    rows = sorted(profile["branches"].items(), key=lambda kv: -(kv[1][field] or 0))
+    total = t["compressed_bytes"] or 1
+    width = max([len(n) for n, _ in rows[:top]] + [6])
+    lines.append("")
+    lines.append(f"{'branch':<{width}}  {'comp MB':>9}  {'uncomp MB':>9}  {'ratio':>6}  {'baskets':>7}  "
+                 f"{'basket KB med/max':>17}  {'decode ms':>9}  {'share':>6}")
+    for name, b in rows[:top]:
+        bb = b["basket_bytes"] or {"median": 0, "max": 0}
+        decode = f"{b['decode_s'] * 1e3:9.2f}" if b["decode_s"] is not None else f"{'-':>9}"
+        lines.append(
+            f"{name:<{width}}  {_mb(b['compressed_bytes']):9.3f}  {_mb(b['uncompressed_bytes']):9.3f}  "
+            f"{(b['ratio'] or 0):6.2f}  {b['baskets']:7d}  {bb['median'] / 1024:8.1f}/{bb['max'] / 1024:<8.1f}  "
+            f"{decode}  {100 * b['compressed_bytes'] / total:5.1f}%"
+        )
+    if len(rows) > top:
+        lines.append(f"... {len(rows) - top} more branches (--top)")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-branch storage profile of a ROOT file (cached by file hash).")
+    parser.add_argument("input", help="ROOT file (.root or .root.gz)")
+    parser.add_argument("--tree", "-t", default=None, help="Tree name (default: detect automatically)")
+    parser.add_argument("--match", default=None, help="Only branches matching this fnmatch pattern, e.g. 'Muon_*'")
+    parser.add_argument("--top", type=int, default=20, help="Branches listed in the report (default 20)")
+    parser.add_argument("--sort", choices=sorted(SORT_KEYS), default="compressed", help="Report order (default: compressed bytes)")
+    parser.add_argument("--no-decode", action="store_true", help="Metadata only: skip the decode-cost measurement")
+    parser.add_argument("--refresh", action="store_true", help="Rebuild the profile even if cached")
+    parser.add_argument("--json", action="store_true", help="Print the full profile as JSON")
+    args = parser.parse_args(argv)
+
+    if not Path(args.input).exists():
+        raise SystemExit(f"Input not found: {args.input}")
+    try:
+        profile = load_profile(args.input, tree_name=args.tree, decode=not args.no_decode, match=args.match,
+                               refresh=args.refresh)
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    if args.json:
+        print(json.dumps(profile, indent=2))
+        return
+    print(format_report(profile, top=args.top, sort=args.sort))
+
+
+if __name__ == "__main__":
+    main()
@@ -9,29 +9,35 @@ Usage:
   python src/verify_manifest.py                # scan data/raw for .sha256 files and manifest.json (if present)
   python src/verify_manifest.py --manifest data/raw/manifest.json
   python src/verify_manifest.py --verbose
+  python src/verify_manifest.py --no-cache     # re-hash everything (ignore the digest cache)
 
 Notes:
  - This script does NOT download remote files. It verifies local files and compares to manifest entries when provided.
+ - Digests are cached by (path, inode, size, mtime_ns) in .hgrf_cache/digests (see src/digest_cache.py).
  - Placeholders and URLs in manifest.json are not touched; manifest format: {"files":[{"filename":"...","sha256":"...","size_bytes":...}, ...]}
 """
 import argparse
-import hashlib
 import json
 import os
 from pathlib import Path
 from typing import Dict, Any
 
+try:  # executed as a script: python src/verify_manifest.py
+    import digest_cache
+except ImportError:  # imported as src.verify_manifest (tests)
+    from src import digest_cache
+
 DATA_DIR = Path("data/raw")
 OUT_DIR = Path("results")
 OUT_DIR.mkdir(parents=True, exist_ok=True)
 REPORT_PATH = OUT_DIR / "verify_manifest_report.json"
 
 def sha256_of_file(path: Path, block_size: int = 65536) -> str:
-    h = hashlib.sha256()
-    with path.open("rb") as f:
-        for block in iter(lambda: f.read(block_size), b""):
-            h.update(block)
-    return h.hexdigest()
+    return digest_cache.sha256_of_file(path, block_size=block_size)
+
+def file_digest(path: Path, use_cache: bool = True) -> str:
+    # unchanged files (same path, inode, size, mtime_ns) are served from the digest cache
+    return digest_cache.cached_sha256(path) if use_cache else sha256_of_file(path)
 
 def read_sha256_file(path: Path) -> Dict[str,str]:
     # expects format: "<hash>  filename"
@@ -44,7 +50,7 @@ def read_sha256_file(path: Path) -> Dict[str,str]:
         return {"sha256": expected, "filename_hint": fname}
     return {"sha256":"", "filename_hint":""}
 
-def scan_sha256_files(data_dir: Path):
+def scan_sha256_files(data_dir: Path, use_cache: bool = True):
     results = {}
     for sha_file in sorted(data_dir.glob("*.sha256")):
         info = read_sha256_file(sha_file)
@@ -58,7 +64,7 @@ def scan_sha256_files(data_dir: Path):
         entry = {"sha_file": str(sha_file), "expected_sha256": info.get("sha256"), "target_file": str(target)}
         if target.exists():
             entry["exists"] = True
-            entry["computed_sha256"] = sha256_of_file(target)
+            entry["computed_sha256"] = file_digest(target, use_cache)
             entry["match"] = (entry["computed_sha256"].lower() == entry["expected_sha256"].lower())
             try:
                 entry["size_bytes"] = target.stat().st_size
@@ -72,7 +78,7 @@ def scan_sha256_files(data_dir: Path):
         results[str(target.name)] = entry
     return results
 
-def scan_manifest(manifest_path: Path):
+def scan_manifest(manifest_path: Path, use_cache: bool = True):
     results = {}
     if not manifest_path.exists():
         return results
@@ -87,7 +93,7 @@ def scan_manifest(manifest_path: Path):
         target = data_dir / fname
         if target.exists():
             entry["exists"] = True
-            entry["computed_sha256"] = sha256_of_file(target)
+            entry["computed_sha256"] = file_digest(target, use_cache)
             entry["match"] = (entry["computed_sha256"].lower() == expected.lower()) if expected else None
             entry["size_bytes"] = target.stat().st_size
         else:
@@ -102,11 +108,12 @@ def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--manifest", "-m", default=str(DATA_DIR / "manifest.json"), help="Path to manifest.json (optional)")
     ap.add_argument("--verbose", "-v", action="store_true")
+    ap.add_argument("--no-cache", action="store_true", help="Re-hash every file instead of using the stat-keyed digest cache")
     args = ap.parse_args()
 
     manifest_path = Path(args.manifest)
-    sha_results = scan_sha256_files(DATA_DIR)
-    manifest_results = scan_manifest(manifest_path) if manifest_path.exists() else {}
+    sha_results = scan_sha256_files(DATA_DIR, use_cache=not args.no_cache)
+    manifest_results = scan_manifest(manifest_path, use_cache=not args.no_cache) if manifest_path.exists() else {}
 
     summary = {
         "sha256_files_checked": len(sha_results),
@@ -0,0 +1,69 @@
+import awkward as ak
+import numpy as np
+import pytest
+
+uproot = pytest.importorskip("uproot")
+
+
+def _nanoaod_chunk(n, first_event):
+    # 0..3 muons per event, NanoAOD-like dtypes (float32 kinematics, uint64 event)
+    counts = np.arange(first_event, first_event + n) % 4
+    total = int(counts.sum())
+    start = int((np.arange(first_event) % 4).sum())
+    pt = (5.0 + np.arange(start, start + total) % 50).astype(np.float32)
+    eta = np.linspace(-2.0, 2.0, total).astype(np.float32)
+    phi = np.linspace(-3.0, 3.0, total).astype(np.float32)
+    events = np.arange(first_event, first_event + n)
+    el_counts = (np.arange(first_event, first_event + n) + 1) % 3
+    el_total = int(el_counts.sum())
+    return {
+        "run": np.full(n, 1, dtype=np.uint32),
+        "luminosityBlock": (events // 10 + 1).astype(np.uint32),
+        "event": (events + 1000).astype(np.uint64),
+        "HLT_IsoMu24": events % 3 != 0,
+        "HLT_Mu50": events % 5 == 0,
+        "Muon": ak.zip({
+            "pt": ak.unflatten(pt, counts),
+            "eta": ak.unflatten(eta, counts),
+            "phi": ak.unflatten(phi, counts),
+            "tightId": ak.unflatten(np.arange(start, start + total) % 3 != 0, counts),
+        }),
+        "Electron": ak.zip({
+            "pt": ak.unflatten(np.linspace(10.0, 60.0, el_total).astype(np.float32), el_counts),
+            "eta": ak.unflatten(np.zeros(el_total, dtype=np.float32), el_counts),
+            "phi": ak.unflatten(np.zeros(el_total, dtype=np.float32), el_counts),
+            "charge": ak.unflatten(np.where(np.arange(el_total) % 2 == 0, 1, -1).astype(np.int32), el_counts),
+        }),
+    }
+
+
+@pytest.fixture(autouse=True)
+def isolated_cache(tmp_path, monkeypatch):
+    """Keep on-disk caches (schema catalog, columns, ...) inside the test's tmp dir; fresh in-process caches per test."""
+    from src import array_cache, column_cache, digest_cache, gz_cache, schema_catalog, storage_profile
+
+    cache_dir = tmp_path / "hgrf_cache"
+    monkeypatch.setattr(column_cache, "CACHE_DIR", cache_dir)
+    monkeypatch.setattr(column_cache, "_STATE", {"enabled": False, "max_bytes": column_cache.DEFAULT_MAX_MB * 2**20})
+    monkeypatch.setenv("HGRF_COLUMN_CACHE", "0")
+    monkeypatch.setattr(array_cache, "CACHE", array_cache.ArrayCache(array_cache.DEFAULT_MAX_MB * 2**20))
+    monkeypatch.setattr(array_cache, "_TREES", type(array_cache._TREES)())
+    monkeypatch.delenv("HGRF_ARRAY_CACHE_MB", raising=False)  # restored after configure() exports it
+    monkeypatch.setattr(digest_cache, "CACHE_DIR", cache_dir)
+    monkeypatch.setattr(gz_cache, "CACHE_DIR", cache_dir)
+    monkeypatch.setattr(schema_catalog, "CACHE_DIR", cache_dir)
+    monkeypatch.setattr(schema_catalog, "_MEMO", {})
+    monkeypatch.setattr(storage_profile, "CACHE_DIR", cache_dir)
+    return cache_dir
+
+
+@pytest.fixture
+def nanoaod_file(tmp_path):
+    """Small TTree 'Events' with 60 entries written in three baskets/clusters (25, 25, 10)."""
+    path = tmp_path / "sample.root"
+    chunks = [_nanoaod_chunk(25, 0), _nanoaod_chunk(25, 25), _nanoaod_chunk(10, 50)]
+    with uproot.recreate(path) as f:
+        f.mktree("Events", {k: (v.type if isinstance(v, ak.Array) else v.dtype) for k, v in chunks[0].items()})
+        for c in chunks:
+            f["Events"].extend(c)
+    return path
@@ -28,3 +28,79 @@ def test_summarize_angles():
     assert int(n_pairs[1]) == 0
     assert pytest.approx(float(mean_a[0]), rel=1e-6) == 90.0
     assert np.isnan(mean_a[1])
+
+
+@pytest.mark.parametrize("suffix", [".parquet", ".csv"])
+def test_read_preprocessed_table_keeps_native_dtypes(tmp_path, suffix):
+    import pandas as pd
+
+    from src.analysis import read_preprocessed_particle_table
+
+    big = np.uint64(2**63 + 5)  # beyond int64
+    df = pd.DataFrame({
+        "run": np.array([1, 1, 1, 2], dtype=np.uint32),
+        "luminosityBlock": np.array([3, 3, 3, 1], dtype=np.uint32),
+        "event": np.array([big, big, 7, 7], dtype=np.uint64),
+        "mu_pt": np.array([10.5, 20.25, 30.0, 5.0], dtype=np.float32),
+        "mu_eta": np.zeros(4, dtype=np.float32),
+        "mu_phi": np.zeros(4, dtype=np.float32),
+    })
+    path = tmp_path / f"particles{suffix}"
+    df.to_parquet(path, index=False) if suffix == ".parquet" else df.to_csv(path, index=False)
+
+    data = read_preprocessed_particle_table(path)
+    assert data["event"].dtype == np.uint64 and data["event"].tolist() == [int(big), 7, 7]
+    assert data["run"].tolist() == [1, 1, 2]
+    assert data["pt"].tolist() == [[10.5, 20.25], [30.0], [5.0]]
+    assert str(data["pt"].type) == "3 * var * float32"
+
+
+def test_unit_vector_angles_match_cartesian_formula():
+    from src.analysis import compute_angles_from_unit_vectors
+    from src import kinematics
+
+    rng = np.random.default_rng(1)
+    counts = np.array([3, 0, 2, 4])
+    pt = ak.unflatten(rng.uniform(5, 50, counts.sum()), counts)
+    eta = ak.unflatten(rng.uniform(-2.4, 2.4, counts.sum()), counts)
+    phi = ak.unflatten(rng.uniform(-math.pi, math.pi, counts.sum()), counts)
+
+    c = kinematics.components(kinematics.CARTESIAN + kinematics.UNIT, pt=pt, eta=eta, phi=phi, dtype=None)
+    assert np.allclose(ak.flatten(c["p"]), ak.flatten(np.sqrt(c["px"] ** 2 + c["py"] ** 2 + c["pz"] ** 2)))
+    assert np.allclose(ak.flatten(c["ux"]), ak.flatten(c["px"] / c["p"]))
+
+    pairs = ak.combinations(ak.zip({"x": c["px"], "y": c["py"], "z": c["pz"]}), 2, axis=1)
+    a, b = pairs["0"], pairs["1"]
+    cos = (a.x * b.x + a.y * b.y + a.z * b.z) / np.sqrt((a.x**2 + a.y**2 + a.z**2) * (b.x**2 + b.y**2 + b.z**2))
+    expected = np.degrees(np.arccos(np.clip(ak.to_numpy(ak.flatten(cos)), -1, 1)))
+
+    got = compute_angles_from_unit_vectors(c["ux"], c["uy"], c["uz"])
+    assert ak.num(got, axis=1).tolist() == [3, 0, 1, 6]
+    assert np.allclose(ak.to_numpy(ak.flatten(got)), expected, atol=1e-6)
+
+
+def test_nearly_collinear_angles_match_float64_momentum_formula():
+    from src.analysis import compute_angles_from_pt_eta_phi
+
+    # float32 NanoAOD-like inputs: pairs 1e-4 rad apart, nearly back-to-back, and a zero-pt muon
+    eta = ak.Array([[0.5, 0.5, -0.5], [1.2, 1.2001], [0.3, 0.3]])
+    phi = ak.Array([[1.0, 1.0001, 1.0 - math.pi + 1e-4], [-2.0, -2.0], [0.1, 0.2]])
+    pt = ak.Array([[20.0, 30.0, 25.0], [40.0, 15.0], [10.0, 0.0]])
+    pt, eta, phi = (ak.values_astype(x, np.float32) for x in (pt, eta, phi))
+
+    # baseline formula: momentum vectors and normalised dot product, all in float64
+    p64 = {k: ak.values_astype(v, np.float64) for k, v in (("pt", pt), ("eta", eta), ("phi", phi))}
+    vec = ak.zip({"x": p64["pt"] * np.cos(p64["phi"]), "y": p64["pt"] * np.sin(p64["phi"]),
+                  "z": p64["pt"] * np.sinh(p64["eta"])})
+    pairs = ak.combinations(vec, 2, axis=1)
+    a, b = pairs["0"], pairs["1"]
+    with np.errstate(invalid="ignore"):  # zero-pt norm
+        cos = (a.x * b.x + a.y * b.y + a.z * b.z) / np.sqrt((a.x**2 + a.y**2 + a.z**2) * (b.x**2 + b.y**2 + b.z**2))
+    expected = np.degrees(np.arccos(np.clip(ak.to_numpy(ak.flatten(cos)), -1, 1)))
+
+    got = ak.to_numpy(ak.flatten(compute_angles_from_pt_eta_phi(pt, eta, phi)))
+    assert got.dtype == np.float64
+    assert np.isnan(got[-1]) and np.isnan(expected[-1])
+    assert 0 < got[0] < 0.01 and got[1] > 179.9
+    # float64 rounding near cos = ±1 is ~1e-6 deg; a float32 cosine is off by ~1e-2 deg there
+    assert np.allclose(got[:-1], expected[:-1], rtol=0, atol=1e-5)
@@ -0,0 +1,632 @@
+import json
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+import pytest
+
+ak = pytest.importorskip("awkward")
+uproot = pytest.importorskip("uproot")
+pq = pytest.importorskip("pyarrow.parquet")
+
+import src.data_preprocessing as dp
+
+
+@pytest.mark.parametrize("mode", ["per_event", "per_particle"])
+def test_stream_matches_in_memory(nanoaod_file, tmp_path, mode):
+    tree = uproot.open(nanoaod_file)["Events"]
+    expected = dp.per_event_summary(tree) if mode == "per_event" else dp.per_particle_table(tree)
+
+    outp = tmp_path / f"{mode}.parquet"
+    info = dp.stream_to_parquet(tree, mode, outp, step_size=20)
+
+    assert info["n_chunks"] == 3
+    assert pq.ParquetFile(outp).num_row_groups == 3
+    got = pd.read_parquet(outp)
+    pd.testing.assert_frame_equal(got, expected, check_dtype=False)
+
+
+def test_particle_table_broadcasts_event_ids(nanoaod_file):
+    tree = uproot.open(nanoaod_file)["Events"]
+    df = dp.per_particle_table(tree)
+
+    pt = tree["Muon_pt"].array(library="ak")
+    events = tree["event"].array(library="np")
+    expected_events = [int(e) for e, muons in zip(events, pt.tolist()) for _ in muons]
+    assert df["event"].tolist() == expected_events
+    assert df["mu_pt"].tolist() == [x for muons in pt.tolist() for x in muons]
+    assert (df.groupby("event")["luminosityBlock"].nunique() == 1).all()
+
+
+def test_process_dataset_one_part_per_file_in_order(nanoaod_file, tmp_path):
+    second = tmp_path / "sample_b.root"
+    second.write_bytes(nanoaod_file.read_bytes())
+    inputs = dp.expand_inputs([str(tmp_path / "sample*.root")])
+    assert [p.name for p in inputs] == ["sample.root", "sample_b.root"]
+
+    outdir = tmp_path / "dataset.parquet"
+    files = dp.process_dataset(inputs, outdir, workers=2, mode="per_particle")
+
+    assert [f["part"] for f in files] == ["part-00000.parquet", "part-00001.parquet"]
+    assert [f["input_path"] for f in files] == [str(p) for p in inputs]
+    single = dp.per_particle_table(uproot.open(nanoaod_file)["Events"])
+    merged = pd.read_parquet(outdir)
+    assert len(merged) == 2 * len(single)
+    pd.testing.assert_frame_equal(pd.read_parquet(outdir / "part-00001.parquet"), single)
+
+
+def test_schema_catalog_is_reused(nanoaod_file, isolated_cache, monkeypatch):
+    from src import digest_cache, schema_catalog
+
+    schema = schema_catalog.load_schema(nanoaod_file, sha256=digest_cache.cached_sha256(nanoaod_file))
+    assert schema["tree"] == "Events"
+    assert schema["num_entries"] == 60
+    assert schema["clusters"] == [0, 25, 50, 60]
+    assert schema["aliases"]["pt"] == "Muon_pt"
+    assert schema["aliases"]["counts"] == "nMuon"
+    assert schema["branches"]["Muon_pt"]["dtype"] == "float32"
+    assert schema["branches"]["event"]["dtype"] == "uint64"
+
+    # a fresh process (empty memo) must be served from disk without opening the file
+    monkeypatch.setattr(schema_catalog, "_MEMO", {})
+    monkeypatch.setattr(schema_catalog, "build_schema", lambda *a, **k: pytest.fail("schema rebuilt"))
+    assert schema_catalog.load_schema(nanoaod_file) == schema
+    assert dp.detect_tree(str(nanoaod_file)) == "Events"
+
+
+def test_multi_collection_single_pass(nanoaod_file, tmp_path):
+    collections = dp.parse_collections("Muon,Electron", ["Electron=pt,charge"])
+    outp = tmp_path / "particles.parquet"
+    prov = dp.process_file(nanoaod_file, outp, mode="per_particle", collections=collections)
+
+    muons = pd.read_parquet(tmp_path / "particles_Muon.parquet")
+    electrons = pd.read_parquet(tmp_path / "particles_Electron.parquet")
+    pd.testing.assert_frame_equal(muons, dp.per_particle_table(uproot.open(nanoaod_file)["Events"]))
+    assert list(electrons.columns) == ["run", "luminosityBlock", "event", "electron_pt", "electron_charge"]
+    el_counts = uproot.open(nanoaod_file)["Events"]["nElectron"].array(library="np")
+    assert len(electrons) == el_counts.sum()
+    assert prov["collections"]["Electron"]["n_rows"] == len(electrons)
+
+    # streaming writes the same tables, one row group per chunk and collection
+    stream_out = tmp_path / "stream.parquet"
+    dp.process_file(nanoaod_file, stream_out, mode="per_particle", collections=collections, stream=True, step_size=20)
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "stream_Electron.parquet"), electrons)
+    assert pq.ParquetFile(tmp_path / "stream_Muon.parquet").num_row_groups == 3
+
+
+@pytest.mark.parametrize("mode,stream", [("per_event", False), ("per_particle", True), ("per_particle", False),
+                                         ("per_event_jagged", False), ("per_event_jagged", True)])
+def test_shards_merge_to_single_run_bytes(nanoaod_file, tmp_path, mode, stream):
+    from src import merge_shards
+
+    kwargs = dict(mode=mode, stream=stream, step_size=20)
+    single = tmp_path / "single.parquet"
+    dp.process_file(nanoaod_file, single, **kwargs)
+
+    parts = []
+    for i in range(3):
+        part = tmp_path / f"shard{i}.parquet"
+        prov = dp.process_file(nanoaod_file, part, shard=(i, 3), **kwargs)
+        with open(merge_shards.provenance_path(part), "w") as fh:
+            json.dump(prov, fh)
+        parts.append(part)
+    # shard boundaries fall on the cluster boundaries 0/25/50/60
+    ranges = [merge_shards.read_provenance(p)["entry_range"] for p in parts]
+    assert ranges == [[0, 25], [25, 50], [50, 60]]
+
+    merged = tmp_path / "merged.parquet"
+    prov = merge_shards.merge_shards(reversed(parts), merged)
+    assert merged.read_bytes() == single.read_bytes()
+    assert prov["entry_range"] == [0, 60]
+
+
+def test_threaded_reads_match_sequential(nanoaod_file, tmp_path):
+    tree = uproot.open(nanoaod_file)["Events"]
+    expected = dp.per_particle_table(tree)
+    executors = dp.parallel_io.make_executors(3)
+    try:
+        io_opts = dict(threads=3, executors=executors)
+        pd.testing.assert_frame_equal(dp.per_particle_table(tree, io_opts=io_opts), expected)
+        pd.testing.assert_frame_equal(dp.per_particle_table(tree, entry_start=10, entry_stop=55, io_opts=io_opts),
+                                      dp.per_particle_table(tree, entry_start=10, entry_stop=55))
+        outp = tmp_path / "threaded.parquet"
+        dp.stream_to_parquet(tree, "per_particle", outp, step_size=20, io_opts=io_opts)
+        pd.testing.assert_frame_equal(pd.read_parquet(outp), expected)
+    finally:
+        dp.parallel_io.shutdown_executors(executors)
+
+
+def test_pushdown_selects_events_before_decoding(nanoaod_file, tmp_path):
+    tree = uproot.open(nanoaod_file)["Events"]
+    names = dp.schema_catalog.resolve_aliases(tree.keys())
+    config = {"muon_selection": {"min_n_muons": 2, "max_n_muons": None}}
+    cuts = dp.selection.event_cuts(config, names, tree.keys())
+    assert cuts == [{"name": "n_muons", "branch": "nMuon", "min": 2, "max": None}]
+
+    full = dp.per_particle_table(tree)
+    n_mu = full.groupby("event")["mu_pt"].transform("size")
+    expected = full[n_mu >= 2].reset_index(drop=True)
+    stats = dp.pushdown.new_stats()
+    got = dp.per_particle_table(tree, cuts=cuts, io_opts={"stats": stats})
+    pd.testing.assert_frame_equal(got, expected)
+    assert stats["n_events"] == 60 and stats["n_selected"] == 30
+    assert stats["entries_decoded"] < 60
+
+    outp = tmp_path / "selected.parquet"
+    info = dp.stream_to_parquet(tree, "per_particle", outp, step_size=20, cuts=cuts)
+    pd.testing.assert_frame_equal(pd.read_parquet(outp), expected)
+    assert info["selection"]["n_selected"] == 30
+
+
+def test_pushdown_skips_clusters_without_passing_events():
+    mask = np.zeros(60, dtype=bool)
+    mask[[3, 4, 24, 25, 58]] = True
+    stats = dp.pushdown.new_stats()
+    ranges = dp.pushdown.passing_ranges(mask, 0, [0, 20, 25, 50, 60], stats)
+    # cluster [0, 20) trimmed to [3, 5); [20, 25) + [25, 50) joined; [50, 60) trimmed
+    assert ranges == [(3, 5), (24, 26), (58, 59)]
+    assert stats["clusters"] == 4 and stats["clusters_skipped"] == 0
+    ranges = dp.pushdown.passing_ranges(mask[25:50], 25, [0, 20, 25, 50, 60], stats)
+    assert ranges == [(25, 26)]
+    mask[25] = False
+    assert dp.pushdown.passing_ranges(mask[20:60], 20, [0, 20, 25, 50, 60]) == [(24, 25), (58, 59)]
+
+
+def test_native_dtypes_kept_end_to_end(nanoaod_file, tmp_path):
+    tree = uproot.open(nanoaod_file)["Events"]
+    particles = dp.per_particle_table(tree)
+    assert particles.dtypes.astype(str).to_dict() == {
+        "run": "uint32", "luminosityBlock": "uint32", "event": "uint64",
+        "mu_pt": "float32", "mu_eta": "float32", "mu_phi": "float32",
+    }
+    events = dp.per_event_summary(tree)
+    assert str(events["event"].dtype) == "uint64" and str(events["n_mu"].dtype) == "int32"
+    assert str(events["mean_mu_pt"].dtype) == "float32"
+
+    outp = tmp_path / "particles.parquet"
+    dp.stream_to_parquet(tree, "per_particle", outp, step_size=20)
+    assert pd.read_parquet(outp).dtypes.equals(particles.dtypes)
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_per_event_jagged_read_back_by_analysis(nanoaod_file, tmp_path, stream):
+    from src import analysis
+
+    outp = tmp_path / "events.parquet"
+    prov = dp.process_file(nanoaod_file, outp, mode="per_event_jagged", stream=stream, step_size=20)
+    assert prov["n_rows"] == 60
+    schema = pq.read_schema(outp)
+    assert str(schema.field("mu_pt").type).startswith("list<") and str(schema.field("event").type) == "uint64"
+
+    data = analysis.read_preprocessed_particle_table(outp)
+    expected = analysis.read_root_particles(str(nanoaod_file))
+    for key in ("run", "luminosityBlock", "event"):
+        assert data[key].dtype == expected[key].dtype and (data[key] == expected[key]).all()
+    for key in ("pt", "eta", "phi"):
+        assert data[key].tolist() == expected[key].tolist()
+        assert str(data[key].type) == "60 * var * float32"
+
+
+def test_parquet_writer_options_and_partitions(nanoaod_file, tmp_path):
+    from src import merge_shards, parquet_writer
+
+    opts = parquet_writer.writer_options(compression="lz4", row_group_size=16)
+    outp = tmp_path / "particles.parquet"
+    prov = dp.process_file(nanoaod_file, outp, mode="per_particle", writer_opts=opts)
+    assert prov["parquet"]["compression"] == "lz4"
+    meta = pq.ParquetFile(outp).metadata
+    assert meta.num_row_groups == -(-prov["n_rows"] // 16)
+    columns = {meta.row_group(0).column(i).path_in_schema: meta.row_group(0).column(i) for i in range(meta.num_columns)}
+    assert columns["mu_pt"].compression == "LZ4"
+    assert columns["event"].statistics.has_min_max
+    assert any("DICTIONARY" in e for e in columns["luminosityBlock"].encodings)
+    assert not any("DICTIONARY" in e for e in columns["mu_pt"].encodings)
+
+    # Hive partitions (here by lumi block: the fixture has one run), merged shard by shard
+    part_opts = parquet_writer.writer_options(partition_by="luminosityBlock")
+    for stream in (False, True):
+        single = tmp_path / f"single{stream}.parquet"
+        dp.process_file(nanoaod_file, single, mode="per_particle", stream=stream, step_size=20, writer_opts=part_opts)
+        files = parquet_writer.partition_files(single)
+        assert [str(f) for f in files] == [f"luminosityBlock={k}/part.parquet" for k in range(1, 7)]
+        got = pd.read_parquet(single, filters=[("luminosityBlock", "=", 3)])
+        assert len(got) > 0 and got["event"].is_monotonic_increasing
+        assert set(got["event"]) == {1020 + k for k in range(10) if k % 4 >= 1}
+
+        parts = []
+        for i in range(3):
+            part = tmp_path / f"shard{stream}{i}.parquet"
+            shard_prov = dp.process_file(nanoaod_file, part, mode="per_particle", stream=stream, step_size=20,
+                                         shard=(i, 3), writer_opts=part_opts)
+            with open(merge_shards.provenance_path(part), "w") as fh:
+                json.dump(shard_prov, fh)
+            parts.append(part)
+        merged = tmp_path / f"merged{stream}.parquet"
+        merge_shards.merge_shards(parts, merged)
+        assert parquet_writer.partition_files(merged) == files
+        for f in files:
+            assert (merged / f).read_bytes() == (single / f).read_bytes()
+
+
+def test_hash_sampling_is_stable_across_stages(nanoaod_file, tmp_path):
+    from src import analysis
+
+    full = dp.per_event_summary(uproot.open(nanoaod_file)["Events"])
+    keep = dp.selection.sample_mask(full["run"], full["luminosityBlock"], full["event"], 0.3)
+    assert 0 < keep.sum() < len(full)
+    smaller = dp.selection.sample_mask(full["run"], full["luminosityBlock"], full["event"], 0.1)
+    assert not (smaller & ~keep).any()  # lower fractions select subsets
+
+    outp = tmp_path / "sampled.parquet"
+    prov = dp.process_file(nanoaod_file, outp, mode="per_event", stream=True, step_size=20, sample_fraction=0.3)
+    pd.testing.assert_frame_equal(pd.read_parquet(outp), full[keep].reset_index(drop=True))
+    assert prov["sample_fraction"] == 0.3 and prov["selection"]["n_selected"] == keep.sum()
+
+    # the same events come out of the ROOT reader and of a sampled preprocessed table
+    particles = tmp_path / "particles.parquet"
+    dp.process_file(nanoaod_file, particles, mode="per_event_jagged", sample_fraction=0.3)
+    from_table = analysis.sample_events(analysis.read_preprocessed_particle_table(particles), 0.3)
+    assert from_table["event"].tolist() == full["event"][keep].tolist()
+
+
+def test_column_cache_serves_repeated_reads_without_decoding(nanoaod_file, tmp_path, isolated_cache, monkeypatch):
+    from src import analysis, array_cache, column_cache, digest_cache, parallel_io
+
+    array_cache.configure(0)  # exercise the disk cache only
+    column_cache.configure(True)
+    digest_cache.cached_sha256(nanoaod_file)  # file hash known: ranges are stored, not read through
+    first = dp.process_file(nanoaod_file, tmp_path / "a.parquet", mode="per_particle", stream=True, step_size=20)
+    assert column_cache.stats()["misses"] > 0 and column_cache.stats()["hits"] == 0
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("branch decoded despite a cached entry")
+
+    monkeypatch.setattr(parallel_io, "_read_range", no_decoding)
+    second = dp.process_file(nanoaod_file, tmp_path / "b.parquet", mode="per_particle", stream=True, step_size=20)
+    assert second["n_rows"] == first["n_rows"]
+    assert (tmp_path / "b.parquet").read_bytes() == (tmp_path / "a.parquet").read_bytes()
+    cached = analysis.read_root_particles(str(nanoaod_file), entry_start=25, entry_stop=50)  # one cluster-aligned chunk
+    assert str(cached["pt"].type) == "25 * var * float32"
+
+    found = column_cache.entries()
+    assert {m["branch"] for m, *_ in found} >= {"Muon_pt", "event"}
+    oldest = min(found, key=lambda e: e[3])[1]
+    assert column_cache.trim(sum(e[2] for e in found) - 1) >= 1 and not oldest.exists()
+    assert column_cache.clear() == len(found) - 1 and column_cache.entries() == []
+
+
+def test_array_cache_reuses_decoded_arrays_within_budget(nanoaod_file, monkeypatch):
+    from src import analysis, array_cache, parallel_io
+
+    first = analysis.read_root_particles(str(nanoaod_file))
+    tree = array_cache.open_tree(nanoaod_file, "Events")
+    assert array_cache.open_tree(nanoaod_file, "Events") is tree
+
+    def no_decoding(*args, **kwargs):
+        raise AssertionError("branch decoded again in the same session")
+
+    monkeypatch.setattr(parallel_io, "_read_stored", no_decoding)
+    again = analysis.read_root_particles(str(nanoaod_file))
+    assert again["pt"] is first["pt"] and (again["event"] == first["event"]).all()
+    arrs = dp.read_branches(tree, ["Muon_pt", "event"])  # shared with read_branches
+    assert arrs["Muon_pt"] is first["pt"]
+    assert array_cache.stats()["hits"] >= 8
+
+    budget = first["pt"].nbytes + first["eta"].nbytes
+    array_cache.configure(budget / 2**20)
+    stats = array_cache.stats()
+    assert stats["bytes"] <= budget and stats["evictions"] > 0
+
+
+def test_column_plan_reads_only_needed_branches(nanoaod_file, tmp_path, monkeypatch):
+    from src import parallel_io
+
+    tree = uproot.open(nanoaod_file)["Events"]
+    full = dp.per_event_summary(tree)
+    read = []
+    original = parallel_io.read_range
+
+    def spy(tree, branches, *args, **kwargs):
+        read.extend(branches)
+        return original(tree, branches, *args, **kwargs)
+
+    monkeypatch.setattr(parallel_io, "read_range", spy)
+    dp.per_event_summary(tree)
+    assert set(read) == {"run", "luminosityBlock", "event", "Muon_pt"}  # no eta / phi for pt statistics
+
+    read.clear()
+    counts = dp.per_event_summary(tree, columns=["n_mu", "event"])
+    assert read == ["event", "nMuon"]  # multiplicity from the counter, collection not decoded
+    pd.testing.assert_frame_equal(counts, full[["event", "n_mu"]])
+
+    outp = tmp_path / "pt.parquet"
+    prov = dp.process_file(nanoaod_file, outp, mode="per_particle", stream=True, step_size=20, columns=["event", "mu_pt"])
+    assert prov["columns_requested"] == ["event", "mu_pt"]
+    expected = dp.per_particle_table(tree)[["event", "mu_pt"]]
+    pd.testing.assert_frame_equal(pd.read_parquet(outp), expected)
+
+    report = dp.dry_run(nanoaod_file, mode="per_event", columns=["mean_mu_pt"])
+    assert "Muon_pt" in report and "Muon_eta" not in report
+    with pytest.raises(ValueError):
+        dp.per_event_summary(tree, columns=["mu_eta"])
+
+
+def test_coalesced_reads_are_counted(nanoaod_file, tmp_path):
+    from src import coalesced_io
+
+    branches = ["run", "event", "nMuon", "Muon_pt", "Muon_eta", "Muon_phi"]
+    tree = coalesced_io.open_tree(nanoaod_file, "Events")
+    before = coalesced_io.io_stats(tree)
+    tree.arrays(branches, how=dict)
+    together = coalesced_io.stats_delta(before, coalesced_io.io_stats(tree))
+
+    tree = coalesced_io.open_tree(nanoaod_file, "Events")
+    before = coalesced_io.io_stats(tree)
+    for b in branches:
+        tree[b].array()
+    separate = coalesced_io.stats_delta(before, coalesced_io.io_stats(tree))
+
+    assert together["requests"] == 1 and separate["requests"] == len(branches)
+    assert together["reads"] < separate["reads"]
+    assert together["bytes_read"] >= together["bytes_requested"] > 0
+
+    prov = dp.process_file(nanoaod_file, tmp_path / "e.parquet", mode="per_event", stream=True, step_size=20)
+    assert prov["io"]["requests"] >= 1 and prov["io"]["bytes_read"] > 0
+
+
+@pytest.mark.parametrize("mode", ["per_particle", "per_event_jagged"])
+def test_cartesian_columns_feed_the_angle_kernel(nanoaod_file, tmp_path, mode):
+    from src import analysis, column_plan
+
+    outp = tmp_path / f"{mode}.parquet"
+    dp.process_file(nanoaod_file, outp, mode=mode, stream=True, step_size=20,
+                    columns=column_plan.with_cartesian(mode))
+    schema = pq.read_schema(outp)
+    for c in column_plan.CARTESIAN_COLUMNS:
+        assert ("double" if c in analysis.UNIT_COLUMNS else "float") in str(schema.field(c).type)
+
+    data = analysis.read_preprocessed_particle_table(outp)
+    assert "ux" in data and str(data["ux"].type).endswith("float64")
+    fast = analysis.compute_angles_from_unit_vectors(data["ux"], data["uy"], data["uz"])
+    slow = analysis.compute_angles_from_pt_eta_phi(data["pt"], data["eta"], data["phi"])
+    assert ak.all(ak.num(fast, axis=1) == ak.num(slow, axis=1))
+    np.testing.assert_allclose(ak.to_numpy(ak.flatten(fast)), ak.to_numpy(ak.flatten(slow)), atol=1e-6)
+
+    with pytest.raises(ValueError):
+        column_plan.with_cartesian("per_event")
+
+
+def test_cartesian_unit_vectors_keep_near_collinear_angles():
+    from src import analysis, column_plan
+
+    # float32 inputs, pairs with deta = 1e-4 / dphi = 2e-4 and nearly back-to-back
+    eta = ak.values_astype(ak.Array([[0.5, 0.5001, -0.5], [1.2, 1.2]]), np.float32)
+    phi = ak.values_astype(ak.Array([[1.0, 1.0002, 1.0 - np.pi + 2e-4], [-2.0, -1.9998]]), np.float32)
+    pt = ak.values_astype(ak.Array([[20.0, 30.0, 25.0], [40.0, 15.0]]), np.float32)
+    names = {"pt": "Muon_pt", "eta": "Muon_eta", "phi": "Muon_phi"}
+    spec = dp.muon_spec(names, column_plan.with_cartesian("per_particle"))
+    arrs = dp.with_derived_columns({"Muon_pt": pt, "Muon_eta": eta, "Muon_phi": phi}, names, [spec])
+
+    fast = ak.to_numpy(ak.flatten(analysis.compute_angles_from_unit_vectors(arrs["mu_ux"], arrs["mu_uy"], arrs["mu_uz"])))
+    slow = ak.to_numpy(ak.flatten(analysis.compute_angles_from_pt_eta_phi(pt, eta, phi)))
+    assert 0 < slow[0] < 0.02 and slow[1] > 179.9
+    np.testing.assert_allclose(fast, slow, rtol=0, atol=1e-6)
+
+
+def test_sketches_merge_across_shards(nanoaod_file, tmp_path):
+    from src import merge_shards, sketches
+
+    full = dp.process_file(nanoaod_file, tmp_path / "full.parquet", mode="per_particle")["sketches"]
+    parts = []
+    for i in range(3):
+        part = tmp_path / f"shard{i}.parquet"
+        prov = dp.process_file(nanoaod_file, part, mode="per_particle", stream=True, step_size=20, shard=(i, 3))
+        with open(merge_shards.provenance_path(part), "w") as fh:
+            json.dump(prov, fh)
+        parts.append(part)
+    merged = merge_shards.merge_shards(parts, tmp_path / "merged.parquet")["sketches"]
+
+    a, b = sketches.DatasetSketch.from_dict(full).summary(), sketches.DatasetSketch.from_dict(merged).summary()
+    assert a["n_events"] == b["n_events"] == 60
+    assert a["columns"] == b["columns"] and a["columns"]["pt"]["count"] == 90
+    assert a["distinct_runs"] == b["distinct_runs"] == 1 and a["distinct_lumis"] == b["distinct_lumis"] == 6
+    assert a["multiplicity"] == b["multiplicity"] == {"0": 15, "1": 15, "2": 15, "3": 15}
+    assert b["events_with_at_least"]["2"] == 30
+
+    pt = pd.read_parquet(tmp_path / "full.parquet")["mu_pt"].to_numpy()
+    for q in (0.05, 0.5, 0.95):
+        assert abs(b["quantiles"]["pt"][f"q{q:g}"] - np.quantile(pt, q)) <= 1.5
+
+
+def test_hyperloglog_counts_large_cardinalities():
+    from src import selection, sketches
+
+    hll = sketches.HyperLogLog()
+    hll.update(selection.event_hash(np.arange(200000), 0, 0))
+    other = sketches.HyperLogLog()
+    other.update(selection.event_hash(np.arange(100000, 300000), 0, 0))
+    assert abs(hll.merge(other).count() - 300000) < 0.05 * 300000
+
+
+def test_root_gz_input_is_decompressed_once(nanoaod_file, tmp_path, monkeypatch):
+    import gzip
+    import shutil
+
+    from src import digest_cache, gz_cache
+
+    gz_paths = []
+    for i in range(2):
+        gz_path = tmp_path / f"sample{i}.root.gz"
+        with open(nanoaod_file, "rb") as src, gzip.open(gz_path, "wb", compresslevel=1 + i) as dst:
+            shutil.copyfileobj(src, dst)
+        gz_paths.append(gz_path)
+
+    copies = gz_cache.prepare(gz_paths, workers=2)
+    assert all(c.read_bytes() == Path(nanoaod_file).read_bytes() for c in copies)
+    assert copies[0] != copies[1]  # keyed by the gz hash
+    assert digest_cache.lookup_sha256(gz_paths[0]) == digest_cache.sha256_of_file(gz_paths[0])
+
+    def no_decompress(*args, **kwargs):
+        raise AssertionError("decompressed twice")
+
+    monkeypatch.setattr(gz_cache, "_decompress", no_decompress)
+    prov = dp.process_file(gz_paths[0], tmp_path / "e.parquet", mode="per_event")
+    assert prov["input_path"] == str(gz_paths[0]) and prov["decompressed_path"] == str(copies[0])
+    expected = dp.per_event_summary(uproot.open(nanoaod_file)["Events"])
+    pd.testing.assert_frame_equal(pd.read_parquet(tmp_path / "e.parquet"), expected)
+
+
+def test_root_gz_copy_is_keyed_by_the_gz_digest(nanoaod_file, tmp_path, monkeypatch):
+    import gzip
+    import shutil
+
+    from src import column_cache, digest_cache, gz_cache, schema_catalog
+
+    gz_path = tmp_path / "sample.root.gz"
+    with open(nanoaod_file, "rb") as src, gzip.open(gz_path, "wb") as dst:
+        shutil.copyfileobj(src, dst)
+    copy = gz_cache.local_path(gz_path)
+    digest = digest_cache.lookup_sha256(gz_path)
+    assert gz_cache.source_digest(copy) == digest and gz_cache.source_digest(nanoaod_file) is None
+
+    hashed = []
+    original = digest_cache.sha256_in_background
+
+    def spy(path, *args, **kwargs):
+        hashed.append(Path(path))
+        return original(path, *args, **kwargs)
+
+    monkeypatch.setattr(digest_cache, "sha256_in_background", spy)
+    assert column_cache.tree_key(uproot.open(copy)["Events"]) == (digest, "Events")
+    assert schema_catalog.load_schema(copy)["tree"] == "Events"
+    assert copy not in hashed
+
+
+def test_counts_mode_reads_only_the_counter(nanoaod_file, tmp_path, monkeypatch):
+    from src import merge_shards, parallel_io
+
+    read = []
+    original = parallel_io.read_range
+
+    def spy(tree, branches, *args, **kwargs):
+        read.extend(branches)
+        return original(tree, branches, *args, **kwargs)
+
+    monkeypatch.setattr(parallel_io, "read_range", spy)
+    outp = tmp_path / "counts.parquet"
+    prov = dp.process_file(nanoaod_file, outp, mode="counts")
+    assert set(read) == {"run", "luminosityBlock", "event", "nMuon"}
+    assert prov["multiplicity"] == {"0": 15, "1": 15, "2": 15, "3": 15}
+    assert prov["pass_counts"] == {"0": 60, "1": 45, "2": 30, "3": 15}
+    full = dp.per_event_summary(uproot.open(nanoaod_file)["Events"])
+    pd.testing.assert_frame_equal(pd.read_parquet(outp), full[["run", "luminosityBlock", "event", "n_mu"]])
+
+    parts = []
+    for i in range(2):
+        part = tmp_path / f"counts{i}.parquet"
+        with open(merge_shards.provenance_path(part), "w") as fh:
+            json.dump(dp.process_file(nanoaod_file, part, mode="counts", stream=True, step_size=20, shard=(i, 2)), fh)
+        parts.append(part)
+    merged = merge_shards.merge_shards(parts, tmp_path / "merged.parquet")
+    assert merged["pass_counts"] == prov["pass_counts"]
+
+
+def test_good_run_list_masks_lumis_before_decoding(nanoaod_file, tmp_path):
+    golden = tmp_path / "golden.json"
+    golden.write_text(json.dumps({"1": [[2, 2], [1, 1], [5, 5]], "7": [[1, 100]]}))
+    mask = dp.selection.lumi_mask.load(golden)
+    assert mask.starts.tolist() == [(1 << 32) | 1, (1 << 32) | 5, (7 << 32) | 1]  # [1, 1] + [2, 2] merged
+    assert mask.contains([1, 1, 1, 2, 7], [2, 3, 5, 1, 100]).tolist() == [True, False, True, False, True]
+
+    tree = uproot.open(nanoaod_file)["Events"]
+    names = dp.schema_catalog.resolve_aliases(tree.keys())
+    config = {"flags_and_quality": {"good_run_list": str(golden)}}
+    cuts = dp.selection.event_cuts(config, names, tree.keys())
+    assert cuts == [{"name": "lumi_mask", "file": str(golden), "ids": {"run": "run", "luminosityBlock": "luminosityBlock"}}]
+    assert dp.selection.event_cuts({"flags_and_quality": dict(config["flags_and_quality"], ignore_bad_lumi=True)}, names) == []
+
+    full = dp.per_event_summary(tree)
+    expected = full[full["luminosityBlock"].isin([1, 2, 5])].reset_index(drop=True)
+    stats = dp.pushdown.new_stats()
+    got = dp.per_event_summary(tree, cuts=cuts, io_opts={"stats": stats})
+    pd.testing.assert_frame_equal(got, expected)
+    assert stats["n_selected"] == 30 and stats["clusters_skipped"] == 1
+
+
+def test_stream_cli_leaves_array_cache_empty(nanoaod_file, tmp_path, monkeypatch):
+    outp = tmp_path / "streamed.parquet"
+    monkeypatch.setattr("sys.argv", ["data_preprocessing.py", "--input", str(nanoaod_file), "--mode", "per_particle",
+                                     "--stream", "--step-size", "20", "--output", str(outp)])
+    dp.main()
+    assert len(pd.read_parquet(outp)) == len(dp.per_particle_table(uproot.open(nanoaod_file)["Events"]))
+    stats = dp.array_cache.stats()
+    assert not dp.array_cache.enabled() and stats["entries"] == 0 and stats["bytes"] == 0
+
+
+def test_column_cache_reads_through_while_file_hash_is_pending(nanoaod_file, isolated_cache, monkeypatch):
+    import threading
+
+    from src import column_cache, digest_cache, parallel_io
+
+    release = threading.Event()
+    calls = []
+    hash_file = digest_cache.sha256_of_file
+
+    def slow_hash(path, block_size=65536):
+        calls.append(path)
+        release.wait(10)
+        return hash_file(path, block_size)
+
+    monkeypatch.setattr(digest_cache, "sha256_of_file", slow_hash)
+    column_cache.configure(True)
+    tree = uproot.open(nanoaod_file)["Events"]
+    pending = digest_cache.sha256_in_background(nanoaod_file)
+    arrs = parallel_io.read_range(tree, ["event", "Muon_pt"], 0, 25)  # no inline hash, no wait
+    assert len(arrs["event"]) == 25 and not (isolated_cache / "columns").exists()
+    assert digest_cache.sha256_in_background(nanoaod_file) is pending  # in-flight hash shared
+    release.set()
+    assert pending.result(10) == hash_file(nanoaod_file) and len(calls) == 1
+    parallel_io.read_range(tree, ["event", "Muon_pt"], 25, 50)
+    assert {m["branch"] for m, *_ in column_cache.entries()} == {"event", "Muon_pt"}
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_event_id_columns_without_branches(nanoaod_file, tmp_path, stream):
+    tree = uproot.open(nanoaod_file)["Events"]
+    names = dict(dp.schema_catalog.resolve_aliases(tree.keys()), event=None)  # no event branch: entry numbers
+    plan = dp.column_plan.resolve("per_event", ["event"], names)
+    assert plan["branches"] == []
+    if stream:
+        outp = tmp_path / "ids.parquet"
+        dp.stream_to_parquet(tree, "per_event", outp, step_size=20, entry_start=10, entry_stop=55, names=names,
+                             columns=["event"])
+        got = pd.read_parquet(outp)
+    else:
+        got = dp.per_event_summary(tree, names=names, entry_start=10, entry_stop=55, columns=["event"])
+    assert list(got.columns) == ["event"] and got["event"].tolist() == list(range(10, 55))
+    assert str(got["event"].dtype) == "uint64"
+
+
+def test_zero_muon_events_summarise_to_zero(nanoaod_file):
+    tree = uproot.open(nanoaod_file)["Events"]
+    events = dp.per_event_summary(tree)
+    empty = events[events["n_mu"] == 0]
+    assert empty["event"].tolist()[:3] == [1000, 1004, 1008]
+    for c in ("mean_mu_pt", "min_mu_pt", "max_mu_pt"):
+        assert (empty[c] == 0).all() and not events[c].isna().any()
+
+
+def test_partition_by_single_input_only_and_keeps_id_width(nanoaod_file, tmp_path):
+    from src import analysis, parquet_writer
+
+    opts = parquet_writer.writer_options(partition_by="run")
+    with pytest.raises(ValueError, match="partition"):
+        dp.process_dataset([nanoaod_file, nanoaod_file], tmp_path / "dataset.parquet", mode="per_particle",
+                           writer_opts=opts)
+
+    outp = tmp_path / "by_run.parquet"
+    dp.process_file(nanoaod_file, outp, mode="per_particle", writer_opts=opts)
+    assert [str(f) for f in parquet_writer.partition_files(outp)] == ["run=1/part.parquet"]
+    assert str(analysis.partitioned_dataset(outp).schema.field("run").type) == "uint32"
+    data = analysis.read_preprocessed_particle_table(outp)
+    assert data["run"].dtype == np.uint32 and set(data["run"]) == {1}
@@ -0,0 +1,89 @@
+import awkward as ak
+import numpy as np
+import pandas as pd
+import pytest
+
+uproot = pytest.importorskip("uproot")
+pytest.importorskip("pyarrow.parquet")
+
+import src.data_preprocessing as dp
+from src import analysis, skim
+
+CONFIG = {
+    "muon_selection": {"pt_min": 10.0, "eta_abs_max": 1.5, "require_id": ["tight"], "min_n_muons": 2},
+    "event_selection": {"min_vertices": 0},
+    "triggers": {"require_any": ["HLT_IsoMu24", "HLT_Mu50"], "veto_any": []},
+}
+
+
+def _expected_mask(tree):
+    mu = tree.arrays(["Muon_pt", "Muon_eta", "Muon_tightId"])
+    good = (mu["Muon_pt"] >= 10.0) & (abs(mu["Muon_eta"]) <= 1.5) & mu["Muon_tightId"]
+    fired = tree["HLT_IsoMu24"].array(library="np") | tree["HLT_Mu50"].array(library="np")
+    return fired & (ak.to_numpy(ak.sum(good, axis=1)) >= 2)
+
+
+@pytest.mark.parametrize("suffix", [".root", ".parquet"])
+def test_skim_keeps_selected_events_and_whitelisted_branches(nanoaod_file, tmp_path, suffix):
+    tree = uproot.open(nanoaod_file)["Events"]
+    keep = _expected_mask(tree)
+    assert 0 < keep.sum() < len(keep)
+
+    outp = tmp_path / f"skim{suffix}"
+    prov = skim.skim_file(nanoaod_file, outp, CONFIG, step_size=20)
+    assert prov["n_rows"] == keep.sum() and prov["n_events"] == 60
+    assert prov["branches"] == ["run", "luminosityBlock", "event", "nMuon", "Muon_pt", "Muon_eta", "Muon_phi",
+                                "Muon_tightId"]
+    assert prov["pushdown"]["entries_decoded"] < 60  # trigger / nMuon prefilter before the muon branches
+
+    expected = analysis.read_root_particles(str(nanoaod_file))
+    got = analysis.read_preprocessed_event_table(outp) if suffix == ".parquet" else analysis.read_root_particles(str(outp))
+    for key in ("run", "luminosityBlock", "event"):
+        assert got[key].dtype == expected[key].dtype and (got[key] == expected[key][keep]).all()
+    for key in ("pt", "eta", "phi"):
+        assert got[key].tolist() == expected[key][keep].tolist()
+
+    if suffix == ".root":
+        skimmed = uproot.open(outp)["Events"]
+        assert "Electron_pt" not in skimmed.keys() and "HLT_IsoMu24" not in skimmed.keys()
+        # the skim replaces the original file in the preprocessing
+        full = dp.per_particle_table(tree)
+        table = dp.per_particle_table(skimmed)
+        pd.testing.assert_frame_equal(table, full[np.isin(full["event"], expected["event"][keep])].reset_index(drop=True))
+
+
+def test_packed_trigger_word_matches_branch_logic_and_is_persisted(nanoaod_file, monkeypatch):
+    from src import array_cache, column_cache, digest_cache, parallel_io, selection
+
+    column_cache.configure(True)
+    digest_cache.cached_sha256(nanoaod_file)  # file hash known: ranges are stored, not read through
+    tree = uproot.open(nanoaod_file)["Events"]
+    iso, mu50 = tree["HLT_IsoMu24"].array(library="np"), tree["HLT_Mu50"].array(library="np")
+    cuts = [{"name": "trigger_any", "branches": ["HLT_IsoMu24", "HLT_Mu50"]},
+            {"name": "trigger_veto", "branches": ["HLT_Mu50"]},
+            {"name": "flags", "branches": ["HLT_IsoMu24"]}]
+    layout = selection.trigger_layout(cuts)
+    bits = parallel_io.read_trigger_bits(tree, layout, 0, 60)
+    assert bits.dtype == np.uint64
+    assert (bits == iso.astype(np.uint64) | (mu50.astype(np.uint64) << np.uint64(1))).all()
+    assert (selection.event_mask({selection.TRIGGER_BITS: bits}, cuts) == (iso & ~mu50)).all()
+    assert (selection.event_mask({"HLT_IsoMu24": iso, "HLT_Mu50": mu50}, cuts) == (iso & ~mu50)).all()
+
+    # later selections: the packed column comes from disk, the HLT_* branches are not read again
+    array_cache.clear()
+
+    def no_read(*args, **kwargs):
+        raise AssertionError("trigger branches decoded again")
+
+    monkeypatch.setattr(parallel_io, "_read_range", no_read)
+    assert (parallel_io.read_trigger_bits(tree, layout, 0, 60) == bits).all()
+
+
+def test_trigger_selection_writes_nothing_with_column_cache_disabled(nanoaod_file, tmp_path, isolated_cache):
+    from src import column_cache
+
+    assert not column_cache.enabled()
+    before = column_cache.stats()
+    prov = skim.skim_file(nanoaod_file, tmp_path / "skim.root", CONFIG, step_size=20)
+    assert prov["n_rows"] == _expected_mask(uproot.open(nanoaod_file)["Events"]).sum()
+    assert not (isolated_cache / "columns").exists() and column_cache.stats() == before
@@ -0,0 +1,21 @@
+import src.storage_profile as sp
+
+
+def test_profile_per_branch_and_cached_by_hash(nanoaod_file, isolated_cache, monkeypatch):
+    profile = sp.load_profile(nanoaod_file)
+    assert profile["tree"] == "Events" and profile["num_entries"] == 60
+    assert profile["clusters"] == [0, 25, 50, 60]
+    mu_pt = profile["branches"]["Muon_pt"]
+    assert mu_pt["baskets"] == 3 and mu_pt["basket_entries"] == {"min": 10, "median": 25.0, "max": 25}
+    assert mu_pt["cluster_aligned"] and mu_pt["decode_s"] > 0
+    assert mu_pt["ratio"] == round(mu_pt["uncompressed_bytes"] / mu_pt["compressed_bytes"], 3)
+    totals = profile["totals"]
+    assert totals["compressed_bytes"] == sum(b["compressed_bytes"] for b in profile["branches"].values())
+    assert 1 <= totals["branches_for_50pct"] <= totals["branches_for_90pct"] <= totals["branches"]
+    assert list((isolated_cache / "profiles").glob(f"{profile['sha256']}.json"))
+
+    # second call: served from the cache, the file is not opened again
+    monkeypatch.setattr(sp, "build_profile", lambda *a, **k: (_ for _ in ()).throw(AssertionError("rebuilt")))
+    assert sp.load_profile(nanoaod_file)["branches"] == profile["branches"]
+    report = sp.format_report(profile, top=3, sort="decode")
+    assert "Clusters: 3" in report and f"... {totals['branches'] - 3} more branches" in report
@@ -35,3 +35,19 @@ def test_scan_sha256_and_manifest(tmp_path):
     m = manifest_results["sample.root"]
     assert m["exists"] is True
     assert m["match"] is True
+
+
+def test_digest_cache_tracks_file_changes(tmp_path):
+    from src import digest_cache
+
+    sample = tmp_path / "sample.root"
+    sample.write_bytes(b"first content")
+    assert digest_cache.lookup_sha256(sample) is None
+    assert digest_cache.cached_sha256(sample) == hashlib.sha256(b"first content").hexdigest()
+    assert digest_cache.lookup_sha256(sample) == hashlib.sha256(b"first content").hexdigest()
+    assert digest_cache.sha256_in_background(sample).done()
+
+    sample.write_bytes(b"second, longer content")
+    assert digest_cache.lookup_sha256(sample) is None
+    fut = digest_cache.sha256_in_background(sample)
+    assert fut.result(timeout=10) == hashlib.sha256(b"second, longer content").hexdigest()